@@ -0,0 +1,80 @@
+"""
+バックグラウンドジョブ
+時間のかかる計算を別スレッドで実行し、進捗の取得とキャンセルを可能にする
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background-job")
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたときに送出される例外"""
+
+
+class BackgroundJob:
+    """
+    バックグラウンドで実行される計算ジョブ
+
+    実行する関数はキーワード引数 progress_callback（0〜1の進捗を受け取る）と
+    cancel_event（threading.Event）を受け取り、キャンセル時は JobCancelled を送出すること。
+
+    Parameters:
+    -----------
+    func : callable
+        実行する関数
+    *args, **kwargs :
+        func に渡す引数
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.progress = 0.0
+        self.cancel_event = threading.Event()
+        self._future = _EXECUTOR.submit(
+            func, *args,
+            progress_callback=self._set_progress,
+            cancel_event=self.cancel_event,
+            **kwargs
+        )
+
+    def _set_progress(self, fraction):
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+
+    def cancel(self):
+        """ジョブのキャンセルを要求する"""
+        self.cancel_event.set()
+        self._future.cancel()
+
+    def done(self):
+        return self._future.done()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def error(self):
+        """ジョブが送出した例外（正常終了・実行中の場合は None）"""
+        if not self._future.done() or self._future.cancelled():
+            return None
+        return self._future.exception()
+
+    def result(self):
+        return self._future.result()
+
+
+def submit(func, *args, **kwargs):
+    """
+    関数を別スレッドで実行する（進捗・キャンセルを扱わない短い処理向け）
+
+    Parameters:
+    -----------
+    func : callable
+        実行する関数
+    *args, **kwargs :
+        func に渡す引数
+
+    Returns:
+    --------
+    concurrent.futures.Future
+    """
+    return _EXECUTOR.submit(func, *args, **kwargs)
@@ -0,0 +1,162 @@
+"""
+一括質問
+複数の質問を並列数の上限つきで Claude に送り、返ってきたコードをサンドボックスで
+実行して、回答と実行結果を1つのレポートにまとめる
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import claude_client
+import report_builder
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 8
+
+
+class BatchAnswer:
+    """
+    1つの質問に対する回答と実行結果
+
+    Attributes:
+    -----------
+    question : str
+    text : str
+        Claude の回答
+    code : str or None
+        回答に含まれていた最初の Python コード
+    execution : sandbox_executor.ExecutionResult or None
+        コードの実行結果
+    cached : bool
+        実行結果をキャッシュから取り出した場合 True
+    error : str or None
+        問い合わせ・実行の前に発生したエラー
+    seconds : float
+        問い合わせと実行にかかった時間
+    """
+
+    def __init__(self, question):
+        self.question = question
+        self.text = ""
+        self.code = None
+        self.execution = None
+        self.cached = False
+        self.error = None
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and (self.execution is None or self.execution.ok)
+
+
+def _answer(client, question, build_request, execute):
+    answer = BatchAnswer(question)
+    start = time.perf_counter()
+    try:
+        response = client.messages.create(**build_request(question))
+        answer.text = response.content[0].text
+        blocks = claude_client.CodeBlockWatcher().feed(answer.text)
+        if blocks:
+            answer.code = blocks[0]
+            answer.execution, answer.cached = execute(answer.code)
+    except Exception as e:
+        answer.error = f"{type(e).__name__}: {e}"
+    answer.seconds = time.perf_counter() - start
+    return answer
+
+
+def run_batch(client, questions, build_request, execute, concurrency=DEFAULT_CONCURRENCY):
+    """
+    質問を並列に処理し、終わったものから返す
+
+    Parameters:
+    -----------
+    client : anthropic.Anthropic, claude_client.StubClient or response_cache.CachedClient
+    questions : list of str
+        質問
+    build_request : callable
+        質問を受け取り、messages.create に渡す引数の dict を返す関数
+    execute : callable
+        コードを受け取り、(ExecutionResult, キャッシュを使ったか) を返す関数
+    concurrency : int
+        同時に処理する質問数の上限
+
+    Yields:
+    -------
+    tuple : (質問の番号, BatchAnswer)
+    """
+    concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-question") as executor:
+        futures = {
+            executor.submit(_answer, client, question, build_request, execute): i
+            for i, question in enumerate(questions)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _answer_blocks(number, answer, registry):
+    blocks = [('heading', 2, f"{number}. {answer.question}")]
+    if answer.error:
+        return blocks + [('text', f"エラー: {answer.error}")]
+    blocks.append(('text', answer.text))
+    execution = answer.execution
+    if execution is None:
+        return blocks
+    blocks.append(('heading', 3, '実行結果'))
+    if not execution.ok:
+        return blocks + [('text', f"コードの実行中にエラーが発生しました: {execution.error}")]
+    if execution.stdout:
+        blocks.append(('code', execution.stdout))
+
+    images = list(execution.figures)
+    if 'result' in execution.values:
+        result = execution.values['result']
+        if execution.kind('result') == 'png':
+            images.insert(0, result)
+        elif isinstance(result, pd.DataFrame):
+            blocks.append(('table', result))
+        elif isinstance(result, pd.Series):
+            blocks.append(('table', result.to_frame()))
+        else:
+            blocks.append(('json', result) if not isinstance(result, str) else ('code', result))
+    for k, image in enumerate(images, start=1):
+        name = f"{number}. {answer.question}（図{k}）"
+        registry.register_image(name, image)
+        blocks.append(('figure', name))
+    return blocks
+
+
+def write_batch_report(answers, title, fmt='html', path=None):
+    """
+    一括質問の回答を1つのレポートにする
+
+    Parameters:
+    -----------
+    answers : list of BatchAnswer
+        質問の順に並んだ回答
+    title : str
+        レポートのタイトル
+    fmt : str
+        'html' または 'markdown'
+    path : str or Path or None
+        出力先（None の場合は report_builder.REPORT_DIR）
+
+    Returns:
+    --------
+    dict : report_builder.write_report の戻り値
+    """
+    registry = report_builder.FigureRegistry(maxsize=max(report_builder.FIGURE_REGISTRY_SIZE, 10 * len(answers)))
+    summary = pd.DataFrame({
+        '質問': [answer.question for answer in answers],
+        '結果': ['成功' if answer.ok else '失敗' for answer in answers],
+        '時間(秒)': [round(answer.seconds, 2) for answer in answers],
+    })
+    sections = [lambda: [('heading', 2, '概要'), ('table', summary)]]
+    sections += [
+        (lambda number=number, answer=answer: _answer_blocks(number, answer, registry))
+        for number, answer in enumerate(answers, start=1)
+    ]
+    return report_builder.write_report(sections, title, fmt=fmt, registry=registry, path=path)
@@ -0,0 +1,68 @@
+"""
+キャッシュユーティリティ
+重い計算結果をプロセス内で再利用するための LRU キャッシュ
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    スレッドセーフな LRU キャッシュ
+
+    Streamlit の再実行やセッションをまたいで結果を共有するため、
+    モジュールレベルで保持して使う。
+
+    Parameters:
+    -----------
+    maxsize : int
+        保持するエントリの最大数（超えた場合は最も古いものから破棄）
+    on_evict : callable or None
+        破棄したエントリの値を受け取る関数（接続を閉じるなどの後始末に使う）
+    """
+
+    def __init__(self, maxsize=32, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            previous = self._data.get(key)
+            if previous is not None and previous is not value:
+                evicted.append(previous)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1])
+        self._evict(evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._data.values())
+            self._data.clear()
+        self._evict(evicted)
+
+    def _evict(self, values):
+        # 後始末はロックの外で行う
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
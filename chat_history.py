@@ -0,0 +1,216 @@
+"""
+チャット履歴
+分析結果の表は圧縮した Parquet、図は PNG のバイト列として保持し、メモリ予算を
+超えた古いものからディスクに退避する
+"""
+
+import io
+import shutil
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+HISTORY_DIR = Path("data/temp/history")
+
+# セッションごとにメモリ上に保持する表・図の合計サイズ（バイト）
+DEFAULT_MEMORY_BUDGET = 16 * 1024**2
+# 履歴に残す表の最大行数（全体はダウンロード・保存で扱う）
+DISPLAY_ROWS = 1000
+# 履歴で常に表示するメッセージ数（それより古いものは必要なときだけ表示する）
+VISIBLE_MESSAGES = 20
+
+
+def encode_table(df):
+    """
+    DataFrame を zstd 圧縮の Parquet のバイト列にする
+
+    列名が文字列でない、型が混在するなど Parquet にできない場合は文字列に変換する。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+
+    Returns:
+    --------
+    bytes
+    """
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, compression='zstd')
+    except Exception:
+        buffer = io.BytesIO()
+        converted = df.copy()
+        converted.columns = [str(col) for col in converted.columns]
+        converted.index = converted.index.astype(str)
+        for col in converted.select_dtypes(include=['object']).columns:
+            converted[col] = converted[col].astype(str)
+        converted.to_parquet(buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def decode_table(data):
+    """encode_table で作ったバイト列を DataFrame に戻す"""
+    return pd.read_parquet(io.BytesIO(data))
+
+
+class Payload:
+    """
+    履歴のメッセージに付いた表や図のバイト列
+
+    メモリ上にあるときは data、退避した後は path から読み込む。
+    """
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.size = len(data)
+        self.data = data
+        self.path = None
+
+    @property
+    def spilled(self):
+        return self.data is None
+
+    def read(self):
+        """バイト列を返す（退避したものはディスクから読み込むが、メモリには戻さない）"""
+        if self.data is not None:
+            return self.data
+        return self.path.read_bytes()
+
+
+class ChatHistory:
+    """
+    チャットのメッセージと分析結果の履歴
+
+    append() に渡したメッセージの analysis_result のうち、表（type='dataframe'）は
+    先頭 display_rows 行を Parquet に、図（type='plot'）は PNG のバイト列として
+    保持する。表と図の合計サイズが memory_budget を超えると、古いものから順に
+    ディスクに書き出してメモリから外す。
+
+    Parameters:
+    -----------
+    directory : str or Path
+        退避先の親ディレクトリ（履歴ごとにサブディレクトリを作る）
+    memory_budget : int
+        メモリ上に保持する表・図の合計サイズ（バイト）
+    display_rows : int
+        履歴に残す表の最大行数
+    """
+
+    def __init__(self, directory=HISTORY_DIR, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 display_rows=DISPLAY_ROWS):
+        self.directory = Path(directory) / uuid.uuid4().hex
+        self.memory_budget = memory_budget
+        self.display_rows = display_rows
+        self._messages = []
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        self._counter = 0
+        # セッションが終わって履歴が破棄されたら退避ファイルを削除する
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def __iter__(self):
+        return iter(list(self._messages))
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, message):
+        """
+        メッセージを追加する
+
+        Parameters:
+        -----------
+        message : dict
+            role と content を持つメッセージ。analysis_result の data に DataFrame、
+            image に PNG のバイト列を指定できる
+        """
+        message = dict(message)
+        result = message.get("analysis_result")
+        if result is not None:
+            message["analysis_result"] = self._compact(result)
+        with self._lock:
+            self._messages.append(message)
+            self._enforce_budget()
+
+    def _compact(self, result):
+        result = dict(result)
+        if result.get("type") == "dataframe" and isinstance(result.get("data"), pd.DataFrame):
+            df = result.pop("data")
+            result["rows"] = len(df)
+            result["payload"] = self._add_payload("table", encode_table(df.head(self.display_rows)))
+        elif result.get("type") == "plot" and isinstance(result.get("image"), bytes):
+            result["payload"] = self._add_payload("image", result.pop("image"))
+        return result
+
+    def _add_payload(self, kind, data):
+        payload = Payload(kind, data)
+        with self._lock:
+            self._counter += 1
+            self._payloads[self._counter] = payload
+        return payload
+
+    def _enforce_budget(self):
+        """予算を超えている間、古い表・図から退避する"""
+        total = self.memory_bytes
+        for number, payload in self._payloads.items():
+            if total <= self.memory_budget:
+                break
+            if payload.spilled:
+                continue
+            self.directory.mkdir(parents=True, exist_ok=True)
+            payload.path = self.directory / f"{number:06d}.{'parquet' if payload.kind == 'table' else 'png'}"
+            payload.path.write_bytes(payload.data)
+            payload.data = None
+            total -= payload.size
+
+    @property
+    def memory_bytes(self):
+        """メモリ上に保持している表・図の合計サイズ"""
+        return sum(payload.size for payload in self._payloads.values() if not payload.spilled)
+
+    def load(self, result):
+        """
+        メッセージの分析結果を表示用に読み込む
+
+        Parameters:
+        -----------
+        result : dict
+            メッセージの analysis_result
+
+        Returns:
+        --------
+        pd.DataFrame or bytes : 表は DataFrame、図は PNG のバイト列
+        """
+        payload = result["payload"]
+        data = payload.read()
+        return decode_table(data) if payload.kind == "table" else data
+
+    def clear(self):
+        """履歴と退避ファイルを削除する"""
+        with self._lock:
+            self._messages.clear()
+            self._payloads.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        """
+        保持している表・図の集計
+
+        Returns:
+        --------
+        dict : 件数、メモリ上のサイズ(MB)、退避したサイズ(MB)
+        """
+        with self._lock:
+            spilled = sum(payload.size for payload in self._payloads.values() if payload.spilled)
+            return {
+                '件数': len(self._payloads),
+                'メモリ(MB)': self.memory_bytes / 1024**2,
+                'ディスク(MB)': spilled / 1024**2,
+            }
@@ -0,0 +1,209 @@
+"""
+Claude クライアント
+セッションごとに1つのクライアントを保持して HTTP 接続を使い回し、応答を
+ストリーミングで受け取る。応答中の Python コードブロックは閉じた時点で取り出す
+"""
+
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+# この環境変数を設定すると API を呼ばずにスタブの応答を返す
+# （値に JSON ファイルのパスを指定すると、質問に含まれる語ごとの応答を読み込む）
+STUB_ENV = "CLAUDE_STUB_RESPONSES"
+# スタブがストリーミングで一度に返す文字数
+STUB_CHUNK_CHARS = 16
+
+CODE_FENCE = "```python"
+FENCE_END = "```"
+
+
+def text_response(text, cached=False):
+    """anthropic の Message と同じように content[0].text で参照できる応答"""
+    return SimpleNamespace(content=[SimpleNamespace(type='text', text=text)], cached=cached)
+
+
+def stream_text(client, **kwargs):
+    """
+    応答のテキストを届いた順に返す
+
+    Parameters:
+    -----------
+    client : anthropic.Anthropic, StubClient or response_cache.CachedClient
+    **kwargs :
+        messages.create と同じ引数（model, max_tokens, system, messages）
+
+    Yields:
+    -------
+    str : 応答のテキストの断片
+    """
+    if hasattr(client.messages, 'stream_text'):
+        yield from client.messages.stream_text(**kwargs)
+        return
+    with client.messages.stream(**kwargs) as stream:
+        yield from stream.text_stream
+
+
+class CodeBlockWatcher:
+    """
+    ストリーミング中の応答から、閉じた Python コードブロックを取り出す
+
+    feed() に断片を順に渡すと、その断片で閉じたコードブロックを返す。
+
+    Attributes:
+    -----------
+    text : str
+        これまでに受け取った応答
+    blocks : list
+        取り出したコードブロック
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.blocks = []
+        self._scan = 0
+        self._open = None
+
+    def feed(self, chunk):
+        """
+        応答の断片を追加する
+
+        Parameters:
+        -----------
+        chunk : str
+
+        Returns:
+        --------
+        list : この断片で閉じたコードブロック
+        """
+        self.text += chunk
+        closed = []
+        while True:
+            if self._open is None:
+                start = self.text.find(CODE_FENCE, self._scan)
+                if start < 0:
+                    # 開始記号が断片の境目で分かれている場合に備えて末尾を残す
+                    self._scan = max(self._scan, len(self.text) - len(CODE_FENCE))
+                    break
+                self._open = start + len(CODE_FENCE)
+                self._scan = self._open
+            end = self.text.find(FENCE_END, self._scan)
+            if end < 0:
+                self._scan = max(self._scan, len(self.text) - len(FENCE_END))
+                break
+            code = self.text[self._open:end].strip()
+            self.blocks.append(code)
+            closed.append(code)
+            self._open = None
+            self._scan = end + len(FENCE_END)
+        return closed
+
+
+class _StubMessages:
+    def __init__(self, stub):
+        self._stub = stub
+
+    def reply_text(self, **kwargs):
+        """最後のメッセージに含まれる語に対応する応答"""
+        self._stub.calls.append(kwargs)
+        question = kwargs['messages'][-1]['content']
+        for keyword, text in self._stub.responses.items():
+            if keyword in question:
+                return text
+        return self._stub.default_response
+
+    def create(self, **kwargs):
+        return text_response(self.reply_text(**kwargs))
+
+    def stream_text(self, **kwargs):
+        text = self.reply_text(**kwargs)
+        for start in range(0, len(text), STUB_CHUNK_CHARS):
+            yield text[start:start + STUB_CHUNK_CHARS]
+
+
+class StubClient:
+    """
+    API を呼ばずに決まった応答を返すクライアント（オフラインでの動作確認用）
+
+    Parameters:
+    -----------
+    responses : dict or None
+        質問に含まれる語と、そのときに返す応答
+    default_response : str
+        どの語にも一致しないときの応答
+    """
+
+    def __init__(self, responses=None, default_response="（スタブの応答）\n\n```python\nresult = df.head()\n```"):
+        self.responses = dict(responses or {})
+        self.default_response = default_response
+        self.calls = []
+        self.messages = _StubMessages(self)
+
+    def close(self):
+        pass
+
+
+def stub_enabled():
+    """環境変数 CLAUDE_STUB_RESPONSES でスタブが有効になっているか"""
+    return STUB_ENV in os.environ
+
+
+def load_stub_responses(path):
+    """質問に含まれる語と応答の JSON ファイルを読み込む（パスが空・存在しない場合は空の dict）"""
+    if not path or not Path(path).exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def create_client(api_key, base_url=None):
+    """
+    Claude クライアントを作る（スタブが有効な場合は StubClient）
+
+    Parameters:
+    -----------
+    api_key : str
+        Anthropic の API キー
+    base_url : str or None
+        API の URL（None の場合は環境変数 ANTHROPIC_BASE_URL または既定の URL）
+
+    Returns:
+    --------
+    anthropic.Anthropic or StubClient
+    """
+    if stub_enabled():
+        return StubClient(load_stub_responses(os.environ[STUB_ENV]))
+    import anthropic
+    return anthropic.Anthropic(api_key=api_key, base_url=base_url)
+
+
+def session_client(session_state, api_key, slot='claude_client'):
+    """
+    セッションで使い回すクライアントを返す
+
+    API キー・URL・スタブの設定が変わったときだけ作り直し、前のクライアントの
+    接続を閉じる。同じクライアントを使う間は HTTP 接続が再利用される。
+
+    Parameters:
+    -----------
+    session_state : MutableMapping
+        セッションの状態（st.session_state など）
+    api_key : str
+        Anthropic の API キー
+    slot : str
+        クライアントを保持するキー
+
+    Returns:
+    --------
+    anthropic.Anthropic or StubClient
+    """
+    signature = (api_key, os.getenv('ANTHROPIC_BASE_URL'), os.getenv(STUB_ENV))
+    current = session_state.get(slot)
+    if current is not None and current[0] == signature:
+        return current[1]
+    if current is not None:
+        current[1].close()
+    client = create_client(api_key)
+    session_state[slot] = (signature, client)
+    return client
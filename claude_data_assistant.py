@@ -1,13 +1,25 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import anthropic
 import os
+import time
 from dotenv import load_dotenv
 import json
 import io
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+import background_jobs
+import batch_questions
+import chat_history
+import code_profiler
+import claude_client
+import dataset_store
+import prompt_summary
+import response_cache
+import sandbox_executor
+
+# 共有データセットの列を書き換えたとき、その列だけを複製する
+# （streamlit run で起動したときだけ設定し、import されただけでは pandas の設定を変えない）
+if __name__ == '__main__':
+    pd.set_option('mode.copy_on_write', True)
 
 # 環境変数の読み込み
 load_dotenv()
@@ -22,6 +34,45 @@ DATA_DIR = "data"
 RAW_DIR = os.path.join(DATA_DIR, "raw")
 PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
 
+# サンプル質問（サイドバーのボタンと一括実行で使う）
+sample_questions = [
+    "データの基本的な統計情報を教えて",
+    "欠損値の状況を詳しく分析して",
+    "各列の分布を可視化して",
+    "相関行列を作成して高い相関を持つ列を教えて",
+    "外れ値を検出して可視化して",
+    "カテゴリカル変数の頻度を分析して",
+    "時系列データとして扱える列があるか確認して",
+    "データクレンジングの提案をして",
+    "ネットワーク分析用にデータを変換する方法を教えて"
+]
+
+
+def ask_sample(question):
+    # 次の実行でチャット入力と同じように質問する
+    st.session_state.pending_question = question
+
+
+def show_profile(profile):
+    """生成コードのプロファイル（経過時間、メモリのピーク、時間のかかった行と関数）を表示する"""
+    title = f"⏱ プロファイル（{profile['elapsed']:.2f}秒"
+    if profile['peak_memory'] is not None:
+        title += f"・メモリのピーク +{profile['peak_memory'] / 1024**2:.1f} MB"
+    title += "）"
+    with st.expander(title, expanded=code_profiler.needs_feedback(profile)):
+        if profile['lines']:
+            st.markdown("**時間のかかった行**")
+            lines = pd.DataFrame(profile['lines'])[['line', 'share', 'seconds', 'source']]
+            lines.columns = ['行', '割合', '時間(秒)', 'コード']
+            st.dataframe(lines, hide_index=True)
+        if profile['functions']:
+            st.markdown("**時間のかかった関数**")
+            functions = pd.DataFrame(profile['functions'])[['function', 'share', 'self_seconds', 'total_seconds']]
+            functions.columns = ['関数', '割合', '自己時間(秒)', '累計時間(秒)']
+            st.dataframe(functions, hide_index=True)
+        for hint in profile['hints']:
+            st.warning(f"{hint['line']}行目: {hint['hint']}")
+
 # APIキーの設定
 if 'api_key' not in st.session_state:
     st.session_state.api_key = os.getenv('ANTHROPIC_API_KEY', '')
@@ -36,6 +87,24 @@ with st.sidebar:
     )
     if api_key:
         st.session_state.api_key = api_key
+    summary_budget = st.slider(
+        "データ要約のトークン上限",
+        min_value=300, max_value=8000, value=prompt_summary.DEFAULT_TOKEN_BUDGET, step=100,
+        help="質問ごとにClaudeへ送るデータ要約の推定トークン数の上限"
+    )
+    use_cache = st.checkbox(
+        "応答と実行結果をキャッシュする", value=True,
+        help="同じデータへの同じ質問には、保存した応答と実行結果を返します"
+    )
+    profile_code = st.checkbox(
+        "生成コードをプロファイルする", value=False,
+        help="経過時間・メモリのピーク・時間のかかった行と関数を計測し、遅い場合は次の質問に添えます"
+    )
+    if st.button("キャッシュを削除"):
+        response_cache.get_cache().clear()
+    cache_stats = response_cache.get_cache().stats()
+    st.caption(f"キャッシュ: 応答 {cache_stats['応答数']}件 / 実行結果 {cache_stats['実行結果数']}件"
+               f"（{cache_stats['サイズ(MB)']:.1f} MB）")
 
 # データファイルの選択
 st.sidebar.header("データファイル")
@@ -47,24 +116,14 @@ try:
         selected_file = st.sidebar.selectbox("分析するファイルを選択", data_files)
         file_path = os.path.join(RAW_DIR, selected_file)
         
-        # データの読み込み
-        @st.cache_data
+        # データの読み込み（同じファイルを開いたセッション間で1つのデータを共有）
         def load_data(path):
             try:
-                if path.endswith('.csv'):
-                    encodings = ['utf-8', 'shift-jis', 'cp932', 'latin-1']
-                    for encoding in encodings:
-                        try:
-                            return pd.read_csv(path, encoding=encoding)
-                        except:
-                            continue
-                elif path.endswith(('.xlsx', '.xls')):
-                    return pd.read_excel(path)
-                elif path.endswith('.json'):
-                    return pd.read_json(path)
+                handle = dataset_store.get_store().open_file(path)
             except Exception as e:
                 st.error(f"ファイル読み込みエラー: {e}")
                 return None
+            return dataset_store.attach_to_session(st.session_state, handle)
         
         df = load_data(file_path)
         
@@ -79,7 +138,7 @@ except:
     df = None
 
 # メインコンテンツ
-if not st.session_state.api_key:
+if not st.session_state.api_key and not claude_client.stub_enabled():
     st.warning("⚠️ APIキーを設定してください。")
     st.stop()
 
@@ -103,12 +162,92 @@ if df is None:
         st.success(f"✅ {uploaded_file.name} を保存しました。ページを更新してください。")
         st.rerun()
 else:
-    # Claudeクライアントの初期化
-    client = anthropic.Anthropic(api_key=st.session_state.api_key)
+    # Claudeクライアント（セッション内で使い回し、HTTP 接続を再利用する）
+    client = claude_client.session_client(st.session_state, st.session_state.api_key)
+    handle = st.session_state['dataset_handle']
+    if use_cache:
+        # 同じモデル・プロンプト・データ・質問には保存した応答を返す
+        client = response_cache.CachedClient(client, response_cache.get_cache(), fingerprint=handle.key)
+    
+    def execute_code(code):
+        """生成コードをワーカープロセスで実行する（2つ目の戻り値はキャッシュを使った場合 True）"""
+        key = response_cache.execution_key(code, handle.key, profile=profile_code)
+        if use_cache:
+            execution = response_cache.get_cache().get_execution(key)
+            if execution is not None:
+                return execution, True
+        # データはワーカーと Arrow ファイルで共有する
+        execution = sandbox_executor.get_executor().run(
+            code, df=df, arrow_path=dataset_store.get_store().arrow_path(handle.key), profile=profile_code
+        )
+        if use_cache:
+            response_cache.get_cache().set_execution(key, execution)
+        return execution, False
+    
+    def summarize(question):
+        """データの要約（データセットごとにキャッシュ）から質問に関係する部分を取り出す"""
+        summary = prompt_summary.get_summary(df, fingerprint=handle.key, name=selected_file)
+        return prompt_summary.render_summary(summary, question, summary_budget)
+    
+    def build_request(question, summary_text=None, feedback=None):
+        """質問を messages.create / stream_text の引数にする（feedback は前回のコードのプロファイル）"""
+        if summary_text is None:
+            summary_text = summarize(question)[0]
+        
+        # システムプロンプト
+        system_prompt = f"""
+あなたはデータ分析の専門家です。以下のデータについて質問に答えてください。
+
+データ情報:
+- ファイル名: {selected_file}
+- サイズ: {df.shape[0]} 行 × {df.shape[1]} 列
+- 列名: {', '.join(map(str, df.columns[:10]))}{'...' if len(df.columns) > 10 else ''}
+- データ型: {json.dumps({str(k): str(v) for k, v in list(df.dtypes.items())[:5]}, ensure_ascii=False)}
+
+回答する際は：
+1. まず質問に対する説明を日本語で行う
+2. 必要に応じて、実行可能なPythonコードを生成する
+3. コードは以下の形式で記述する：
+
+```python
+# 必要なインポート
+import pandas as pd
+import numpy as np
+
+# データ処理のコード
+# df という変数名でDataFrameが利用可能です
+
+# 結果を result 変数に格納
+result = ...  # DataFrame、図、または処理済みデータ
+```
+
+4. 前処理の提案をする場合は、具体的な手順とコードを提供する
+5. 可視化を行う場合は、matplotlib/seabornを使用する
+
+重要：
+- dfという変数でデータフレームにアクセスできます
+- 結果は必ずresult変数に格納してください
+- エラーが出ないよう、実行可能なコードを生成してください
+"""
+        
+        return dict(
+            model="claude-3-sonnet-20241022",
+            max_tokens=3000,
+            system=system_prompt,
+            messages=[
+                {
+                    "role": "user", 
+                    "content": f"データの要約:\n{summary_text}\n\n"
+                               + (f"{feedback}\n\n" if feedback else "")
+                               + f"質問: {question}"
+                }
+            ]
+        )
     
     # チャット履歴の初期化
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
+        # 表は圧縮した Parquet、図は PNG で保持し、古いものはディスクに退避する
+        st.session_state.messages = chat_history.ChatHistory()
         st.session_state.analysis_results = []
     
     # データのプレビュー
@@ -126,8 +265,56 @@ else:
         with col4:
             st.metric("データ型の種類", f"{df.dtypes.nunique()}")
     
-    # チャット履歴の表示
-    for message in st.session_state.messages:
+    # サンプル質問の一括実行（問い合わせとコードの実行を並列に行い、1つのレポートにまとめる）
+    with st.expander("📋 サンプル質問をまとめて実行"):
+        batch_selected = st.multiselect("実行する質問", sample_questions, default=sample_questions)
+        col1, col2 = st.columns(2)
+        with col1:
+            batch_concurrency = st.slider(
+                "同時に処理する質問数", min_value=1, max_value=batch_questions.MAX_CONCURRENCY,
+                value=batch_questions.DEFAULT_CONCURRENCY
+            )
+        with col2:
+            batch_format = st.radio("レポートの形式", ['html', 'markdown'], horizontal=True)
+        
+        if st.button("一括実行", disabled=not batch_selected):
+            progress = st.progress(0.0, text="質問を送信中...")
+            answers = [None] * len(batch_selected)
+            start = time.perf_counter()
+            for done, (i, answer) in enumerate(
+                batch_questions.run_batch(client, batch_selected, build_request, execute_code, batch_concurrency),
+                start=1
+            ):
+                answers[i] = answer
+                progress.progress(done / len(batch_selected), text=f"{done}/{len(batch_selected)} 件完了")
+            report = batch_questions.write_batch_report(
+                answers, f"{selected_file} の一括分析", fmt=batch_format
+            )
+            st.session_state['batch_report'] = {
+                'path': report['path'],
+                'seconds': time.perf_counter() - start,
+                'results': [(answer.question, answer.ok, answer.seconds) for answer in answers],
+            }
+        
+        if 'batch_report' in st.session_state:
+            batch_report = st.session_state['batch_report']
+            succeeded = sum(ok for _, ok, _ in batch_report['results'])
+            st.caption(f"{len(batch_report['results'])}件中{succeeded}件成功（{batch_report['seconds']:.1f}秒）")
+            st.dataframe(pd.DataFrame(batch_report['results'], columns=['質問', '成功', '時間(秒)']))
+            with open(batch_report['path'], 'rb') as f:
+                st.download_button(
+                    "レポートをダウンロード", f.read(),
+                    file_name=os.path.basename(batch_report['path'])
+                )
+    
+    # チャット履歴の表示（古いメッセージは必要なときだけ表示）
+    history = st.session_state.messages
+    hidden = max(len(history) - chat_history.VISIBLE_MESSAGES, 0)
+    if hidden and not st.checkbox(f"古い履歴を表示（{hidden}件）", value=False):
+        visible = history[hidden:]
+    else:
+        visible = list(history)
+    for message in visible:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             
@@ -135,14 +322,18 @@ else:
             if message.get("analysis_result"):
                 result = message["analysis_result"]
                 if result["type"] == "dataframe":
-                    st.dataframe(pd.DataFrame(result["data"]))
+                    table = history.load(result)
+                    st.dataframe(table)
+                    if result["rows"] > len(table):
+                        st.caption(f"先頭{len(table):,}行を表示（全{result['rows']:,}行）")
                 elif result["type"] == "plot":
-                    st.pyplot(result["figure"])
+                    st.image(history.load(result))
                 elif result["type"] == "code":
                     st.code(result["code"], language="python")
     
     # ユーザー入力
-    if prompt := st.chat_input("データについて質問してください（例：「欠損値の状況を教えて」「外れ値を検出して」）"):
+    prompt = st.chat_input("データについて質問してください（例：「欠損値の状況を教えて」「外れ値を検出して」）")
+    if prompt := prompt or st.session_state.pop('pending_question', None):
         # ユーザーメッセージの追加
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
@@ -150,194 +341,138 @@ else:
         
         # Claudeへのリクエスト
         with st.chat_message("assistant"):
-            with st.spinner("分析中..."):
-                try:
-                    # データの要約情報を準備
-                    data_info = {
-                        "shape": df.shape,
-                        "columns": df.columns.tolist(),
-                        "dtypes": df.dtypes.to_dict(),
-                        "missing_values": df.isnull().sum().to_dict(),
-                        "numeric_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
-                        "categorical_columns": df.select_dtypes(include=['object']).columns.tolist(),
-                        "head": df.head().to_dict(),
-                        "describe": df.describe().to_dict() if len(df.select_dtypes(include=[np.number]).columns) > 0 else {}
-                    }
-                    
-                    # システムプロンプト
-                    system_prompt = f"""
-あなたはデータ分析の専門家です。以下のデータについて質問に答えてください。
-
-データ情報:
-- ファイル名: {selected_file}
-- サイズ: {data_info['shape'][0]} 行 × {data_info['shape'][1]} 列
-- 列名: {', '.join(data_info['columns'][:10])}{'...' if len(data_info['columns']) > 10 else ''}
-- データ型: {json.dumps({k: str(v) for k, v in list(data_info['dtypes'].items())[:5]}, ensure_ascii=False)}
-
-回答する際は：
-1. まず質問に対する説明を日本語で行う
-2. 必要に応じて、実行可能なPythonコードを生成する
-3. コードは以下の形式で記述する：
-
-```python
-# 必要なインポート
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# データ処理のコード
-# df という変数名でDataFrameが利用可能です
-
-# 結果を result 変数に格納
-result = ...  # DataFrame、図、または処理済みデータ
-```
-
-4. 前処理の提案をする場合は、具体的な手順とコードを提供する
-5. 可視化を行う場合は、matplotlib/seabornを使用する
-
-重要：
-- dfという変数でデータフレームにアクセスできます
-- 結果は必ずresult変数に格納してください
-- エラーが出ないよう、実行可能なコードを生成してください
-"""
-                    
-                    # Claudeに質問
-                    response = client.messages.create(
-                        model="claude-3-sonnet-20241022",
-                        max_tokens=3000,
-                        system=system_prompt,
-                        messages=[
-                            {
-                                "role": "user", 
-                                "content": f"データの詳細情報:\n{json.dumps(data_info, ensure_ascii=False, indent=2)}\n\n質問: {prompt}"
-                            }
-                        ]
-                    )
-                    
-                    # レスポンスの取得
-                    claude_response = response.content[0].text
-                    st.markdown(claude_response)
+            try:
+                summary_text, summary_sections, summary_tokens = summarize(prompt)
+                st.caption(
+                    f"送信したデータ要約: 約{summary_tokens:,}トークン（"
+                    + "、".join(prompt_summary.SECTION_TITLES[name].split('（')[0] for name in summary_sections)
+                    + "）"
+                )
+                # 前回のコードが遅かった場合は、そのプロファイルを質問に添える
+                feedback = st.session_state.pop('profile_feedback', None)
+                if feedback:
+                    st.caption("前回実行したコードのプロファイルを質問に添えました")
+                
+                
+                # Claudeに質問（応答はストリーミングで表示する）
+                watcher = claude_client.CodeBlockWatcher()
+                pending = {}
+                
+                def stream_response():
+                    for chunk in claude_client.stream_text(client, **build_request(prompt, summary_text, feedback)):
+                        # 最初のコードブロックが閉じた時点で、説明の続きを待たずに実行を始める
+                        for code in watcher.feed(chunk):
+                            if 'execution' not in pending:
+                                pending['execution'] = background_jobs.submit(execute_code, code)
+                        yield chunk
+                
+                claude_response = st.write_stream(stream_response())
+                if getattr(client.messages, 'last_cached', False):
+                    st.caption("キャッシュした応答を表示しています")
+                
+                # コードの実行結果
+                if 'execution' in pending:
+                    code = watcher.blocks[0]
                     
-                    # コードブロックの抽出と実行
-                    if "```python" in claude_response:
-                        # コードの抽出
-                        code_start = claude_response.find("```python") + 9
-                        code_end = claude_response.find("```", code_start)
-                        code = claude_response[code_start:code_end].strip()
+                    try:
+                        with st.spinner("コードを実行中..."):
+                            execution, execution_cached = pending['execution'].result()
+                        if execution_cached:
+                            st.caption("キャッシュした実行結果を表示しています")
+                        if execution.stdout:
+                            st.text(execution.stdout)
+                        if execution.profile:
+                            show_profile(execution.profile)
+                            if code_profiler.needs_feedback(execution.profile):
+                                st.session_state['profile_feedback'] = code_profiler.feedback_prompt(
+                                    code, execution.profile
+                                )
+                                st.button("⚡ このコードを高速化する", on_click=ask_sample,
+                                          args=("前回のコードをより高速な書き方に書き換えて",))
+                        if not execution.ok:
+                            raise RuntimeError(execution.error)
+                        st.caption(f"実行時間: {execution.elapsed:.2f}秒（CPU {execution.cpu_time:.2f}秒）")
                         
-                        try:
-                            # コードの実行
-                            exec_globals = {
-                                'pd': pd,
-                                'np': np,
-                                'plt': plt,
-                                'sns': sns,
-                                'df': df.copy()  # データフレームのコピーを提供
-                            }
-                            
-                            # matplotlib の設定
-                            plt.rcParams['font.sans-serif'] = ['DejaVu Sans']
-                            plt.rcParams['axes.unicode_minus'] = False
+                        # 結果の処理
+                        if 'result' in execution.values:
+                            result = execution.values['result']
                             
-                            exec(code, exec_globals)
-                            
-                            # 結果の処理
-                            if 'result' in exec_globals:
-                                result = exec_globals['result']
+                            if isinstance(result, pd.DataFrame):
+                                st.subheader("処理結果")
+                                st.dataframe(result)
+                                
+                                # データフレームを保存可能にする
+                                csv = result.to_csv(index=False, encoding='utf-8-sig')
+                                st.download_button(
+                                    label="CSVダウンロード",
+                                    data=csv,
+                                    file_name=f"processed_{selected_file}",
+                                    mime="text/csv"
+                                )
                                 
-                                if isinstance(result, pd.DataFrame):
-                                    st.subheader("処理結果")
-                                    st.dataframe(result)
-                                    
-                                    # データフレームを保存可能にする
-                                    csv = result.to_csv(index=False, encoding='utf-8-sig')
-                                    st.download_button(
-                                        label="CSVダウンロード",
-                                        data=csv,
-                                        file_name=f"processed_{selected_file}",
-                                        mime="text/csv"
-                                    )
-                                    
-                                    # セッションに保存
-                                    st.session_state['last_result'] = result
-                                    
-                                    # メッセージに保存
-                                    st.session_state.messages.append({
-                                        "role": "assistant",
-                                        "content": claude_response,
-                                        "analysis_result": {
-                                            "type": "dataframe",
-                                            "data": result.to_dict()
-                                        }
-                                    })
+                                # セッションに保存
+                                st.session_state['last_result'] = result
                                 
-                                elif isinstance(result, plt.Figure):
-                                    st.pyplot(result)
-                                    plt.close()
-                                    
-                                    st.session_state.messages.append({
-                                        "role": "assistant",
-                                        "content": claude_response,
-                                        "analysis_result": {
-                                            "type": "plot",
-                                            "figure": result
-                                        }
-                                    })
+                                # メッセージに保存
+                                st.session_state.messages.append({
+                                    "role": "assistant",
+                                    "content": claude_response,
+                                    "analysis_result": {
+                                        "type": "dataframe",
+                                        "data": result
+                                    }
+                                })
+                            
+                            elif execution.kind('result') == 'png':
+                                st.image(result)
                                 
-                                else:
-                                    st.write("実行結果:", result)
-                                    st.session_state.messages.append({
-                                        "role": "assistant",
-                                        "content": claude_response
-                                    })
+                                st.session_state.messages.append({
+                                    "role": "assistant",
+                                    "content": claude_response,
+                                    "analysis_result": {
+                                        "type": "plot",
+                                        "image": result
+                                    }
+                                })
                             
-                            # 現在の図があれば表示
-                            if plt.get_fignums():
-                                st.pyplot(plt.gcf())
-                                plt.close('all')
+                            else:
+                                st.write("実行結果:", result)
+                                st.session_state.messages.append({
+                                    "role": "assistant",
+                                    "content": claude_response
+                                })
                         
-                        except Exception as e:
-                            st.error(f"コードの実行中にエラーが発生しました: {str(e)}")
-                            st.code(code, language="python")
-                            st.session_state.messages.append({
-                                "role": "assistant",
-                                "content": claude_response,
-                                "analysis_result": {
-                                    "type": "code",
-                                    "code": code
-                                }
-                            })
-                    else:
-                        # コードブロックがない場合
+                        # 実行後に開いていた図があれば表示
+                        for image in execution.figures:
+                            st.image(image)
+                    
+                    except Exception as e:
+                        st.error(f"コードの実行中にエラーが発生しました: {str(e)}")
+                        st.code(code, language="python")
                         st.session_state.messages.append({
                             "role": "assistant",
-                            "content": claude_response
+                            "content": claude_response,
+                            "analysis_result": {
+                                "type": "code",
+                                "code": code
+                            }
                         })
-                
-                except Exception as e:
-                    st.error(f"エラーが発生しました: {str(e)}")
+                else:
+                    # コードブロックがない場合
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": claude_response
+                    })
+            
+            except Exception as e:
+                st.error(f"エラーが発生しました: {str(e)}")
 
 # サンプル質問
 with st.sidebar:
     st.header("💡 サンプル質問")
     
-    sample_questions = [
-        "データの基本的な統計情報を教えて",
-        "欠損値の状況を詳しく分析して",
-        "各列の分布を可視化して",
-        "相関行列を作成して高い相関を持つ列を教えて",
-        "外れ値を検出して可視化して",
-        "カテゴリカル変数の頻度を分析して",
-        "時系列データとして扱える列があるか確認して",
-        "データクレンジングの提案をして",
-        "ネットワーク分析用にデータを変換する方法を教えて"
-    ]
-    
     for q in sample_questions:
-        if st.button(q, key=f"sample_{q}"):
-            st.session_state.messages.append({"role": "user", "content": q})
-            st.rerun()
+        st.button(q, key=f"sample_{q}", on_click=ask_sample, args=(q,))
 
 # 処理済みデータの保存
 if st.sidebar.button("💾 最後の結果を保存"):
@@ -1,11 +1,16 @@
 import streamlit as st
-import anthropic
 import os
 from dotenv import load_dotenv
 import networkx as nx
 import matplotlib.pyplot as plt
 import json
 
+import background_jobs
+import claude_client
+import graph_layout
+import response_cache
+import sandbox_executor
+
 # 環境変数の読み込み
 load_dotenv()
 
@@ -28,9 +33,13 @@ with st.sidebar:
     )
     if api_key:
         st.session_state.api_key = api_key
+    use_cache = st.checkbox(
+        "応答と実行結果をキャッシュする", value=True,
+        help="同じ質問には、保存した応答と実行結果を返します"
+    )
 
 # メインコンテンツ
-if not st.session_state.api_key:
+if not st.session_state.api_key and not claude_client.stub_enabled():
     st.warning("⚠️ APIキーを設定してください。")
     st.info("""
     ### APIキーの取得方法：
@@ -40,8 +49,20 @@ if not st.session_state.api_key:
     4. 左のサイドバーにキーを貼り付け
     """)
 else:
-    # Claudeクライアントの初期化
-    client = anthropic.Anthropic(api_key=st.session_state.api_key)
+    # Claudeクライアント（セッション内で使い回し、HTTP 接続を再利用する）
+    client = claude_client.session_client(st.session_state, st.session_state.api_key)
+    if use_cache:
+        client = response_cache.CachedClient(client, response_cache.get_cache())
+    
+    def execute_code(code):
+        """生成コードをワーカープロセスで実行する"""
+        key = response_cache.execution_key(code, names=('graph_json',))
+        execution = response_cache.get_cache().get_execution(key) if use_cache else None
+        if execution is None:
+            execution = sandbox_executor.get_executor().run(code, names=('graph_json',))
+            if use_cache:
+                response_cache.get_cache().set_execution(key, execution)
+        return execution
     
     # チャット履歴の初期化
     if 'messages' not in st.session_state:
@@ -53,16 +74,17 @@ else:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             if message.get("graph_data"):
-                # グラフの再描画
+                # グラフの再描画（レイアウトはキャッシュから取得）
                 G = nx.node_link_graph(message["graph_data"])
                 fig, ax = plt.subplots(figsize=(8, 6))
-                pos = nx.spring_layout(G)
+                pos = graph_layout.compute_layout(G, 'spring')
                 nx.draw(G, pos, with_labels=True, node_color='lightblue', 
                        node_size=1000, font_size=10, ax=ax)
                 st.pyplot(fig)
     
     # ユーザー入力
-    if prompt := st.chat_input("ネットワーク分析について質問してください（例：「5つのノードを持つランダムグラフを作成して」）"):
+    prompt = st.chat_input("ネットワーク分析について質問してください（例：「5つのノードを持つランダムグラフを作成して」）")
+    if prompt := prompt or st.session_state.pop('pending_question', None):
         # ユーザーメッセージの追加
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
@@ -70,10 +92,9 @@ else:
         
         # Claudeへのリクエスト
         with st.chat_message("assistant"):
-            with st.spinner("考えています..."):
-                try:
-                    # システムプロンプト
-                    system_prompt = """
+            try:
+                # システムプロンプト
+                system_prompt = """
 あなたはネットワーク分析の専門家です。ユーザーの質問に対して、NetworkXを使ったPythonコードを生成し、実行可能な形で提供します。
 
 回答する際は以下の形式に従ってください：
@@ -95,85 +116,89 @@ graph_json = nx.node_link_data(G)
 
 重要：生成するコードは実際に実行可能で、エラーが出ないようにしてください。
 """
-                    
-                    # Claudeに質問
-                    response = client.messages.create(
+                
+                # Claudeに質問（応答はストリーミングで表示する）
+                watcher = claude_client.CodeBlockWatcher()
+                pending = {}
+                
+                def stream_response():
+                    for chunk in claude_client.stream_text(
+                        client,
                         model="claude-3-sonnet-20241022",
                         max_tokens=2000,
                         system=system_prompt,
                         messages=[
                             {"role": "user", "content": prompt}
                         ]
-                    )
-                    
-                    # レスポンスの取得
-                    claude_response = response.content[0].text
-                    st.markdown(claude_response)
-                    
-                    # コードブロックの抽出と実行
-                    if "```python" in claude_response:
-                        # コードの抽出
-                        code_start = claude_response.find("```python") + 9
-                        code_end = claude_response.find("```", code_start)
-                        code = claude_response[code_start:code_end].strip()
+                    ):
+                        # 最初のコードブロックが閉じた時点で、説明の続きを待たずに実行を始める
+                        for code in watcher.feed(chunk):
+                            if 'execution' not in pending:
+                                pending['execution'] = background_jobs.submit(execute_code, code)
+                        yield chunk
+                
+                claude_response = st.write_stream(stream_response())
+                
+                # コードの実行結果
+                if 'execution' in pending:
+                    try:
+                        with st.spinner("コードを実行中..."):
+                            execution = pending['execution'].result()
+                        if not execution.ok:
+                            raise RuntimeError(execution.error)
                         
-                        try:
-                            # コードの実行
-                            exec_globals = {}
-                            exec(code, exec_globals)
+                        # グラフデータの取得
+                        if 'graph_json' in execution.values:
+                            graph_data = execution.values['graph_json']
                             
-                            # グラフデータの取得
-                            if 'graph_json' in exec_globals:
-                                graph_data = exec_globals['graph_json']
-                                
-                                # グラフの可視化
-                                G = nx.node_link_graph(graph_data)
-                                fig, ax = plt.subplots(figsize=(8, 6))
-                                pos = nx.spring_layout(G)
-                                nx.draw(G, pos, with_labels=True, 
-                                       node_color='lightblue', node_size=1000, 
-                                       font_size=10, ax=ax)
-                                st.pyplot(fig)
-                                
-                                # グラフの統計情報
-                                with st.expander("グラフの詳細情報"):
-                                    col1, col2 = st.columns(2)
-                                    with col1:
-                                        st.metric("ノード数", G.number_of_nodes())
-                                        st.metric("エッジ数", G.number_of_edges())
-                                    with col2:
-                                        st.metric("密度", f"{nx.density(G):.3f}")
-                                        if G.number_of_nodes() > 0:
-                                            st.metric("平均次数", 
-                                                    f"{2*G.number_of_edges()/G.number_of_nodes():.2f}")
-                                
-                                # メッセージに保存
-                                st.session_state.messages.append({
-                                    "role": "assistant",
-                                    "content": claude_response,
-                                    "graph_data": graph_data
-                                })
-                            else:
-                                st.session_state.messages.append({
-                                    "role": "assistant",
-                                    "content": claude_response
-                                })
-                        
-                        except Exception as e:
-                            st.error(f"コードの実行中にエラーが発生しました: {str(e)}")
+                            # グラフの可視化
+                            G = nx.node_link_graph(graph_data)
+                            fig, ax = plt.subplots(figsize=(8, 6))
+                            pos = graph_layout.compute_layout(G, 'spring')
+                            nx.draw(G, pos, with_labels=True, 
+                                   node_color='lightblue', node_size=1000, 
+                                   font_size=10, ax=ax)
+                            st.pyplot(fig)
+                            
+                            # グラフの統計情報
+                            with st.expander("グラフの詳細情報"):
+                                col1, col2 = st.columns(2)
+                                with col1:
+                                    st.metric("ノード数", G.number_of_nodes())
+                                    st.metric("エッジ数", G.number_of_edges())
+                                with col2:
+                                    st.metric("密度", f"{nx.density(G):.3f}")
+                                    if G.number_of_nodes() > 0:
+                                        st.metric("平均次数", 
+                                                f"{2*G.number_of_edges()/G.number_of_nodes():.2f}")
+                            
+                            # メッセージに保存
+                            st.session_state.messages.append({
+                                "role": "assistant",
+                                "content": claude_response,
+                                "graph_data": graph_data
+                            })
+                        else:
                             st.session_state.messages.append({
                                 "role": "assistant",
                                 "content": claude_response
                             })
-                    else:
-                        # コードブロックがない場合
+                    
+                    except Exception as e:
+                        st.error(f"コードの実行中にエラーが発生しました: {str(e)}")
                         st.session_state.messages.append({
                             "role": "assistant",
                             "content": claude_response
                         })
-                
-                except Exception as e:
-                    st.error(f"エラーが発生しました: {str(e)}")
+                else:
+                    # コードブロックがない場合
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": claude_response
+                    })
+            
+            except Exception as e:
+                st.error(f"エラーが発生しました: {str(e)}")
 
 # サンプル質問
 with st.sidebar:
@@ -186,7 +211,9 @@ with st.sidebar:
         "有向グラフでPageRankを計算する例を見せて"
     ]
     
+    def ask_sample(question):
+        # 次の実行でチャット入力と同じように質問する
+        st.session_state.pending_question = question
+    
     for q in sample_questions:
-        if st.button(q, key=f"sample_{q}"):
-            st.session_state.messages.append({"role": "user", "content": q})
-            st.rerun()
\ No newline at end of file
+        st.button(q, key=f"sample_{q}", on_click=ask_sample, args=(q,))
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""
+コードのプロファイル
+生成コードの経過時間・メモリのピーク・時間のかかった行と関数を計測し、
+遅くなりやすい書き方（iterrows、axis=1 の apply など）をコードから見つける
+"""
+
+import ast
+import sys
+import threading
+import time
+from collections import Counter
+
+# プロセスのメモリ使用量の計測（オプション）
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# 生成コードのファイル名（compile に渡す名前）
+CODE_FILENAME = '<generated>'
+# 報告する関数・行の数
+TOP_FUNCTIONS = 8
+TOP_LINES = 5
+# 実行中の行を調べる間隔（秒）
+SAMPLE_INTERVAL = 0.005
+# これより時間がかかった場合は、次の質問にプロファイルを添える（秒）
+SLOW_SECONDS = 1.0
+# Profiler.result の形式（変えたときは上げて、キャッシュした古い形式の結果を使わないようにする）
+PROFILE_VERSION = 2
+
+_LOOP_NODES = (ast.For, ast.AsyncFor, ast.While, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+HINTS = {
+    'iterrows': "iterrows / itertuples は1行ごとに Python のオブジェクトを作るため遅い。列単位の演算や groupby に置き換える",
+    'apply_axis1': "axis=1 の apply は行ごとに関数を呼ぶ。列同士の演算や np.where / np.select に置き換える",
+    'apply_lambda': "要素ごとの lambda の apply は遅い。.str / .dt アクセサや組み込みのメソッドに置き換える",
+    'range_len': "インデックスを回すループは遅い。列全体へのベクトル演算に置き換える",
+    'concat_in_loop': "ループ内の concat / append は毎回全体を複製する。リストに集めて最後に1回だけ concat する",
+    'cell_assign_in_loop': "ループ内で1セルずつ代入している。列全体への代入や map / merge に置き換える",
+}
+
+
+class _HintVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.found = []
+        self._loops = 0
+
+    def _add(self, node, pattern):
+        self.found.append((node.lineno, pattern))
+
+    def generic_visit(self, node):
+        loop = isinstance(node, _LOOP_NODES)
+        self._loops += loop
+        super().generic_visit(node)
+        self._loops -= loop
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if func.attr in ('iterrows', 'itertuples'):
+                self._add(node, 'iterrows')
+            elif func.attr == 'apply':
+                axis = [k.value for k in node.keywords if k.arg == 'axis']
+                if any(isinstance(v, ast.Constant) and v.value in (1, 'columns') for v in axis):
+                    self._add(node, 'apply_axis1')
+                elif node.args and isinstance(node.args[0], ast.Lambda):
+                    self._add(node, 'apply_lambda')
+            elif func.attr == 'concat' and self._loops:
+                self._add(node, 'concat_in_loop')
+        elif isinstance(func, ast.Name) and func.id == 'range' and len(node.args) == 1:
+            arg = node.args[0]
+            if isinstance(arg, ast.Call) and isinstance(arg.func, ast.Name) and arg.func.id == 'len':
+                self._add(node, 'range_len')
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        if self._loops:
+            # df = df.append(...) の形だけを数える（リストの append は除く）
+            value = node.value
+            if (isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)
+                    and value.func.attr in ('append', '_append')):
+                self._add(node, 'concat_in_loop')
+            for target in node.targets:
+                if (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute)
+                        and target.value.attr in ('loc', 'iloc', 'at', 'iat')):
+                    self._add(node, 'cell_assign_in_loop')
+        self.generic_visit(node)
+
+
+def find_slow_patterns(code):
+    """
+    遅くなりやすい pandas の書き方をコードから探す
+
+    Parameters:
+    -----------
+    code : str
+        Python コード
+
+    Returns:
+    --------
+    list : {'line': 行番号, 'pattern': 種類, 'hint': 改善のヒント} の辞書（構文エラーの場合は空）
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    visitor = _HintVisitor()
+    visitor.visit(tree)
+    return [
+        {'line': line, 'pattern': pattern, 'hint': HINTS[pattern]}
+        for line, pattern in sorted(set(visitor.found))
+    ]
+
+
+class _Sampler:
+    """
+    対象のスレッドが実行中の行と関数、プロセスのメモリ使用量を一定間隔で記録する
+
+    cProfile や tracemalloc と違い、対象のスレッドの処理には割り込まないため、
+    計測した経過時間がプロファイルなしの実行時間とほぼ変わらない。
+    """
+
+    def __init__(self, thread_id, filename, interval):
+        self.counts = Counter()
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.samples = 0
+        self.peak_rss = None
+        self._process = psutil.Process() if PSUTIL_AVAILABLE else None
+        self._thread_id = thread_id
+        self._filename = filename
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def sample_memory(self):
+        if self._process is not None:
+            rss = self._process.memory_info().rss
+            self.peak_rss = rss if self.peak_rss is None else max(self.peak_rss, rss)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.sample_memory()
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_counts[_frame_function(frame)] += 1
+            line_found = False
+            on_stack = set()
+            # pandas などの中にいる場合は、呼び出し元の生成コードの行を数える
+            while frame is not None:
+                on_stack.add(_frame_function(frame))
+                if not line_found and frame.f_code.co_filename == self._filename:
+                    self.counts[frame.f_lineno] += 1
+                    line_found = True
+                frame = frame.f_back
+            self.total_counts.update(on_stack)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _frame_function(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _function_label(filename, line, name):
+    if filename == CODE_FILENAME:
+        return f"{name}（{line}行目）"
+    path = filename.replace('\\', '/')
+    if 'site-packages/' in path:
+        path = path.split('site-packages/')[-1]
+    else:
+        path = path.rsplit('/', 1)[-1]
+    return f"{path}:{line}({name})"
+
+
+class Profiler:
+    """
+    with 文の中の処理を計測する
+
+    経過時間と、実行中の行・関数を一定間隔で記録するサンプリングによる行ごと・
+    関数ごとの時間の割合、プロセスのメモリ使用量（psutil がある場合）の増分の
+    ピークを測り、終了後に result に組み込み型だけの辞書として格納する。
+    cProfile や tracemalloc は処理を数倍遅くし、遅さの判定を誤らせるため使わない。
+
+    Parameters:
+    -----------
+    code : str
+        実行するコード（行の内容と書き方のヒントに使う）
+    filename : str
+        コードを compile したときのファイル名
+    """
+
+    def __init__(self, code, filename=CODE_FILENAME):
+        self.code = code
+        self.filename = filename
+        self.result = None
+        self._sampler = None
+        self._start = None
+        self._start_rss = None
+
+    def __enter__(self):
+        self._sampler = _Sampler(threading.get_ident(), self.filename, SAMPLE_INTERVAL)
+        self._sampler.sample_memory()
+        self._start_rss = self._sampler.peak_rss
+        self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self._sampler.stop()
+        self._sampler.sample_memory()
+        peak = None
+        if self._start_rss is not None:
+            peak = self._sampler.peak_rss - self._start_rss
+        self.result = {
+            'elapsed': elapsed,
+            'peak_memory': peak,
+            'lines': self._hot_lines(elapsed),
+            'functions': self._hot_functions(elapsed),
+            'hints': find_slow_patterns(self.code),
+        }
+        return False
+
+    def _hot_lines(self, elapsed):
+        samples = self._sampler.samples
+        if not samples:
+            return []
+        source = self.code.splitlines()
+        lines = []
+        for line, count in self._sampler.counts.most_common(TOP_LINES):
+            lines.append({
+                'line': line,
+                'source': source[line - 1].strip()[:120] if 0 < line <= len(source) else '',
+                'share': count / samples,
+                'seconds': elapsed * count / samples,
+            })
+        return lines
+
+    def _hot_functions(self, elapsed):
+        samples = self._sampler.samples
+        if not samples:
+            return []
+        rows = []
+        for function, count in self._sampler.self_counts.most_common(TOP_FUNCTIONS):
+            rows.append({
+                'function': _function_label(*function),
+                'share': count / samples,
+                'self_seconds': elapsed * count / samples,
+                'total_seconds': elapsed * self._sampler.total_counts[function] / samples,
+            })
+        return rows
+
+
+def needs_feedback(profile):
+    """時間がかかった、または遅くなりやすい書き方がある場合 True"""
+    return bool(profile) and (profile['elapsed'] >= SLOW_SECONDS or bool(profile['hints']))
+
+
+def format_profile(profile):
+    """
+    プロファイルをプロンプトに含められるテキストにする
+
+    Parameters:
+    -----------
+    profile : dict
+        Profiler.result
+
+    Returns:
+    --------
+    str
+    """
+    lines = [f"経過時間: {profile['elapsed']:.2f}秒"]
+    if profile['peak_memory'] is not None:
+        lines.append(f"メモリのピーク（実行前からの増分）: {profile['peak_memory'] / 1024**2:.1f} MB")
+    if profile['lines']:
+        lines.append("時間のかかった行:")
+        lines += [f"- {row['line']}行目（{row['share']:.0%}）: {row['source']}" for row in profile['lines']]
+    if profile['functions']:
+        lines.append("時間のかかった関数（自己時間 / 累計時間）:")
+        lines += [
+            f"- {row['function']}: {row['self_seconds']:.3f}秒 / {row['total_seconds']:.3f}秒"
+            for row in profile['functions']
+        ]
+    if profile['hints']:
+        lines.append("遅くなりやすい書き方:")
+        lines += [f"- {hint['line']}行目: {hint['hint']}" for hint in profile['hints']]
+    return "\n".join(lines)
+
+
+def feedback_prompt(code, profile):
+    """前回のコードとプロファイルを、次の質問に添えるテキストにする"""
+    return (
+        f"前回実行したコード:\n```\n{code}\n```\n\n"
+        f"そのプロファイル:\n{format_profile(profile)}\n\n"
+        "より速い書き方があれば、回答の中で提案してください。"
+    )
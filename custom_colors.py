@@ -66,6 +66,9 @@ ACCESSIBLE_COLORS = [
     '#56B4E9',  # 水色
 ]
 
+# マーカーに境界線を付ける点数の上限（点数が多いと描画が重くなるため）
+OUTLINE_MAX_POINTS = 5_000
+
 def get_color_mapping(series):
     """
     データシリーズに基づいて適切なカラーマップを返す
@@ -118,11 +121,14 @@ def apply_custom_colors(fig, color_column=None, data=None):
     if color_column and data is not None and color_column in data.columns:
         color_map = get_color_mapping(data[color_column])
         
-        # color_discrete_mapを更新
-        fig.update_traces(marker=dict(
-            size=10,  # マーカーサイズを大きくして見やすく
-            line=dict(width=1, color='DarkSlateGrey')  # 境界線を追加
-        ))
+        # 点数が多い場合は境界線の描画コストが大きいため付けない
+        num_points = sum(len(trace.x) for trace in fig.data if getattr(trace, 'x', None) is not None)
+        if num_points <= OUTLINE_MAX_POINTS:
+            # color_discrete_mapを更新
+            fig.update_traces(marker=dict(
+                size=10,  # マーカーサイズを大きくして見やすく
+                line=dict(width=1, color='DarkSlateGrey')  # 境界線を追加
+            ))
         
     return fig
 
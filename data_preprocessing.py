@@ -7,6 +7,13 @@ import seaborn as sns
 from datetime import datetime
 import json
 
+import dataset_store
+
+# 共有データセットの列を書き換えたとき、その列だけを複製する
+# （streamlit run で起動したときだけ設定し、import されただけでは pandas の設定を変えない）
+if __name__ == '__main__':
+    pd.set_option('mode.copy_on_write', True)
+
 st.set_page_config(page_title="データ前処理アシスタント", page_icon="🧹", layout="wide")
 
 st.title("🧹 データ前処理アシスタント")
@@ -50,28 +57,15 @@ if uploaded_file:
     selected_file = uploaded_file.name
     file_path = save_path
 
-# データの読み込み
-@st.cache_data
+# データの読み込み（同じファイルを開いたセッション間で1つのデータを共有）
 def load_data(path):
     """データファイルを読み込む"""
     try:
-        if path.endswith('.csv'):
-            # エンコーディングを試行
-            encodings = ['utf-8', 'shift-jis', 'cp932', 'latin-1']
-            for encoding in encodings:
-                try:
-                    return pd.read_csv(path, encoding=encoding)
-                except:
-                    continue
-            st.error("CSVファイルの読み込みに失敗しました。")
-            return None
-        elif path.endswith(('.xlsx', '.xls')):
-            return pd.read_excel(path)
-        elif path.endswith('.json'):
-            return pd.read_json(path)
+        handle = dataset_store.get_store().open_file(path)
     except Exception as e:
         st.error(f"ファイル読み込みエラー: {e}")
         return None
+    return dataset_store.attach_to_session(st.session_state, handle)
 
 # データの読み込みと表示
 df = load_data(file_path)
@@ -191,20 +185,20 @@ if df is not None:
                         elif method == "平均値で補完（数値列のみ）":
                             for col in selected_cols:
                                 if df_processed[col].dtype in [np.float64, np.int64]:
-                                    df_processed[col].fillna(df_processed[col].mean(), inplace=True)
+                                    df_processed[col] = df_processed[col].fillna(df_processed[col].mean())
                         elif method == "中央値で補完（数値列のみ）":
                             for col in selected_cols:
                                 if df_processed[col].dtype in [np.float64, np.int64]:
-                                    df_processed[col].fillna(df_processed[col].median(), inplace=True)
+                                    df_processed[col] = df_processed[col].fillna(df_processed[col].median())
                         elif method == "最頻値で補完":
                             for col in selected_cols:
                                 mode_val = df_processed[col].mode()
                                 if len(mode_val) > 0:
-                                    df_processed[col].fillna(mode_val[0], inplace=True)
+                                    df_processed[col] = df_processed[col].fillna(mode_val[0])
                         elif method == "前方補完（時系列データ）":
-                            df_processed[selected_cols] = df_processed[selected_cols].fillna(method='ffill')
+                            df_processed[selected_cols] = df_processed[selected_cols].ffill()
                         elif method == "後方補完（時系列データ）":
-                            df_processed[selected_cols] = df_processed[selected_cols].fillna(method='bfill')
+                            df_processed[selected_cols] = df_processed[selected_cols].bfill()
                         elif method == "線形補間（数値列のみ）":
                             for col in selected_cols:
                                 if df_processed[col].dtype in [np.float64, np.int64]:
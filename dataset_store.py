@@ -0,0 +1,341 @@
+"""
+データセットストア
+同じファイルを開いた複数のセッションで、読み取り専用の DataFrame を1つだけ共有する
+"""
+
+import hashlib
+import io
+import os
+import threading
+import weakref
+from pathlib import Path
+
+import pandas as pd
+
+# Arrow IPC ファイルのメモリマップ（オプション）
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+STORE_DIR = Path("data/temp/datasets")
+
+# 参照がなくなった後もメモリに残しておくデータセット数
+IDLE_DATASETS = 2
+
+CSV_ENCODINGS = ['utf-8', 'shift-jis', 'cp932', 'latin-1']
+
+_HASH_CHUNK = 8 * 1024 * 1024
+
+
+def read_data_file(source, name):
+    """
+    拡張子に応じてデータファイルを読み込む
+
+    CSV は複数のエンコーディングを順に試す。
+
+    Parameters:
+    -----------
+    source : str, Path or file-like
+        ファイルのパス、またはファイルの内容
+    name : str
+        ファイル名（拡張子で形式を判定する）
+
+    Returns:
+    --------
+    pd.DataFrame : 読み込んだデータ
+    """
+    name = str(name)
+    if name.endswith('.csv'):
+        error = None
+        for encoding in CSV_ENCODINGS:
+            try:
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+                return pd.read_csv(source, encoding=encoding)
+            except (UnicodeDecodeError, pd.errors.ParserError) as e:
+                error = e
+        raise ValueError(f"CSVファイルの読み込みに失敗しました: {error}")
+    if name.endswith(('.xlsx', '.xls')):
+        return pd.read_excel(source)
+    if name.endswith('.json'):
+        return pd.read_json(source)
+    if name.endswith('.parquet'):
+        return pd.read_parquet(source)
+    raise ValueError(f"未対応のファイル形式です: {name}")
+
+
+def content_hash(data):
+    """
+    バイト列またはファイルの内容から SHA-1 を計算する
+
+    Parameters:
+    -----------
+    data : bytes or str or Path
+        バイト列、またはファイルのパス
+
+    Returns:
+    --------
+    str : SHA-1 の16進文字列
+    """
+    hasher = hashlib.sha1()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        hasher.update(data)
+        return hasher.hexdigest()
+    with open(data, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class DatasetHandle:
+    """
+    セッションが保持するデータセットへの参照
+
+    frame() はストアの DataFrame の浅いコピーを返す。pandas の Copy-on-Write が
+    有効な場合、列を書き換えたときにその列だけが複製され、共有データは変更されない。
+    ハンドルが破棄されるか release() を呼ぶと参照数が減る。
+    """
+
+    def __init__(self, store, key, name):
+        self.key = key
+        self.name = name
+        self._store = store
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    def frame(self):
+        """
+        セッション用の DataFrame を返す
+
+        Returns:
+        --------
+        pd.DataFrame : 共有データの浅いコピー（Copy-on-Write 無効時は深いコピー）
+        """
+        base = self._store._frame(self.key)
+        return base.copy(deep=not pd.get_option('mode.copy_on_write'))
+
+    def release(self):
+        """参照を解放する（2回目以降の呼び出しは何もしない）"""
+        self._finalizer()
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+class DatasetStore:
+    """
+    内容のハッシュをキーにした、プロセス全体で共有する読み取り専用データセット
+
+    読み込んだデータは非圧縮の Arrow IPC ファイルとして directory に保存し、
+    メモリマップで開いた1つの DataFrame を全セッションで共有する。同じ内容の
+    ファイルは2回目以降、元ファイルを解析し直さずに Arrow ファイルから開く。
+
+    Parameters:
+    -----------
+    directory : str or Path
+        Arrow ファイルの保存先
+    idle_datasets : int
+        参照がなくなった後もメモリに残しておくデータセット数
+    """
+
+    def __init__(self, directory=STORE_DIR, idle_datasets=IDLE_DATASETS):
+        self.directory = Path(directory)
+        self.idle_datasets = idle_datasets
+        self._entries = {}
+        self._idle = []
+        self._file_hashes = {}
+        self._lock = threading.RLock()
+
+    def _arrow_path(self, key):
+        return self.directory / f"{key}.arrow"
+
+    def _load(self, key, loader):
+        """Arrow ファイルから開く。なければ loader で読み込んで Arrow ファイルを作る"""
+        path = self._arrow_path(key)
+        if not PYARROW_AVAILABLE:
+            return loader()
+        if not path.exists():
+            df = loader()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                feather.write_feather(df, temporary, compression='uncompressed')
+            except (pa.ArrowException, TypeError, ValueError):
+                # 型が混在した列など Arrow に変換できないデータはメモリ上でのみ共有する
+                temporary.unlink(missing_ok=True)
+                return df
+            os.replace(temporary, path)
+        table = feather.read_table(path, memory_map=True)
+        # 欠損のない数値列はメモリマップされたバッファをそのまま参照する
+        return table.to_pandas(split_blocks=True)
+
+    def _open(self, key, name, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'name': name, 'frame': None, 'refs': 0, 'lock': threading.Lock()}
+                self._entries[key] = entry
+            entry['refs'] += 1
+            if key in self._idle:
+                self._idle.remove(key)
+
+        # 同じデータセットの読み込みは1回だけ行い、他のセッションは完了を待つ
+        with entry['lock']:
+            if entry['frame'] is None:
+                try:
+                    entry['frame'] = self._load(key, loader)
+                except Exception:
+                    self._release(key)
+                    raise
+        return DatasetHandle(self, key, name)
+
+    def _frame(self, key):
+        return self._entries[key]['frame']
+
+    def arrow_path(self, key):
+        """
+        データセットを保存した Arrow ファイルのパス
+
+        Parameters:
+        -----------
+        key : str
+            データセットのキー（DatasetHandle.key）
+
+        Returns:
+        --------
+        Path or None : Arrow ファイルがない場合は None
+        """
+        path = self._arrow_path(key)
+        return path if PYARROW_AVAILABLE and path.exists() else None
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return
+            # 参照がなくなったものは直近の数件だけメモリに残す
+            self._idle.append(key)
+            while len(self._idle) > self.idle_datasets:
+                evicted = self._idle.pop(0)
+                if self._entries.get(evicted, {}).get('refs', 1) <= 0:
+                    del self._entries[evicted]
+
+    def open_file(self, path, loader=None):
+        """
+        ファイルを開き、共有データセットへのハンドルを返す
+
+        ファイルのハッシュはパス・サイズ・更新日時ごとに保持し、同じファイルを
+        開き直すたびに全体を読み直さない。
+
+        Parameters:
+        -----------
+        path : str or Path
+            データファイルのパス
+        loader : callable or None
+            path を受け取って DataFrame を返す関数（None の場合は read_data_file）
+
+        Returns:
+        --------
+        DatasetHandle : データセットへの参照
+        """
+        path = Path(path)
+        stat = path.stat()
+        signature = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            key = self._file_hashes.get(signature)
+        if key is None:
+            key = content_hash(path)
+            with self._lock:
+                self._file_hashes[signature] = key
+        loader = loader or (lambda source: read_data_file(source, source.name))
+        return self._open(key, path.name, lambda: loader(path))
+
+    def open_bytes(self, data, name):
+        """
+        アップロードされたファイルの内容を開き、共有データセットへのハンドルを返す
+
+        Parameters:
+        -----------
+        data : bytes
+            ファイルの内容
+        name : str
+            ファイル名（拡張子で形式を判定する）
+
+        Returns:
+        --------
+        DatasetHandle : データセットへの参照
+        """
+        key = content_hash(data)
+        return self._open(key, name, lambda: read_data_file(io.BytesIO(data), name))
+
+    def stats(self):
+        """
+        保持しているデータセットの一覧
+
+        Returns:
+        --------
+        pd.DataFrame : キー、名前、参照数、行数、列数、メモリ上のサイズ(MB)
+        """
+        with self._lock:
+            rows = [
+                {
+                    'キー': key[:12],
+                    '名前': entry['name'],
+                    '参照数': entry['refs'],
+                    '行数': len(entry['frame']) if entry['frame'] is not None else None,
+                    '列数': len(entry['frame'].columns) if entry['frame'] is not None else None,
+                    'サイズ(MB)': (entry['frame'].memory_usage().sum() / 1024**2
+                                  if entry['frame'] is not None else None),
+                }
+                for key, entry in self._entries.items()
+            ]
+        return pd.DataFrame(rows)
+
+
+def attach_to_session(session_state, handle, slot='dataset_handle'):
+    """
+    セッションのデータセットを handle に切り替え、前のハンドルの参照を解放する
+
+    Parameters:
+    -----------
+    session_state : MutableMapping
+        セッションの状態（st.session_state など）
+    handle : DatasetHandle
+        新しく開いたデータセット
+    slot : str
+        ハンドルを保持するキー
+
+    Returns:
+    --------
+    pd.DataFrame : セッション用の DataFrame
+    """
+    previous = session_state.get(slot)
+    if previous is not None and previous is not handle:
+        previous.release()
+    session_state[slot] = handle
+    return handle.frame()
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    """
+    プロセス全体で共有するストアを返す
+
+    Returns:
+    --------
+    DatasetStore
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = DatasetStore()
+        return _STORE
@@ -3,6 +3,13 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import pandas as pd
 from pylab import rcParams
+import sys
+from pathlib import Path
+
+# リポジトリ直下のユーティリティを読み込めるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import graph_layout
+import network_utils
 
 # ページの設定
 st.set_page_config(page_title="ネットワーク分析デモ", page_icon="🕸️", layout="wide")
@@ -37,7 +44,7 @@ with col1:
     
     # グラフの描画
     fig, ax = plt.subplots(figsize=(10, 8))
-    pos = nx.spring_layout(G, k=2, iterations=50)
+    pos = graph_layout.compute_layout(G, 'spring', iterations=50, k=2)
     
     # ノードの次数を計算
     degrees = dict(G.degree())
@@ -70,8 +77,14 @@ with col2:
     
     # 連結性
     if nx.is_connected(G):
-        stats["平均経路長"] = f"{nx.average_shortest_path_length(G):.2f}"
-        stats["直径"] = nx.diameter(G)
+        # 大きなグラフではサンプリングBFSによる推定値になる
+        path_stats = network_utils.path_statistics(G)
+        stats["平均経路長"] = f"{path_stats['average_path_length']:.2f}"
+        if path_stats['exact']:
+            stats["直径"] = path_stats['diameter_lower']
+        else:
+            stats["平均経路長"] += f" (95%CI: {path_stats['ci_low']:.2f}–{path_stats['ci_high']:.2f})"
+            stats["直径"] = f"{path_stats['diameter_lower']}以上"
     
     stats["クラスタリング係数"] = f"{nx.average_clustering(G):.3f}"
     
@@ -0,0 +1,435 @@
+"""
+探索的データ分析(EDA)ユーティリティ
+大規模データでも一定の計算量・描画量に収まる集計関数群
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# 欠損パターンの可視化で使う行方向の分割数
+DEFAULT_MISSING_BINS = 200
+
+# この列数を超える場合は相関行列のヒートマップを作らず、ブロック計算で高相関ペアだけを抽出する
+CORRELATION_HEATMAP_MAX_COLUMNS = 200
+
+# 分布の検定に使う標本の上限（Shapiro-Wilk 検定は5000件を超えると p 値が不正確になる）
+DISTRIBUTION_SAMPLE_SIZE = 5_000
+
+# ハッシュできないため nunique や value_counts で TypeError になる値の型
+_UNHASHABLE_TYPES = (list, dict, set, np.ndarray)
+
+
+def hashable_frame(df):
+    """
+    リスト・辞書などハッシュできない値を含む列を、その値だけ文字列にした DataFrame を返す
+
+    JSON から読み込んだデータなどで nunique・value_counts・hash_pandas_object が
+    TypeError になる場合に使う。該当する列がなければ df をそのまま返す（元の df は変更しない）。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+
+    Returns:
+    --------
+    pd.DataFrame
+    """
+    result = df
+    for position, dtype in enumerate(df.dtypes):
+        if dtype != object:
+            continue
+        values = df.iloc[:, position]
+        unhashable = values.map(lambda v: isinstance(v, _UNHASHABLE_TYPES))
+        if not unhashable.any():
+            continue
+        if result is df:
+            result = df.copy(deep=False)
+        result.isetitem(position, values.where(~unhashable, values.astype(str)))
+    return result
+
+
+def column_profile(df):
+    """
+    列ごとのデータ型・非null数・欠損数・ユニーク値数をまとめて計算する
+
+    データ探索とレポート作成で同じ結果を使い回せるよう、1回の呼び出しで必要な
+    統計量をすべて求める。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+
+    Returns:
+    --------
+    pd.DataFrame : 列名, データ型, 非null数, null値数, null割合(%), ユニーク値数
+    """
+    non_null = df.count()
+    null_count = len(df) - non_null
+    try:
+        unique = df.nunique()
+    except TypeError:
+        unique = hashable_frame(df).nunique()
+    return pd.DataFrame({
+        '列名': df.columns,
+        'データ型': df.dtypes.astype(str).values,
+        '非null数': non_null.values,
+        'null値数': null_count.values,
+        'null割合(%)': (null_count / max(len(df), 1) * 100).round(2).values,
+        'ユニーク値数': unique.values,
+    })
+
+
+def binned_missing_matrix(df, n_bins=DEFAULT_MISSING_BINS):
+    """
+    行を n_bins 個の区間にまとめ、区間ごと・列ごとの欠損率を計算する
+
+    行数に関係なく n_bins×列数 の行列になるため、100万行でも一定時間で描画できる。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    n_bins : int
+        行方向の分割数
+
+    Returns:
+    --------
+    pd.DataFrame : 行が区間（先頭行番号）、列が元の列の欠損率
+    """
+    num_rows = len(df)
+    if num_rows == 0:
+        return pd.DataFrame(columns=df.columns, dtype=float)
+
+    n_bins = min(n_bins, num_rows)
+    starts = np.unique(np.linspace(0, num_rows, n_bins + 1).astype(np.int64)[:-1])
+    counts = np.diff(np.r_[starts, num_rows])
+
+    mask = df.isna().to_numpy()
+    fractions = np.add.reduceat(mask, starts, axis=0, dtype=np.int64) / counts[:, None]
+    return pd.DataFrame(fractions, index=pd.Index(starts, name='開始行'), columns=df.columns)
+
+
+def missing_patterns(df, top_n=10):
+    """
+    行ごとの欠損パターンをビット列に圧縮して集計する
+
+    欠損のある列だけを対象に、各行の欠損状態を np.packbits でバイト列にまとめ、
+    同じパターンの行数を数える。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    top_n : int
+        返すパターン数（出現数の多い順）
+
+    Returns:
+    --------
+    tuple : (patterns, co_missing)
+        patterns は行がパターン、列が欠損列（True=欠損）と「行数」「割合(%)」の DataFrame。
+        co_missing は全パターンから計算した列同士の同時欠損行数の DataFrame
+    """
+    missing_cols = df.columns[df.isna().any()].tolist()
+    if not missing_cols:
+        return pd.DataFrame(columns=['行数', '割合(%)']), pd.DataFrame()
+
+    mask = df[missing_cols].isna().to_numpy()
+    packed = np.packbits(mask, axis=1)
+
+    # 1行分のビット列を1つの値として扱い、同じパターンを数える
+    row_view = np.ascontiguousarray(packed).view(np.dtype((np.void, packed.shape[1])))
+    unique_rows, counts = np.unique(row_view.ravel(), return_counts=True)
+    unique_bits = np.unpackbits(
+        unique_rows.view(np.uint8).reshape(len(unique_rows), -1), axis=1
+    )[:, :len(missing_cols)].astype(bool)
+
+    # 同時欠損行数はパターン数×列数の小さな行列から計算できる
+    weighted = unique_bits.astype(np.int64) * counts[:, None]
+    co_missing = pd.DataFrame(weighted.T @ unique_bits.astype(np.int64),
+                              index=missing_cols, columns=missing_cols)
+
+    order = np.argsort(-counts, kind='stable')[:top_n]
+    patterns = pd.DataFrame(unique_bits[order], columns=missing_cols)
+    patterns['行数'] = counts[order]
+    patterns['割合(%)'] = (counts[order] / len(df) * 100).round(2)
+    return patterns, co_missing
+
+
+def _pair_frame(names_a, names_b, values):
+    """相関ペアの DataFrame を |r| の降順で作る"""
+    pairs = pd.DataFrame({'変数1': names_a, '変数2': names_b, '相関係数': values})
+    order = np.argsort(-np.abs(pairs['相関係数'].to_numpy()), kind='stable')
+    pairs = pairs.iloc[order].reset_index(drop=True)
+    pairs['相関係数'] = pairs['相関係数'].round(3)
+    return pairs
+
+
+def _select_pairs(r, threshold, top_k, upper_only):
+    """相関係数のブロックから閾値を超えるペアの位置と値を取り出す"""
+    valid = np.abs(np.nan_to_num(r)) > threshold
+    if upper_only:
+        valid &= np.triu(np.ones(r.shape, dtype=bool), k=1)
+    rows, cols = np.nonzero(valid)
+    values = r[rows, cols]
+    if top_k is not None and len(values) > top_k:
+        keep = np.argpartition(-np.abs(values), top_k - 1)[:top_k]
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+    return rows, cols, values
+
+
+def correlation_pairs_from_matrix(corr, threshold=0.5, top_k=None):
+    """
+    計算済みの相関行列の上三角から |r| > threshold のペアを取り出す
+
+    Parameters:
+    -----------
+    corr : pd.DataFrame
+        相関行列
+    threshold : float
+        抽出する相関係数の絶対値の下限
+    top_k : int or None
+        返すペア数の上限（|r| の大きい順）
+
+    Returns:
+    --------
+    pd.DataFrame : 変数1, 変数2, 相関係数
+    """
+    names = np.asarray(corr.columns)
+    rows, cols, values = _select_pairs(corr.to_numpy(), threshold, top_k, upper_only=True)
+    return _pair_frame(names[rows], names[cols], values)
+
+
+def high_correlation_pairs(numeric_df, threshold=0.5, top_k=None, block_size=512,
+                           row_chunk=None):
+    """
+    相関行列をブロックごとに計算し、|r| > threshold のペアだけを残す
+
+    列をブロックに分け、ブロックの組ごとに行方向にも分割して積和を集計するため、
+    列数×列数の相関行列全体をメモリに載せる必要がない。欠損値はペアごとに
+    除外する（DataFrame.corr と同じ結果になる）。
+
+    Parameters:
+    -----------
+    numeric_df : pd.DataFrame
+        数値列のみのデータ
+    threshold : float
+        抽出する相関係数の絶対値の下限
+    top_k : int or None
+        返すペア数の上限（|r| の大きい順）
+    block_size : int
+        1ブロックあたりの列数
+    row_chunk : int or None
+        1回に処理する行数（None の場合はブロックサイズから自動で決める）
+
+    Returns:
+    --------
+    pd.DataFrame : 変数1, 変数2, 相関係数
+    """
+    names = np.asarray(numeric_df.columns)
+    values = numeric_df.to_numpy(dtype=np.float64)
+    num_rows, num_cols = values.shape
+    if row_chunk is None:
+        row_chunk = max(1_000, 5_000_000 // max(block_size, 1))
+
+    # 平均で中心化しておくと積和の桁落ちを抑えられる（相関係数は平行移動で不変）
+    valid = ~np.isnan(values)
+    has_missing = not valid.all()
+    means = np.nanmean(values, axis=0) if num_rows else np.zeros(num_cols)
+
+    found_rows, found_cols, found_values = [], [], []
+    blocks = [np.arange(start, min(start + block_size, num_cols))
+              for start in range(0, num_cols, block_size)]
+
+    for i, block_a in enumerate(blocks):
+        for block_b in blocks[i:]:
+            shape = (len(block_a), len(block_b))
+            sab = np.zeros(shape)
+            if has_missing:
+                n_ab, sa, sb, saa, sbb = (np.zeros(shape) for _ in range(5))
+            else:
+                saa = np.zeros(len(block_a))
+                sbb = np.zeros(len(block_b))
+
+            for start in range(0, num_rows, row_chunk):
+                rows = slice(start, start + row_chunk)
+                xa = values[rows, block_a] - means[block_a]
+                xb = values[rows, block_b] - means[block_b]
+                if has_missing:
+                    ma = valid[rows, block_a].astype(np.float64)
+                    mb = valid[rows, block_b].astype(np.float64)
+                    xa = np.where(ma > 0, xa, 0.0)
+                    xb = np.where(mb > 0, xb, 0.0)
+                    n_ab += ma.T @ mb
+                    sa += xa.T @ mb
+                    sb += ma.T @ xb
+                    saa += (xa ** 2).T @ mb
+                    sbb += ma.T @ (xb ** 2)
+                else:
+                    saa += (xa ** 2).sum(axis=0)
+                    sbb += (xb ** 2).sum(axis=0)
+                sab += xa.T @ xb
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if has_missing:
+                    cov = sab - sa * sb / n_ab
+                    var_a = saa - sa ** 2 / n_ab
+                    var_b = sbb - sb ** 2 / n_ab
+                    r = cov / np.sqrt(var_a * var_b)
+                    r[n_ab < 2] = np.nan
+                else:
+                    r = sab / np.sqrt(np.outer(saa, sbb))
+
+            rows_idx, cols_idx, vals = _select_pairs(r, threshold, top_k,
+                                                     upper_only=block_a[0] == block_b[0])
+            found_rows.append(block_a[rows_idx])
+            found_cols.append(block_b[cols_idx])
+            found_values.append(vals)
+
+    if not found_values:
+        return _pair_frame([], [], [])
+    rows_idx = np.concatenate(found_rows)
+    cols_idx = np.concatenate(found_cols)
+    vals = np.concatenate(found_values)
+    pairs = _pair_frame(names[rows_idx], names[cols_idx], vals)
+    return pairs if top_k is None else pairs.head(top_k)
+
+
+def stratified_sample_indices(size, sample_size, strata=None, seed=42):
+    """
+    層ごとの件数に比例して標本の位置を選ぶ
+
+    Parameters:
+    -----------
+    size : int
+        母集団の件数
+    sample_size : int
+        標本の件数
+    strata : array-like or None
+        各要素の層（None の場合は単純無作為抽出）
+    seed : int
+        乱数シード
+
+    Returns:
+    --------
+    np.ndarray : 選ばれた位置（昇順）
+    """
+    if size <= sample_size:
+        return np.arange(size)
+    rng = np.random.default_rng(seed)
+    if strata is None:
+        return np.sort(rng.choice(size, sample_size, replace=False))
+
+    codes, _ = pd.factorize(pd.Series(strata), use_na_sentinel=False)
+    counts = np.bincount(codes)
+    if len(counts) >= sample_size:
+        # 層が標本数と同程度以上あると層別にする意味がないため、単純無作為抽出にする
+        return np.sort(rng.choice(size, sample_size, replace=False))
+
+    # 比例配分し、端数は小数部の大きい層から1件ずつ割り当てる（同じ小数部の層は無作為に選ぶ）
+    quota = counts * sample_size / size
+    allocation = np.floor(quota).astype(np.int64)
+    remainder = sample_size - allocation.sum()
+    if remainder > 0:
+        allocation[np.lexsort((rng.random(len(quota)), -(quota - allocation)))[:remainder]] += 1
+
+    # 無作為に並べ替えてから層ごとにまとめ、各層の先頭から割り当て数だけ取る
+    order = rng.permutation(size)
+    order = order[np.argsort(codes[order], kind='stable')]
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    sorted_codes = codes[order]
+    rank = np.arange(size) - starts[sorted_codes]
+    return np.sort(order[rank < allocation[sorted_codes]])
+
+
+def _normality_tests(name, values, total, alpha):
+    """1列分の標本に対して正規性の検定をまとめて実行する"""
+    row = {
+        '列': name,
+        '件数': total,
+        '標本数': len(values),
+        '歪度': np.nan,
+        '尖度': np.nan,
+        'Shapiro統計量': np.nan,
+        'Shapiro p値': np.nan,
+        "D'Agostino統計量": np.nan,
+        "D'Agostino p値": np.nan,
+        'KS統計量': np.nan,
+        'KS p値': np.nan,
+        'Anderson統計量': np.nan,
+        'Anderson臨界値(5%)': np.nan,
+    }
+    if len(values) < 3 or np.ptp(values) == 0:
+        row['判定'] = '判定不可'
+        return row
+
+    row['歪度'] = stats.skew(values)
+    row['尖度'] = stats.kurtosis(values)
+    row['Shapiro統計量'], row['Shapiro p値'] = stats.shapiro(values)
+    if len(values) >= 20:
+        # 尖度検定の近似が成り立つ件数に満たない場合は D'Agostino 検定を省く
+        row["D'Agostino統計量"], row["D'Agostino p値"] = stats.normaltest(values)
+
+    # 平均・標準偏差を標本から推定しているため、KS 検定の p 値は保守的になる
+    standardized = (values - values.mean()) / values.std(ddof=1)
+    row['KS統計量'], row['KS p値'] = stats.kstest(standardized, 'norm')
+
+    anderson = stats.anderson(values, dist='norm')
+    row['Anderson統計量'] = anderson.statistic
+    row['Anderson臨界値(5%)'] = anderson.critical_values[list(anderson.significance_level).index(5.0)]
+
+    p_values = [row[key] for key in ('Shapiro p値', "D'Agostino p値", 'KS p値')
+                if not np.isnan(row[key])]
+    rejected = (min(p_values) < alpha
+                or row['Anderson統計量'] > row['Anderson臨界値(5%)'])
+    row['判定'] = '正規分布に従わない可能性' if rejected else '正規分布に従う可能性'
+    return row
+
+
+def distribution_tests(df, columns=None, sample_size=DISTRIBUTION_SAMPLE_SIZE, strata_col=None,
+                       alpha=0.05, seed=42, max_workers=None):
+    """
+    数値列ごとに Shapiro-Wilk / D'Agostino / KS / Anderson-Darling 検定を一括実行する
+
+    各列の欠損を除いた値から最大 sample_size 件を（strata_col があれば層の構成比を
+    保って）抽出し、列ごとの検定をスレッドで並列に実行する。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    columns : list or None
+        検定する列（None の場合は全数値列）
+    sample_size : int
+        1列あたりの標本数の上限
+    strata_col : str or None
+        層化抽出に使う列
+    alpha : float
+        有意水準
+    seed : int
+        乱数シード
+    max_workers : int or None
+        並列実行のスレッド数
+
+    Returns:
+    --------
+    pd.DataFrame : 列ごとの検定統計量・p値・判定
+    """
+    if columns is None:
+        columns = [col for col in df.select_dtypes(include=[np.number]).columns if col != strata_col]
+
+    def run(column):
+        series = df[column]
+        valid = series.notna().to_numpy()
+        values = series.to_numpy(dtype=np.float64)[valid]
+        strata = df[strata_col].to_numpy()[valid] if strata_col is not None else None
+        picked = stratified_sample_indices(len(values), sample_size, strata, seed)
+        return _normality_tests(column, values[picked], len(values), alpha)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(run, columns))
+    return pd.DataFrame(rows)
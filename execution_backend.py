@@ -0,0 +1,736 @@
+"""
+実行バックエンド
+Parquet ファイルを pandas・DuckDB・Polars のいずれかで開き、データ探索・相関・
+時系列・グループ集計を、必要な列と行だけを読む遅延クエリとして実行する
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import eda_utils
+import group_utils
+import timeseries_utils
+
+# DuckDB（オプション）
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+# Polars（オプション）
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    POLARS_AVAILABLE = False
+
+BACKENDS = ['pandas', 'duckdb', 'polars']
+
+# 遅延実行の対象にする Parquet ファイルの置き場所
+PARQUET_DIRS = [Path("data/raw"), Path("data/processed")]
+
+# DuckDB がメモリに収まらない集計を書き出す一時ディレクトリ
+DUCKDB_TEMP_DIR = Path("data/temp/duckdb")
+
+# 行の条件に使える演算子（pyarrow の filters と同じ表記）
+FILTER_OPERATORS = ['==', '!=', '<', '<=', '>', '>=']
+
+# 描画や検定など、メモリ上の DataFrame が必要な処理に渡す抽出行数
+SAMPLE_ROWS = 100_000
+
+# ユニーク値数の近似値がこれ以下の列は、厳密に数え直す（少ない値の数え間違いが目立つため）
+EXACT_DISTINCT_MAX = 1_000
+
+# RESAMPLE_RULES / TIME_GRAINS の頻度に対応する切り捨て単位（週は月曜始まり）
+_DUCKDB_UNITS = {
+    'min': 'minute', 'h': 'hour', 'D': 'day', 'W': 'week',
+    'MS': 'month', 'QS': 'quarter', 'M': 'month', 'Q': 'quarter', 'Y': 'year',
+}
+_POLARS_UNITS = {
+    'min': '1m', 'h': '1h', 'D': '1d', 'W': '1w',
+    'MS': '1mo', 'QS': '1q', 'M': '1mo', 'Q': '1q', 'Y': '1y',
+}
+
+_SQL_AGGREGATIONS = {
+    'mean': 'avg(CAST({0} AS DOUBLE))',
+    'sum': 'coalesce(sum(CAST({0} AS DOUBLE)), 0)',
+    'count': 'count({0})',
+    'min': 'min(CAST({0} AS DOUBLE))',
+    'max': 'max(CAST({0} AS DOUBLE))',
+    'std': 'stddev_samp(CAST({0} AS DOUBLE))',
+    'median': 'median(CAST({0} AS DOUBLE))',
+}
+
+
+def available_backends():
+    """
+    インストールされているライブラリで使えるバックエンドの一覧
+
+    Returns:
+    --------
+    list : BACKENDS のうち使えるもの
+    """
+    return [name for name, available in zip(BACKENDS, [True, DUCKDB_AVAILABLE, POLARS_AVAILABLE])
+            if available]
+
+
+def list_parquet_files(directories=PARQUET_DIRS):
+    """
+    遅延実行の対象にできる Parquet ファイルの一覧
+
+    Parameters:
+    -----------
+    directories : list of Path
+        探すディレクトリ
+
+    Returns:
+    --------
+    list of Path
+    """
+    files = []
+    for directory in directories:
+        if Path(directory).exists():
+            files += sorted(Path(directory).glob("*.parquet"))
+    return files
+
+
+def column_kind(data_type):
+    """
+    Arrow の型を 'numeric', 'datetime', 'category', 'boolean', 'other' に分類する
+    """
+    if pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type):
+        return 'numeric'
+    if pa.types.is_timestamp(data_type) or pa.types.is_date(data_type):
+        return 'datetime'
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type) or pa.types.is_dictionary(data_type):
+        return 'category'
+    if pa.types.is_boolean(data_type):
+        return 'boolean'
+    return 'other'
+
+
+def _quote(name):
+    """SQL の識別子として列名を引用符で囲む"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(text):
+    """SQL の文字列リテラルにする"""
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _fill_resampled(series, rule, how):
+    """集計済みの系列を pandas の resample と同じ連続した日時に並べる"""
+    if len(series) == 0:
+        return series
+    index = pd.date_range(series.index.min(), series.index.max(), freq=rule, name=series.index.name)
+    series = series.reindex(index)
+    return series.fillna(0.0) if how == 'sum' else series
+
+
+class LazyDataset(ABC):
+    """
+    Parquet ファイルに対する遅延クエリの共通部分
+
+    各メソッドは結果（集計結果や抽出した行）だけをメモリ上の pandas オブジェクトとして返す。
+
+    Parameters:
+    -----------
+    path : str or Path
+        Parquet ファイル
+    filters : list of tuple or None
+        (列名, 演算子, 値) の条件（すべてを満たす行だけを対象にする）
+    """
+
+    backend = None
+
+    def __init__(self, path, filters=None):
+        self.path = Path(path)
+        self.filters = list(filters or [])
+        for column, operator, _ in self.filters:
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"未対応の演算子です: {operator}")
+        self.arrow_schema = pq.read_schema(self.path)
+        self.schema = {field.name: column_kind(field.type) for field in self.arrow_schema}
+        self._mtime = self.path.stat().st_mtime_ns
+
+    @property
+    def cache_key(self):
+        """結果をキャッシュするためのキー（ファイルの更新で変わる）"""
+        return (self.backend, str(self.path.resolve()), self._mtime, tuple(map(tuple, self.filters)))
+
+    def columns_of(self, kind):
+        """指定した種類の列名の一覧"""
+        return [name for name, column_type in self.schema.items() if column_type == kind]
+
+    def parse_value(self, column, text):
+        """
+        条件の値を列の型に合わせて変換する
+
+        Parameters:
+        -----------
+        column : str
+            列名
+        text : str
+            入力された値
+
+        Returns:
+        --------
+        object : 数値・日時・文字列のいずれか
+        """
+        kind = self.schema.get(column)
+        if kind == 'numeric':
+            return float(text)
+        if kind == 'datetime':
+            return pd.Timestamp(text).to_pydatetime()
+        if kind == 'boolean':
+            return str(text).strip().lower() in ('true', '1', 'yes')
+        return str(text)
+
+    @abstractmethod
+    def num_rows(self):
+        """対象の行数（行の条件を満たす行だけを数える）"""
+
+    @abstractmethod
+    def sample(self, columns=None, n=SAMPLE_ROWS, seed=42):
+        """
+        行を無作為に抽出する（元の行の順序を保つ）
+
+        Parameters:
+        -----------
+        columns : list or None
+            読む列（None の場合はすべて）
+        n : int
+            抽出する行数
+        seed : int
+            乱数シード
+
+        Returns:
+        --------
+        pd.DataFrame
+        """
+
+    @abstractmethod
+    def column_profile(self):
+        """
+        列ごとのデータ型・非null数・欠損数・ユニーク値数
+
+        Returns:
+        --------
+        pd.DataFrame : eda_utils.column_profile と同じ列
+        """
+
+    @abstractmethod
+    def describe(self, columns):
+        """
+        数値列の基本統計量
+
+        Parameters:
+        -----------
+        columns : list
+            数値列
+
+        Returns:
+        --------
+        pd.DataFrame : DataFrame.describe と同じ形の表
+        """
+
+    @abstractmethod
+    def correlation(self, columns):
+        """
+        数値列の相関行列（両方が欠損でない行で計算する）
+
+        Parameters:
+        -----------
+        columns : list
+            数値列
+
+        Returns:
+        --------
+        pd.DataFrame
+        """
+
+    @abstractmethod
+    def series(self, date_col, value_col, rule=None, how='mean'):
+        """
+        日時インデックスの系列を作る（timeseries_utils.prepare_series と同じ結果）
+
+        リサンプリングする場合は集計をバックエンドで行い、期間数分の結果だけを読み込む。
+
+        Parameters:
+        -----------
+        date_col, value_col : str
+            日付列と値の列
+        rule : str or None
+            リサンプリングの頻度（RESAMPLE_RULES の値）
+        how : str
+            リサンプリング時の集計方法
+
+        Returns:
+        --------
+        pd.Series
+        """
+
+    @abstractmethod
+    def group_aggregate(self, keys, value_cols, aggregations, grains=None):
+        """
+        複数のキーで複数の集計を行う（group_utils.group_aggregate と同じ形の結果）
+
+        Parameters:
+        -----------
+        keys : list
+            グループ化する列
+        value_cols : list
+            集計する数値列
+        aggregations : list
+            GROUP_AGGREGATIONS から選んだ集計方法
+        grains : dict or None
+            日時列をまとめる期間（TIME_GRAINS の値）
+
+        Returns:
+        --------
+        pd.DataFrame
+        """
+
+    def _check_aggregations(self, keys, aggregations):
+        unknown = set(aggregations) - set(group_utils.GROUP_AGGREGATIONS)
+        if unknown:
+            raise ValueError(f"未対応の集計方法です: {', '.join(sorted(unknown))}")
+        if not keys:
+            raise ValueError("グループ化する列を1つ以上選択してください")
+
+    @staticmethod
+    def _ordered_columns(keys, value_cols, aggregations):
+        ordered = list(keys)
+        for col in value_cols:
+            ordered += [f"{col}_{agg}" for agg in aggregations if agg != 'size']
+        if 'size' in aggregations:
+            ordered.append('件数')
+        return ordered
+
+
+class PandasDataset(LazyDataset):
+    """
+    pandas で必要な列だけを読み込んで実行する（条件は pyarrow で行グループ単位に適用される）
+
+    集計はメモリ上で行うため、読み込む列がメモリに収まる必要がある。
+    """
+
+    backend = 'pandas'
+
+    def _read(self, columns=None):
+        return pd.read_parquet(self.path, columns=columns, filters=self.filters or None)
+
+    def num_rows(self):
+        if not self.filters:
+            return pq.ParquetFile(self.path).metadata.num_rows
+        return len(self._read([self.arrow_schema.names[0]]))
+
+    def sample(self, columns=None, n=SAMPLE_ROWS, seed=42):
+        data = self._read(columns)
+        if len(data) <= n:
+            return data
+        return data.sample(n=n, random_state=seed).sort_index()
+
+    def column_profile(self):
+        # 1列ずつ読み込み、同時にメモリに置くのは1列分だけにする
+        return pd.concat(
+            [eda_utils.column_profile(self._read([name])) for name in self.arrow_schema.names],
+            ignore_index=True
+        )
+
+    def describe(self, columns):
+        return self._read(list(columns)).describe()
+
+    def correlation(self, columns):
+        return self._read(list(columns)).corr()
+
+    def series(self, date_col, value_col, rule=None, how='mean'):
+        columns = list(dict.fromkeys([date_col, value_col]))
+        return timeseries_utils.prepare_series(self._read(columns), date_col, value_col, rule, how)
+
+    def group_aggregate(self, keys, value_cols, aggregations, grains=None):
+        self._check_aggregations(keys, aggregations)
+        grains = grains or {}
+        data = self._read(list(dict.fromkeys(list(keys) + list(value_cols))))
+        encoded = [group_utils.encode_key(data[col], grains.get(col)) for col in keys]
+        return group_utils.group_aggregate(data, encoded, value_cols, aggregations)
+
+
+_DUCKDB_CONNECTION = None
+_DUCKDB_LOCK = threading.Lock()
+
+
+def _duckdb_connection():
+    """プロセスで共有する DuckDB の接続（クエリごとに cursor() で複製して使う）"""
+    global _DUCKDB_CONNECTION
+    with _DUCKDB_LOCK:
+        if _DUCKDB_CONNECTION is None:
+            DUCKDB_TEMP_DIR.mkdir(parents=True, exist_ok=True)
+            _DUCKDB_CONNECTION = duckdb.connect()
+            _DUCKDB_CONNECTION.execute(f"SET temp_directory = {_literal(DUCKDB_TEMP_DIR)}")
+        return _DUCKDB_CONNECTION
+
+
+class DuckDBDataset(LazyDataset):
+    """
+    DuckDB の SQL で実行する
+
+    Parquet の列と行グループの統計を使って必要な部分だけを読み、メモリに収まらない
+    集計は DUCKDB_TEMP_DIR に書き出しながら処理する。四分位数とユニーク値数は近似値。
+    """
+
+    backend = 'duckdb'
+
+    def __init__(self, path, filters=None):
+        if not DUCKDB_AVAILABLE:
+            raise ImportError("duckdb がインストールされていません。'pip install duckdb' を実行してください。")
+        super().__init__(path, filters)
+
+    def _source(self, row_numbers=False):
+        options = ", file_row_number = true" if row_numbers else ""
+        return f"read_parquet({_literal(self.path)}{options})"
+
+    def _where(self, extra=None):
+        conditions = [f"{_quote(column)} {'=' if operator == '==' else operator} ?"
+                      for column, operator, _ in self.filters]
+        conditions += extra or []
+        params = [value for *_, value in self.filters]
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def _query(self, sql, params=()):
+        cursor = _duckdb_connection().cursor()
+        try:
+            return cursor.execute(sql, list(params)).fetchdf()
+        finally:
+            cursor.close()
+
+    def num_rows(self):
+        where, params = self._where()
+        return int(self._query(f"SELECT count(*) AS n FROM {self._source()}{where}", params)['n'][0])
+
+    def sample(self, columns=None, n=SAMPLE_ROWS, seed=42):
+        columns = list(columns) if columns is not None else self.arrow_schema.names
+        projection = ", ".join(_quote(col) for col in columns)
+        where, params = self._where()
+        sql = (
+            f"SELECT {projection} FROM ("
+            f"SELECT {projection}, file_row_number FROM {self._source(row_numbers=True)}{where}"
+            f") USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({int(seed)}) "
+            f"ORDER BY file_row_number"
+        )
+        return self._query(sql, params)
+
+    def column_profile(self):
+        names = self.arrow_schema.names
+        selections = ["count(*) AS n"]
+        for i, name in enumerate(names):
+            selections += [f"count({_quote(name)}) AS c{i}", f"approx_count_distinct({_quote(name)}) AS u{i}"]
+        where, params = self._where()
+        row = self._query(f"SELECT {', '.join(selections)} FROM {self._source()}{where}", params).iloc[0]
+        unique = [int(row[f"u{i}"]) for i in range(len(names))]
+        small = [i for i in range(len(names)) if unique[i] <= EXACT_DISTINCT_MAX]
+        if small:
+            exact = self._query(
+                f"SELECT {', '.join(f'count(DISTINCT {_quote(names[i])}) AS u{i}' for i in small)} "
+                f"FROM {self._source()}{where}", params
+            ).iloc[0]
+            for i in small:
+                unique[i] = int(exact[f"u{i}"])
+
+        total = int(row['n'])
+        non_null = np.array([int(row[f"c{i}"]) for i in range(len(names))])
+        null_count = total - non_null
+        return pd.DataFrame({
+            '列名': names,
+            'データ型': [str(field.type) for field in self.arrow_schema],
+            '非null数': non_null,
+            'null値数': null_count,
+            'null割合(%)': np.round(null_count / max(total, 1) * 100, 2),
+            # 近似値は非null数を超えることがあるため、非null数で抑える
+            'ユニーク値数': np.minimum(unique, non_null),
+        })
+
+    def describe(self, columns):
+        columns = list(columns)
+        stats = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        templates = [
+            'count({0})', 'avg(CAST({0} AS DOUBLE))', 'stddev_samp(CAST({0} AS DOUBLE))', 'min(CAST({0} AS DOUBLE))',
+            'approx_quantile(CAST({0} AS DOUBLE), 0.25)', 'approx_quantile(CAST({0} AS DOUBLE), 0.5)',
+            'approx_quantile(CAST({0} AS DOUBLE), 0.75)', 'max(CAST({0} AS DOUBLE))',
+        ]
+        selections = [template.format(_quote(col)) + f" AS s{i}_{j}"
+                      for i, col in enumerate(columns) for j, template in enumerate(templates)]
+        where, params = self._where()
+        row = self._query(f"SELECT {', '.join(selections)} FROM {self._source()}{where}", params).iloc[0]
+        return pd.DataFrame(
+            {col: [float(row[f"s{i}_{j}"]) if pd.notna(row[f"s{i}_{j}"]) else np.nan
+                   for j in range(len(stats))]
+             for i, col in enumerate(columns)},
+            index=stats
+        )
+
+    def correlation(self, columns):
+        columns = list(columns)
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+        matrix = np.eye(len(columns))
+        if pairs:
+            selections = [f"corr(CAST({_quote(columns[i])} AS DOUBLE), CAST({_quote(columns[j])} AS DOUBLE)) AS r{k}"
+                          for k, (i, j) in enumerate(pairs)]
+            where, params = self._where()
+            row = self._query(f"SELECT {', '.join(selections)} FROM {self._source()}{where}", params).iloc[0]
+            for k, (i, j) in enumerate(pairs):
+                value = row[f"r{k}"]
+                matrix[i, j] = matrix[j, i] = float(value) if pd.notna(value) else np.nan
+        return pd.DataFrame(matrix, index=columns, columns=columns)
+
+    def series(self, date_col, value_col, rule=None, how='mean'):
+        date = f"TRY_CAST({_quote(date_col)} AS TIMESTAMP)"
+        value = f"CAST({_quote(value_col)} AS DOUBLE)"
+        where, params = self._where([f"{date} IS NOT NULL"])
+        if rule is None:
+            sql = (f"SELECT {date} AS d, {value} AS v FROM {self._source(row_numbers=True)}{where} "
+                   f"ORDER BY d, file_row_number")
+        else:
+            bucket = f"date_trunc('{_DUCKDB_UNITS[rule]}', {date})"
+            if rule == 'W':
+                # pandas の 'W' は日曜日で終わる週を、その日曜日の日付で表す
+                bucket = f"({bucket} + INTERVAL 6 DAY)"
+            # 'last' は prepare_series と同じく時刻順（同時刻はファイルの行順）で最後の値
+            aggregate = ("arg_max(v, (t, file_row_number)) FILTER (WHERE v IS NOT NULL)" if how == 'last'
+                         else _SQL_AGGREGATIONS[how].format('v') if how in _SQL_AGGREGATIONS else f"{how}(v)")
+            sql = (f"SELECT d, {aggregate} AS v FROM ("
+                   f"SELECT {bucket} AS d, {date} AS t, {value} AS v, file_row_number "
+                   f"FROM {self._source(row_numbers=True)}{where}) GROUP BY d ORDER BY d")
+        result = self._query(sql, params)
+        series = pd.Series(result['v'].to_numpy(dtype=np.float64),
+                           index=pd.DatetimeIndex(result['d'], name=date_col).as_unit('ns'), name=value_col)
+        return series if rule is None else _fill_resampled(series, rule, how)
+
+    def group_aggregate(self, keys, value_cols, aggregations, grains=None):
+        self._check_aggregations(keys, aggregations)
+        grains = grains or {}
+        key_exprs = []
+        for col in keys:
+            grain = grains.get(col)
+            if grain is None:
+                key_exprs.append(f"{_quote(col)} AS {_quote(col)}")
+            else:
+                key_exprs.append(f"date_trunc('{_DUCKDB_UNITS[grain]}', TRY_CAST({_quote(col)} AS TIMESTAMP)) AS {_quote(col)}")
+        selections = list(key_exprs)
+        for col in value_cols:
+            for agg in aggregations:
+                if agg != 'size':
+                    selections.append(_SQL_AGGREGATIONS[agg].format(_quote(col)) + f" AS {_quote(f'{col}_{agg}')}")
+        if 'size' in aggregations:
+            selections.append("count(*) AS \"件数\"")
+
+        # キーに欠損のある行は除外する（group_utils.group_aggregate と同じ）
+        where, params = self._where([f"{_quote(col)} IS NOT NULL" for col in keys])
+        positions = ", ".join(str(i + 1) for i in range(len(keys)))
+        sql = (f"SELECT {', '.join(selections)} FROM {self._source()}{where} "
+               f"GROUP BY {positions} ORDER BY {positions}")
+        result = self._query(sql, params)
+        for col in value_cols:
+            if 'count' in aggregations:
+                result[f"{col}_count"] = result[f"{col}_count"].astype(np.int64)
+        if 'size' in aggregations:
+            result['件数'] = result['件数'].astype(np.int64)
+        return result[self._ordered_columns(keys, value_cols, aggregations)]
+
+
+def _polars_collect(frame):
+    """ストリーミングエンジンで実行する（古い Polars では streaming=True を使う）"""
+    try:
+        return frame.collect(engine='streaming')
+    except TypeError:
+        return frame.collect(streaming=True)
+
+
+class PolarsDataset(LazyDataset):
+    """
+    Polars の LazyFrame で実行する
+
+    scan_parquet の遅延クエリに条件と列の選択を渡し、ストリーミングエンジンで
+    チャンクごとに処理する。ユニーク値数は近似値。
+    """
+
+    backend = 'polars'
+
+    def __init__(self, path, filters=None):
+        if not POLARS_AVAILABLE:
+            raise ImportError("polars がインストールされていません。'pip install polars' を実行してください。")
+        super().__init__(path, filters)
+
+    def _scan(self):
+        frame = pl.scan_parquet(self.path)
+        operators = {
+            '==': lambda c, v: c == v, '!=': lambda c, v: c != v,
+            '<': lambda c, v: c < v, '<=': lambda c, v: c <= v,
+            '>': lambda c, v: c > v, '>=': lambda c, v: c >= v,
+        }
+        for column, operator, value in self.filters:
+            frame = frame.filter(operators[operator](pl.col(column), value))
+        return frame
+
+    def _datetime(self, column):
+        expr = pl.col(column)
+        if self.schema.get(column) == 'category':
+            return expr.cast(pl.Utf8).str.to_datetime(strict=False)
+        return expr.cast(pl.Datetime)
+
+    def num_rows(self):
+        return int(_polars_collect(self._scan().select(pl.len())).item())
+
+    def sample(self, columns=None, n=SAMPLE_ROWS, seed=42):
+        columns = list(columns) if columns is not None else self.arrow_schema.names
+        frame = self._scan().select(columns)
+        total = self.num_rows()
+        if total > n:
+            rows = np.sort(np.random.default_rng(seed).choice(total, size=n, replace=False))
+            frame = (frame.with_row_index('__row__')
+                     .filter(pl.col('__row__').is_in(rows.tolist()))
+                     .drop('__row__'))
+        return _polars_collect(frame).to_pandas()
+
+    def column_profile(self):
+        names = self.arrow_schema.names
+        selections = [pl.len().alias('n')]
+        for i, name in enumerate(names):
+            selections += [pl.col(name).count().alias(f"c{i}"),
+                           pl.col(name).drop_nulls().approx_n_unique().alias(f"u{i}")]
+        row = _polars_collect(self._scan().select(selections)).row(0, named=True)
+        unique = [int(row[f"u{i}"]) for i in range(len(names))]
+        small = [i for i in range(len(names)) if unique[i] <= EXACT_DISTINCT_MAX]
+        if small:
+            exact = _polars_collect(self._scan().select(
+                [pl.col(names[i]).drop_nulls().n_unique().alias(f"u{i}") for i in small]
+            )).row(0, named=True)
+            for i in small:
+                unique[i] = int(exact[f"u{i}"])
+
+        total = int(row['n'])
+        non_null = np.array([int(row[f"c{i}"]) for i in range(len(names))])
+        null_count = total - non_null
+        return pd.DataFrame({
+            '列名': names,
+            'データ型': [str(field.type) for field in self.arrow_schema],
+            '非null数': non_null,
+            'null値数': null_count,
+            'null割合(%)': np.round(null_count / max(total, 1) * 100, 2),
+            # 近似値は非null数を超えることがあるため、非null数で抑える
+            'ユニーク値数': np.minimum(unique, non_null),
+        })
+
+    def describe(self, columns):
+        columns = list(columns)
+        stats = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        selections = []
+        for i, col in enumerate(columns):
+            x = pl.col(col).cast(pl.Float64)
+            expressions = [pl.col(col).count(), x.mean(), x.std(), x.min(),
+                           x.quantile(0.25, 'linear'), x.quantile(0.5, 'linear'), x.quantile(0.75, 'linear'), x.max()]
+            selections += [expr.alias(f"s{i}_{j}") for j, expr in enumerate(expressions)]
+        row = _polars_collect(self._scan().select(selections)).row(0, named=True)
+        return pd.DataFrame(
+            {col: [np.nan if row[f"s{i}_{j}"] is None else float(row[f"s{i}_{j}"]) for j in range(len(stats))]
+             for i, col in enumerate(columns)},
+            index=stats
+        )
+
+    def correlation(self, columns):
+        columns = list(columns)
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+        matrix = np.eye(len(columns))
+        if pairs:
+            selections = [pl.corr(pl.col(columns[i]).cast(pl.Float64), pl.col(columns[j]).cast(pl.Float64)).alias(f"r{k}")
+                          for k, (i, j) in enumerate(pairs)]
+            row = _polars_collect(self._scan().select(selections)).row(0, named=True)
+            for k, (i, j) in enumerate(pairs):
+                value = row[f"r{k}"]
+                matrix[i, j] = matrix[j, i] = np.nan if value is None else float(value)
+        return pd.DataFrame(matrix, index=columns, columns=columns)
+
+    def series(self, date_col, value_col, rule=None, how='mean'):
+        frame = (self._scan()
+                 .select(self._datetime(date_col).alias('d'), pl.col(value_col).cast(pl.Float64).alias('v'))
+                 .filter(pl.col('d').is_not_null()))
+        if rule is None:
+            frame = frame.sort('d', maintain_order=True)
+        else:
+            bucket = pl.col('d').dt.truncate(_POLARS_UNITS[rule])
+            if rule == 'W':
+                # pandas の 'W' は日曜日で終わる週を、その日曜日の日付で表す
+                bucket = bucket + pl.duration(days=6)
+            aggregate = {
+                'mean': pl.col('v').mean(), 'sum': pl.col('v').sum(), 'min': pl.col('v').min(),
+                'max': pl.col('v').max(), 'last': pl.col('v').drop_nulls().last(),
+            }[how]
+            if how == 'last':
+                # prepare_series と同じく時刻順（同時刻はファイルの行順）で最後の値を取る
+                frame = frame.sort('d', maintain_order=True)
+            frame = frame.group_by(bucket.alias('d')).agg(aggregate.alias('v')).sort('d')
+        result = _polars_collect(frame).to_pandas()
+        series = pd.Series(result['v'].to_numpy(dtype=np.float64),
+                           index=pd.DatetimeIndex(result['d'], name=date_col).as_unit('ns'), name=value_col)
+        return series if rule is None else _fill_resampled(series, rule, how)
+
+    def group_aggregate(self, keys, value_cols, aggregations, grains=None):
+        self._check_aggregations(keys, aggregations)
+        grains = grains or {}
+        key_exprs = []
+        for col in keys:
+            grain = grains.get(col)
+            if grain is None:
+                key_exprs.append(pl.col(col))
+            else:
+                key_exprs.append(self._datetime(col).dt.truncate(_POLARS_UNITS[grain]).alias(col))
+
+        selections = []
+        for col in value_cols:
+            x = pl.col(col).cast(pl.Float64)
+            expressions = {
+                'mean': x.mean(), 'sum': x.sum(), 'count': pl.col(col).count().cast(pl.Int64),
+                'min': x.min(), 'max': x.max(), 'std': x.std(), 'median': x.median(),
+            }
+            selections += [expressions[agg].alias(f"{col}_{agg}") for agg in aggregations if agg != 'size']
+        if 'size' in aggregations:
+            selections.append(pl.len().cast(pl.Int64).alias('件数'))
+
+        # キーに欠損のある行は除外する（group_utils.group_aggregate と同じ）
+        frame = self._scan().with_columns(key_exprs)
+        for col in keys:
+            frame = frame.filter(pl.col(col).is_not_null())
+        frame = frame.group_by(list(keys)).agg(selections).sort(list(keys))
+        result = _polars_collect(frame).to_pandas()
+        return result[self._ordered_columns(keys, value_cols, aggregations)]
+
+
+def open_dataset(path, backend='duckdb', filters=None):
+    """
+    Parquet ファイルを指定したバックエンドで開く
+
+    Parameters:
+    -----------
+    path : str or Path
+        Parquet ファイル
+    backend : str
+        'pandas', 'duckdb', 'polars' のいずれか
+    filters : list of tuple or None
+        (列名, 演算子, 値) の条件
+
+    Returns:
+    --------
+    LazyDataset
+    """
+    classes = {'pandas': PandasDataset, 'duckdb': DuckDBDataset, 'polars': PolarsDataset}
+    if backend not in classes:
+        raise ValueError(f"未対応のバックエンドです: {backend}")
+    return classes[backend](path, filters)
@@ -0,0 +1,174 @@
+"""
+Claude API の疑似サーバー
+Messages API（/v1/messages）と同じ形式で、質問に含まれる語ごとに決まった応答を
+返す。ストリーミング（SSE）にも対応し、API キーなしで動作確認できる
+
+使い方:
+    python fake_claude_server.py --port 8765 --responses responses.json
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 streamlit run claude_data_assistant.py
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import claude_client
+
+# ストリーミングで1イベントに載せる文字数
+CHUNK_CHARS = 16
+
+
+def _message(text, model):
+    return {
+        'id': f"msg_{uuid.uuid4().hex[:24]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': model,
+        'content': [{'type': 'text', 'text': text}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 0, 'output_tokens': len(text)},
+    }
+
+
+def _stream_events(text, model):
+    """応答を Messages API のストリーミングイベントの列にする"""
+    message = _message("", model)
+    message['content'] = []
+    message['stop_reason'] = None
+    yield 'message_start', {'type': 'message_start', 'message': message}
+    yield 'content_block_start', {'type': 'content_block_start', 'index': 0,
+                                  'content_block': {'type': 'text', 'text': ''}}
+    for start in range(0, len(text), CHUNK_CHARS):
+        yield 'content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                      'delta': {'type': 'text_delta', 'text': text[start:start + CHUNK_CHARS]}}
+    yield 'content_block_stop', {'type': 'content_block_stop', 'index': 0}
+    yield 'message_delta', {'type': 'message_delta',
+                            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                            'usage': {'output_tokens': len(text)}}
+    yield 'message_stop', {'type': 'message_stop'}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.fake.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.split('?')[0] != '/v1/messages':
+            self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+        fake.requests.append(body)
+        text = fake.stub.messages.reply_text(**body)
+        model = body.get('model', 'fake')
+        if not body.get('stream'):
+            self._send_json(200, _message(text, model))
+            return
+
+        # 長さが決まらないので chunked 転送で送り、接続は使い回せるようにする
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event, data in _stream_events(text, model):
+            payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+            if fake.delay and event == 'content_block_delta':
+                time.sleep(fake.delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeClaudeServer:
+    """
+    Messages API の疑似サーバー
+
+    with 文で起動・停止でき、url を anthropic.Anthropic(base_url=...) または
+    環境変数 ANTHROPIC_BASE_URL に指定して使う。
+
+    Parameters:
+    -----------
+    responses : dict or None
+        質問に含まれる語と、そのときに返す応答（claude_client.StubClient と同じ形式）
+    host : str
+    port : int
+        0 の場合は空いているポートを使う
+    delay : float
+        ストリーミングで断片ごとに待つ秒数（応答の遅延を再現する）
+
+    Attributes:
+    -----------
+    requests : list
+        受け取ったリクエストの本文
+    connections : int
+        受け付けた TCP 接続の数（接続が使い回されているかの確認用）
+    """
+
+    def __init__(self, responses=None, host='127.0.0.1', port=0, delay=0.0):
+        self.stub = claude_client.StubClient(responses)
+        self.delay = delay
+        self.requests = []
+        self.connections = 0
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """現在のスレッドで待ち受ける（Ctrl+C で終了）"""
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Claude API の疑似サーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--responses', help="質問に含まれる語と応答の JSON ファイル")
+    parser.add_argument('--delay', type=float, default=0.0, help="断片ごとの遅延（秒）")
+    args = parser.parse_args()
+
+    server = FakeClaudeServer(claude_client.load_stub_responses(args.responses),
+                              host=args.host, port=args.port, delay=args.delay)
+    print(f"疑似サーバーを起動しました: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
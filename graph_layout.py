@@ -0,0 +1,334 @@
+"""
+グラフレイアウトエンジン
+レイアウト計算をキャッシュし、大規模グラフ向けの高速なアルゴリズムを提供する
+"""
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import sparse
+from scipy.sparse.linalg import eigsh, ArpackNoConvergence
+
+from cache_utils import LRUCache
+from network_utils import graph_fingerprint, to_csr, to_simple_graph
+
+LAYOUT_METHODS = ['spring', 'barnes_hut', 'spectral', 'circular', 'kamada_kawai', 'shell']
+
+# 計算量の大きいレイアウトを使えるノード数の上限（超える場合は barnes_hut に切り替える）
+SPRING_MAX_NODES = 2_000
+KAMADA_KAWAI_MAX_NODES = 1_000
+
+# 斥力のグリッド分割の最大の深さと、ノード同士を厳密に計算する最大ノード数
+# （最大の深さでも分けきれないほど密集したセルは、セルの重心からの斥力で近似する）
+REPULSION_MAX_DEPTH = 4
+REPULSION_EXACT_MAX_NODES = 512
+
+# ウォームスタートを行う条件（直前のレイアウトとのノード・エッジの重なり）
+WARM_START_MIN_NODE_OVERLAP = 0.9
+WARM_START_MIN_EDGE_OVERLAP = 0.8
+
+# グラフの指紋・レイアウト手法・パラメータごとの座標キャッシュ
+_LAYOUT_CACHE = LRUCache(maxsize=16)
+# ウォームスタート用に手法ごとの直前のレイアウトを保持する
+_LAST_LAYOUTS = LRUCache(maxsize=len(LAYOUT_METHODS))
+
+
+def resolve_layout_method(G, method):
+    """
+    グラフの規模に応じて実際に使うレイアウト手法を返す
+
+    spring と kamada_kawai はノード数が多いと O(n²) のメモリ・計算量になるため
+    barnes_hut に切り替える。
+    """
+    if method not in LAYOUT_METHODS:
+        raise ValueError(f"未対応のレイアウトです: {method}")
+    num_nodes = G.number_of_nodes()
+    if method == 'spring' and num_nodes > SPRING_MAX_NODES:
+        return 'barnes_hut'
+    if method == 'kamada_kawai' and num_nodes > KAMADA_KAWAI_MAX_NODES:
+        return 'barnes_hut'
+    return method
+
+
+def _undirected_edges(matrix):
+    """隣接行列から自己ループを除いた無向エッジ（i < j）を返す"""
+    upper = sparse.triu(matrix + matrix.T, k=1).tocoo()
+    return upper.row.astype(np.int64), upper.col.astype(np.int64)
+
+
+def _grid_repulsion(pos, k, cell_capacity=64, depth=0):
+    """
+    グリッド分割で斥力を近似する（深さを固定した四分木に相当）
+
+    異なるセル間の斥力はセルの重心同士の相互作用として近似する。ノードが集中した
+    セルは REPULSION_MAX_DEPTH まで再帰的にさらに分割し、十分小さいセル内のノード
+    同士は厳密に計算する。最大の深さでも REPULSION_EXACT_MAX_NODES を超えるノードが
+    残るセルや、それ以上分割できない（座標が重なった）セルは、O(m²) の配列を
+    作らないよう、セルの重心に集めた残りのノードからの斥力で近似する。
+    """
+    num_nodes = len(pos)
+    grid_size = int(np.clip(np.ceil(np.sqrt(num_nodes / cell_capacity)), 1, 32))
+    lower = pos.min(axis=0)
+    raw_span = float((pos.max(axis=0) - lower).max())
+    if grid_size == 1 or depth >= REPULSION_MAX_DEPTH or raw_span <= 1e-9:
+        if num_nodes <= REPULSION_EXACT_MAX_NODES:
+            delta = pos[:, None, :] - pos[None, :, :]
+            dist2 = np.maximum((delta ** 2).sum(axis=-1), 1e-9)
+            strength = k * k / dist2
+            np.fill_diagonal(strength, 0.0)
+            return (delta * strength[..., None]).sum(axis=1)
+        delta = pos - pos.mean(axis=0)
+        dist2 = np.maximum((delta ** 2).sum(axis=1), 1e-9)
+        return delta * ((num_nodes - 1) * k * k / dist2)[:, None]
+
+    span = raw_span
+    cell_xy = np.minimum(((pos - lower) / span * grid_size).astype(np.int64), grid_size - 1)
+    cell = cell_xy[:, 0] * grid_size + cell_xy[:, 1]
+
+    # セルの質量（ノード数）と重心
+    _, cell_index, mass = np.unique(cell, return_inverse=True, return_counts=True)
+    centers = np.column_stack([
+        np.bincount(cell_index, weights=pos[:, 0]),
+        np.bincount(cell_index, weights=pos[:, 1]),
+    ]) / mass[:, None]
+
+    # 遠方：セル重心同士の斥力（自セルは除外）
+    delta = centers[:, None, :] - centers[None, :, :]
+    dist2 = np.maximum((delta ** 2).sum(axis=-1), 1e-9)
+    strength = mass[None, :] * k * k / dist2
+    np.fill_diagonal(strength, 0.0)
+    cell_force = (delta * strength[..., None]).sum(axis=1)
+    displacement = cell_force[cell_index]
+
+    # 近傍：同一セル内のノード同士は再帰的に計算する
+    order = np.argsort(cell_index, kind='stable')
+    boundaries = np.cumsum(mass)[:-1]
+    for members in np.split(order, boundaries):
+        if len(members) < 2:
+            continue
+        displacement[members] += _grid_repulsion(pos[members], k, cell_capacity, depth + 1)
+
+    return displacement
+
+
+def barnes_hut_layout(matrix, pos=None, iterations=50, temperature=0.1, seed=42,
+                      cell_capacity=64):
+    """
+    Barnes-Hut 近似による Fruchterman-Reingold 型の力学モデルレイアウト
+
+    斥力はグリッド分割で近似し、引力はエッジ配列のベクトル演算で計算するため
+    10⁵ ノード規模でも現実的な時間で計算できる。
+
+    Parameters:
+    -----------
+    matrix : scipy.sparse.csr_matrix
+        隣接行列
+    pos : np.ndarray or None
+        初期座標（n×2、[0, 1] の範囲）。None の場合はランダムに配置する
+    iterations : int
+        反復回数
+    temperature : float
+        1反復あたりの最大移動量の初期値（反復ごとに線形に減衰する）
+    seed : int
+        乱数シード
+    cell_capacity : int
+        1セルあたりの平均ノード数の目安
+
+    Returns:
+    --------
+    np.ndarray : n×2 の座標（[-1, 1] に正規化済み）
+    """
+    num_nodes = matrix.shape[0]
+    rng = np.random.default_rng(seed)
+    if pos is None:
+        pos = rng.random((num_nodes, 2))
+    else:
+        pos = np.asarray(pos, dtype=np.float64).copy()
+    if num_nodes <= 1:
+        return np.zeros((num_nodes, 2))
+
+    # 同じ座標のノード（ウォームスタートで同じ位置に置いた新しいノードなど）は
+    # 斥力の向きが決まらず分離できないため、わずかにずらしておく
+    _, inverse, counts = np.unique(pos, axis=0, return_inverse=True, return_counts=True)
+    duplicated = counts[inverse.ravel()] > 1
+    if duplicated.any():
+        scale = 1e-6 * max(float(np.ptp(pos, axis=0).max()), 1.0)
+        pos[duplicated] += rng.normal(scale=scale, size=(int(duplicated.sum()), 2))
+
+    row, col = _undirected_edges(matrix)
+    k = np.sqrt(1.0 / num_nodes)
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        displacement = _grid_repulsion(pos, k, cell_capacity)
+
+        # 引力：エッジの両端を距離²/k の力で引き寄せる
+        delta = pos[row] - pos[col]
+        dist = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), 1e-9)
+        force = delta * (dist / k)[:, None]
+        for axis in range(2):
+            displacement[:, axis] -= np.bincount(row, weights=force[:, axis], minlength=num_nodes)
+            displacement[:, axis] += np.bincount(col, weights=force[:, axis], minlength=num_nodes)
+
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-9)
+        pos += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    return nx.rescale_layout(pos)
+
+
+def sparse_spectral_layout(matrix, seed=42):
+    """
+    疎行列の固有値計算によるスペクトルレイアウト
+
+    正規化ラプラシアンの最小非自明固有ベクトル2本を座標とする。
+    密行列を作らないため 10⁵ ノード規模でも計算できる。
+
+    Returns:
+    --------
+    np.ndarray : n×2 の座標（[-1, 1] に正規化済み）
+    """
+    num_nodes = matrix.shape[0]
+    if num_nodes < 4:
+        angles = np.linspace(0, 2 * np.pi, num_nodes, endpoint=False)
+        return np.column_stack([np.cos(angles), np.sin(angles)])
+
+    adjacency = matrix + matrix.T
+    adjacency.data = np.ones_like(adjacency.data)
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    degree[degree == 0] = 1
+    inv_sqrt = sparse.diags(1.0 / np.sqrt(degree))
+
+    # (I + D^-1/2 A D^-1/2) / 2 の最大固有ベクトルは正規化ラプラシアンの最小固有ベクトルに対応する
+    operator = (sparse.identity(num_nodes) + inv_sqrt @ adjacency @ inv_sqrt) / 2
+    v0 = np.random.default_rng(seed).random(num_nodes)
+    try:
+        values, vectors = eigsh(operator, k=3, which='LA', v0=v0, tol=1e-4)
+    except ArpackNoConvergence as e:
+        if e.eigenvectors.shape[1] < 3:
+            raise
+        values, vectors = e.eigenvalues, e.eigenvectors
+
+    order = np.argsort(values)[::-1]
+    coords = vectors[:, order[1:3]] / np.sqrt(degree)[:, None]
+    return nx.rescale_layout(coords)
+
+
+def _edge_keys(matrix, index_map=None, num_prev=None):
+    """無向エッジを整数キーに変換する（index_map で別のノード番号体系に写像できる）"""
+    row, col = _undirected_edges(matrix)
+    if index_map is not None:
+        row, col = index_map[row], index_map[col]
+        known = (row >= 0) & (col >= 0)
+        row, col = np.minimum(row[known], col[known]), np.maximum(row[known], col[known])
+        return np.unique(row * num_prev + col)
+    return np.unique(row * matrix.shape[0] + col)
+
+
+def _warm_start_positions(method, matrix, nodes, seed):
+    """
+    直前のレイアウトとグラフがほぼ同じなら、その座標から初期配置を作る
+
+    新しく追加されたノードは、既に座標のある隣接ノードの重心付近に配置する。
+
+    Returns:
+    --------
+    np.ndarray or None : n×2 の初期座標（[0, 1] の範囲）。条件を満たさない場合は None
+    """
+    previous = _LAST_LAYOUTS.get(method)
+    if previous is None:
+        return None
+    prev_nodes, prev_pos, prev_edges = previous
+
+    index_map = pd.Index(prev_nodes).get_indexer(pd.Index(nodes))
+    known = index_map >= 0
+    node_overlap = known.sum() / max(len(nodes), len(prev_nodes), 1)
+    if node_overlap < WARM_START_MIN_NODE_OVERLAP:
+        return None
+
+    edges = _edge_keys(matrix, index_map, len(prev_nodes))
+    num_edges = len(_undirected_edges(matrix)[0])
+    edge_overlap = (len(np.intersect1d(edges, prev_edges, assume_unique=True))
+                    / max(num_edges, len(prev_edges), 1))
+    if edge_overlap < WARM_START_MIN_EDGE_OVERLAP:
+        return None
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((len(nodes), 2))
+    pos[known] = (prev_pos[index_map[known]] + 1) / 2
+
+    # 新規ノードは座標既知の隣接ノードの重心に少し揺らぎを加えて配置する
+    adjacency = (matrix + matrix.T).tocsr()
+    for node in np.flatnonzero(~known):
+        neighbors = adjacency.indices[adjacency.indptr[node]:adjacency.indptr[node + 1]]
+        neighbors = neighbors[known[neighbors]]
+        if len(neighbors) > 0:
+            pos[node] = pos[neighbors].mean(axis=0) + rng.normal(scale=0.01, size=2)
+    return pos
+
+
+def compute_layout(G, method='spring', seed=42, iterations=50, warm_start=True, **kwargs):
+    """
+    グラフのレイアウトを計算する（結果はキャッシュされる）
+
+    グラフの指紋・手法・パラメータが同じであればキャッシュした座標を返す。
+    barnes_hut / spring では、直前に計算したレイアウトとグラフがほぼ同じ場合に
+    その座標から少ない反復回数で再計算する（ウォームスタート）。
+
+    Parameters:
+    -----------
+    G : グラフ（NetworkX または CSRGraph）
+    method : str
+        LAYOUT_METHODS のいずれか（規模に応じて resolve_layout_method で切り替わる）
+    seed : int
+        乱数シード
+    iterations : int
+        力学モデルの反復回数
+    warm_start : bool
+        ウォームスタートを行うかどうか
+    **kwargs :
+        NetworkX のレイアウト関数に渡す追加引数
+
+    Returns:
+    --------
+    dict : ノードと座標（np.ndarray）の対応
+    """
+    method = resolve_layout_method(G, method)
+    key = (graph_fingerprint(G), method, seed, iterations, tuple(sorted(kwargs.items())))
+    pos = _LAYOUT_CACHE.get(key)
+    if pos is not None:
+        return pos
+
+    matrix, nodes = to_csr(G)
+    init = None
+    if warm_start and method in ('barnes_hut', 'spring'):
+        init = _warm_start_positions(method, matrix, nodes, seed)
+
+    if method == 'barnes_hut':
+        if init is not None:
+            coords = barnes_hut_layout(matrix, pos=init, iterations=max(10, iterations // 4),
+                                       temperature=0.02, seed=seed)
+        else:
+            coords = barnes_hut_layout(matrix, iterations=iterations, seed=seed)
+    elif method == 'spectral':
+        coords = sparse_spectral_layout(matrix, seed=seed)
+    else:
+        H = to_simple_graph(G)
+        if method == 'spring':
+            init_pos = None if init is None else dict(zip(nodes.tolist(), init))
+            nx_pos = nx.spring_layout(H, pos=init_pos, seed=seed,
+                                      iterations=iterations if init is None else max(10, iterations // 4),
+                                      **kwargs)
+        elif method == 'circular':
+            nx_pos = nx.circular_layout(H, **kwargs)
+        elif method == 'kamada_kawai':
+            nx_pos = nx.kamada_kawai_layout(H, **kwargs)
+        else:
+            nx_pos = nx.shell_layout(H, **kwargs)
+        coords = np.array([nx_pos[node] for node in nodes.tolist()]).reshape(-1, 2)
+
+    pos = dict(zip(nodes.tolist(), coords))
+    _LAYOUT_CACHE.set(key, pos)
+    if method in ('barnes_hut', 'spring'):
+        _LAST_LAYOUTS.set(method, (nodes, coords, _edge_keys(matrix)))
+    return pos
@@ -0,0 +1,313 @@
+"""
+グループ集計ユーティリティ
+カテゴリコード化したキーで複数列・複数集計を行い、大規模データは部分集計を積み上げて処理する関数群
+"""
+
+import numpy as np
+import pandas as pd
+
+GROUP_AGGREGATIONS = ['mean', 'sum', 'count', 'min', 'max', 'std', 'median', 'size']
+
+# 日時列をキーにする場合のまとめ方（表示名と pandas の期間文字列）
+TIME_GRAINS = {
+    'そのまま': None,
+    '日': 'D',
+    '週': 'W',
+    '月': 'M',
+    '四半期': 'Q',
+    '年': 'Y',
+}
+
+# 1回に集計する行数（一時配列のメモリ使用量を抑える）
+DEFAULT_CHUNK_ROWS = 2_000_000
+# キーの組み合わせ数がこれ以下なら、組み合わせ番号をそのまま配列の位置として集計する
+DENSE_GROUP_LIMIT = 1_000_000
+# 組み合わせ番号の位置で集計する場合に確保する配列の合計サイズの上限（バイト）
+# 値の列ごとに5種類の集計をチャンク分と累計分で持つため、列が多いほど上限の組み合わせ数は小さくなる
+DENSE_GROUP_BYTES = 256 * 1024**2
+_DENSE_ARRAYS_PER_COLUMN = 10
+
+
+def _dense_group_limit(num_value_cols):
+    """値の列数に応じた、組み合わせ番号の位置で集計する組み合わせ数の上限"""
+    arrays = 2 + _DENSE_ARRAYS_PER_COLUMN * num_value_cols
+    return min(DENSE_GROUP_LIMIT, DENSE_GROUP_BYTES // (8 * arrays))
+
+
+class GroupKey:
+    """
+    グループ化キーの整数コードと値の対応
+
+    Parameters:
+    -----------
+    name : str
+        列名
+    codes : np.ndarray
+        各行のコード（欠損は -1）
+    labels : pd.Index
+        コードに対応する値（昇順）
+    """
+
+    def __init__(self, name, codes, labels):
+        self.name = name
+        self.codes = codes
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def encode_key(series, grain=None):
+    """
+    列をグループ化キーのコードに変換する
+
+    カテゴリ型の列は既存のコードをそのまま使い、それ以外は pd.factorize で
+    一度だけハッシュ化する。結果を再利用すれば、再実行のたびに文字列を
+    ハッシュし直す必要がない。
+
+    Parameters:
+    -----------
+    series : pd.Series
+        キーにする列
+    grain : str or None
+        日時列をまとめる期間（TIME_GRAINS の値）
+
+    Returns:
+    --------
+    GroupKey : キーのコードと値の対応
+    """
+    if grain is not None:
+        periods = pd.to_datetime(series).dt.to_period(grain)
+        codes, labels = pd.factorize(periods, sort=True)
+        labels = pd.PeriodIndex(labels).to_timestamp()
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        codes, labels = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, labels = pd.factorize(series, sort=True)
+    return GroupKey(series.name, np.asarray(codes), pd.Index(labels, name=series.name))
+
+
+def _combine_codes(keys, rows):
+    """複数キーのコードを混合基数で1つの組み合わせ番号にまとめる"""
+    combined = np.zeros(rows.stop - rows.start, dtype=np.int64)
+    valid = np.ones(len(combined), dtype=bool)
+    for key in keys:
+        codes = key.codes[rows]
+        valid &= codes >= 0
+        combined = combined * len(key) + codes
+    return combined[valid], valid
+
+
+def _chunk_partials(keys, values, rows, dense_size):
+    """1チャンク分の行数・件数・合計・二乗和・最小・最大を組み合わせ番号ごとに集計する"""
+    combined, valid = _combine_codes(keys, rows)
+    if dense_size is not None:
+        ids, group_ids, size = combined, None, dense_size
+    else:
+        ids, group_ids = pd.factorize(combined)
+        size = len(group_ids)
+
+    partials = {'rows': np.bincount(ids, minlength=size)}
+    for name, (column, shift) in values.items():
+        x = column[rows][valid] - shift
+        present = ~np.isnan(x)
+        x_zero = np.where(present, x, 0.0)
+        low = np.full(size, np.inf)
+        high = np.full(size, -np.inf)
+        np.minimum.at(low, ids, np.where(present, x, np.inf))
+        np.maximum.at(high, ids, np.where(present, x, -np.inf))
+        partials[name] = {
+            'count': np.bincount(ids, weights=present, minlength=size),
+            'sum': np.bincount(ids, weights=x_zero, minlength=size),
+            'sumsq': np.bincount(ids, weights=x_zero ** 2, minlength=size),
+            'min': low,
+            'max': high,
+        }
+    return group_ids, partials
+
+
+def _merge_partials(total, partials):
+    """同じ組み合わせ番号の配列上で部分集計を積み上げる"""
+    if total is None:
+        return partials
+    total['rows'] += partials['rows']
+    for name, stats in partials.items():
+        if name == 'rows':
+            continue
+        for stat in ('count', 'sum', 'sumsq'):
+            total[name][stat] += stats[stat]
+        np.minimum(total[name]['min'], stats['min'], out=total[name]['min'])
+        np.maximum(total[name]['max'], stats['max'], out=total[name]['max'])
+    return total
+
+
+def _partials_frame(group_ids, partials, positions=slice(None)):
+    """部分集計を組み合わせ番号を行とする DataFrame にする"""
+    columns = {'rows': partials['rows'][positions]}
+    for name, stats in partials.items():
+        if name != 'rows':
+            columns.update({(name, stat): values[positions] for stat, values in stats.items()})
+    return pd.DataFrame(columns, index=group_ids)
+
+
+def group_aggregate(df, keys, value_cols, aggregations, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    複数のキーで複数の集計を一度に行う
+
+    行をチャンクに分けて、組み合わせ番号ごとの件数・合計・二乗和・最小・最大を
+    部分集計し、それを積み上げて平均や標準偏差を求める。中央値のように部分集計で
+    求められない集計のみ、全行をまとめて pandas で計算する。キーに欠損のある行は
+    除外する（DataFrame.groupby の既定と同じ）。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    keys : list of GroupKey
+        encode_key で作ったキー
+    value_cols : list
+        集計する数値列
+    aggregations : list
+        GROUP_AGGREGATIONS から選んだ集計方法
+    chunk_rows : int
+        1回に集計する行数
+
+    Returns:
+    --------
+    pd.DataFrame : キー列と「列名_集計方法」の列（'size' は「件数」列）
+    """
+    unknown = set(aggregations) - set(GROUP_AGGREGATIONS)
+    if unknown:
+        raise ValueError(f"未対応の集計方法です: {', '.join(sorted(unknown))}")
+    if not keys:
+        raise ValueError("グループ化する列を1つ以上選択してください")
+
+    num_rows = len(df)
+    num_combinations = int(np.prod([len(key) for key in keys], dtype=object))
+    if num_combinations >= 2 ** 62:
+        raise ValueError("キーの組み合わせ数が多すぎます")
+    dense_size = num_combinations if num_combinations <= _dense_group_limit(len(value_cols)) else None
+
+    # 二乗和の桁落ちを防ぐため、各列の平均を引いてから集計する（分散は平行移動で不変）
+    values = {}
+    for col in value_cols:
+        column = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        shift = np.nanmean(column[:chunk_rows]) if num_rows else 0.0
+        values[col] = (column, 0.0 if np.isnan(shift) else shift)
+
+    total, frames = None, []
+    for start in range(0, max(num_rows, 1), chunk_rows):
+        rows = slice(start, min(start + chunk_rows, num_rows))
+        group_ids, partials = _chunk_partials(keys, values, rows, dense_size)
+        if dense_size is not None:
+            total = _merge_partials(total, partials)
+        else:
+            frames.append(_partials_frame(group_ids, partials))
+
+    if dense_size is not None:
+        group_ids = np.flatnonzero(total['rows'])
+        merged = _partials_frame(group_ids, total, group_ids)
+    else:
+        stacked = pd.concat(frames)
+        how = {column: ('min' if column[-1] == 'min' else 'max' if column[-1] == 'max' else 'sum')
+               for column in stacked.columns}
+        merged = stacked.groupby(level=0).agg(how).sort_index()
+        group_ids = merged.index.to_numpy()
+
+    # 組み合わせ番号を各キーのコードに戻す
+    result = {}
+    remainder = group_ids.astype(np.int64)
+    for key in reversed(keys):
+        remainder, codes = np.divmod(remainder, len(key))
+        result[key.name] = key.labels.take(codes)
+    result = pd.DataFrame({key.name: result[key.name] for key in keys})
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for col in value_cols:
+            shift = values[col][1]
+            count = merged[(col, 'count')].to_numpy()
+            total_sum = merged[(col, 'sum')].to_numpy()
+            for agg in aggregations:
+                if agg == 'size' or agg == 'median':
+                    continue
+                if agg == 'count':
+                    value = count.astype(np.int64)
+                elif agg == 'sum':
+                    value = total_sum + count * shift
+                elif agg == 'mean':
+                    value = np.where(count > 0, total_sum / count + shift, np.nan)
+                elif agg == 'std':
+                    variance = (merged[(col, 'sumsq')].to_numpy() - total_sum ** 2 / count) / (count - 1)
+                    value = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+                else:
+                    extreme = merged[(col, agg)].to_numpy()
+                    value = np.where(np.isfinite(extreme), extreme + shift, np.nan)
+                result[f"{col}_{agg}"] = value
+
+    if 'median' in aggregations:
+        combined, valid = _combine_codes(keys, slice(0, num_rows))
+        for col in value_cols:
+            medians = pd.Series(values[col][0][valid]).groupby(combined).median()
+            result[f"{col}_median"] = medians.reindex(group_ids).to_numpy()
+
+    if 'size' in aggregations:
+        result['件数'] = merged['rows'].to_numpy().astype(np.int64)
+
+    # 列の順序を集計方法の指定順にそろえる
+    ordered = [key.name for key in keys]
+    for col in value_cols:
+        ordered += [f"{col}_{agg}" for agg in aggregations if agg != 'size']
+    if 'size' in aggregations:
+        ordered.append('件数')
+    return result[ordered]
+
+
+def pivot_groups(grouped, index, columns, value):
+    """
+    集計結果を行キー×列キーの表に展開する
+
+    Parameters:
+    -----------
+    grouped : pd.DataFrame
+        group_aggregate の結果
+    index : list
+        行にするキー列
+    columns : str
+        列にするキー列
+    value : str
+        表の値にする集計列
+
+    Returns:
+    --------
+    pd.DataFrame : ピボットテーブル
+    """
+    return grouped.pivot(index=index, columns=columns, values=value)
+
+
+def crosstab_groups(grouped, index, columns, normalize=None):
+    """
+    集計結果の件数からクロス集計表を作る
+
+    Parameters:
+    -----------
+    grouped : pd.DataFrame
+        '件数' 列を含む group_aggregate の結果
+    index : list
+        行にするキー列
+    columns : str
+        列にするキー列
+    normalize : str or None
+        'index'（行ごとの割合）, 'columns'（列ごとの割合）, 'all'（全体の割合）
+
+    Returns:
+    --------
+    pd.DataFrame : クロス集計表
+    """
+    table = pivot_groups(grouped, index, columns, '件数').fillna(0).astype(np.int64)
+    if normalize == 'index':
+        return table.div(table.sum(axis=1), axis=0)
+    if normalize == 'columns':
+        return table.div(table.sum(axis=0), axis=1)
+    if normalize == 'all':
+        return table / table.to_numpy().sum()
+    return table
@@ -6,14 +6,11 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import plotly.graph_objects as go
 import plotly.express as px
 from pathlib import Path
-import json
+import time
 
 # 日本語フォント設定をインポート
 try:
@@ -27,6 +24,24 @@ try:
 except ImportError:
     print("警告: custom_colors.pyが見つかりません")
 
+import dataset_store
+import eda_utils
+import execution_backend
+import graph_layout
+import group_utils
+import network_utils
+import network_viz
+import plot_utils
+import report_builder
+import results_store
+import sql_engine
+import timeseries_utils
+
+# 共有データセットの列を書き換えたとき、その列だけを複製する
+# （streamlit run で起動したときだけ設定し、import されただけでは pandas の設定を変えない）
+if __name__ == '__main__':
+    pd.set_option('mode.copy_on_write', True)
+
 st.set_page_config(
     page_title="統合データ分析ワークフロー",
     page_icon="📊",
@@ -42,8 +57,60 @@ st.markdown("""
 # セッション状態の初期化
 if 'data' not in st.session_state:
     st.session_state.data = None
+    # データセットの指紋と、セッション内で編集した回数（統計量のキャッシュのキー）
+    st.session_state.data_key = None
 if 'analysis_results' not in st.session_state:
-    st.session_state.analysis_results = {}
+    # 大きな DataFrame はメモリ予算を超えると古いものからディスクに退避される
+    st.session_state.analysis_results = results_store.ResultsStore()
+if 'figures' not in st.session_state:
+    st.session_state.figures = report_builder.FigureRegistry()
+if 'lazy_dataset' not in st.session_state:
+    # 遅延実行で開いた Parquet ファイル（data には抽出した行が入る）
+    st.session_state.lazy_dataset = None
+
+
+def set_data(df, source):
+    """セッションのデータを差し替える（source はデータセットの指紋など、内容を表すキー）"""
+    st.session_state.data = df
+    st.session_state.data_key = (source, 0)
+
+
+def mark_data_edited(df):
+    """セッションのデータを編集した結果に差し替え、統計量のキャッシュのキーを更新する"""
+    source, edits = st.session_state.data_key
+    st.session_state.data = df
+    st.session_state.data_key = (source, edits + 1)
+
+
+# 統計量はデータセットの指紋と編集回数をキーにキャッシュする
+# （Streamlit は大きな DataFrame の一部の行だけをハッシュするため、数行の編集を見逃す）
+@st.cache_data(show_spinner="列の統計量を計算しています...")
+def load_column_profile(_data, key):
+    return eda_utils.column_profile(_data)
+
+
+@st.cache_data(show_spinner="基本統計量を計算しています...")
+def load_describe(_data, key):
+    return _data.describe()
+
+
+@st.cache_data(show_spinner="クエリを実行しています...")
+def run_lazy_query(_dataset, key, method, args):
+    return getattr(_dataset, method)(*args)
+
+
+def lazy_query(method, *args):
+    """遅延実行中のデータセットに対するクエリ（結果はファイル・条件・引数ごとにキャッシュ）"""
+    dataset = st.session_state.lazy_dataset
+    return run_lazy_query(dataset, dataset.cache_key, method, args)
+
+
+def show_chart(fig, **kwargs):
+    """図を表示し、レポートに含められるようタイトルを名前にして登録する（変換はレポート作成時に行う）"""
+    st.plotly_chart(fig, **kwargs)
+    if fig.layout.title.text:
+        st.session_state.figures.register(fig.layout.title.text, fig)
+
 
 # サイドバー：ワークフロー管理
 st.sidebar.header("🔄 ワークフロー")
@@ -57,67 +124,136 @@ workflow_step = st.sidebar.radio(
 if workflow_step == "1. データ読み込み":
     st.header("📁 ステップ1: データ読み込み")
     
-    # 既存ファイルから選択
-    data_dir = Path("data/raw")
-    if not data_dir.exists():
-        data_dir.mkdir(parents=True, exist_ok=True)
-    
-    files = list(data_dir.glob("*.csv")) + list(data_dir.glob("*.xlsx"))
+    load_mode = st.radio(
+        "読み込み方法",
+        ["ファイルを読み込む", "大規模ファイルを遅延実行で開く（Parquet）"],
+        horizontal=True
+    )
     
-    selected_file = None  # 初期化
-    
-    if files:
-        selected_file = st.selectbox(
-            "既存のファイルから選択",
-            ["新規アップロード"] + [f.name for f in files]
-        )
+    if load_mode == "ファイルを読み込む":
+        # 既存ファイルから選択
+        data_dir = Path("data/raw")
+        if not data_dir.exists():
+            data_dir.mkdir(parents=True, exist_ok=True)
         
-        if selected_file != "新規アップロード":
-            file_path = data_dir / selected_file
-            try:
-                if selected_file.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                else:
-                    df = pd.read_excel(file_path)
-                
-                st.session_state.data = df
-                st.success(f"✅ データを読み込みました: {selected_file}")
-                st.dataframe(df.head())
-                
-                # 基本情報
-                col1, col2, col3 = st.columns(3)
+        files = list(data_dir.glob("*.csv")) + list(data_dir.glob("*.xlsx"))
+        
+        selected_file = None  # 初期化
+        
+        if files:
+            selected_file = st.selectbox(
+                "既存のファイルから選択",
+                ["新規アップロード"] + [f.name for f in files]
+            )
+            
+            if selected_file != "新規アップロード":
+                file_path = data_dir / selected_file
+                try:
+                    handle = dataset_store.get_store().open_file(file_path)
+                    df = dataset_store.attach_to_session(st.session_state, handle)
+                    
+                    set_data(df, handle.key)
+                    st.session_state.lazy_dataset = None
+                    st.success(f"✅ データを読み込みました: {selected_file}")
+                    st.dataframe(df.head())
+                    
+                    # 基本情報
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("行数", f"{len(df):,}")
+                    with col2:
+                        st.metric("列数", f"{len(df.columns):,}")
+                    with col3:
+                        st.metric("メモリ使用量", f"{df.memory_usage().sum() / 1024**2:.2f} MB")
+                        
+                except Exception as e:
+                    st.error(f"ファイル読み込みエラー: {str(e)}")
+        else:
+            st.info("既存のデータファイルがありません。新規ファイルをアップロードしてください。")
+        
+        # 新規アップロード
+        if not files or (selected_file and selected_file == "新規アップロード"):
+            uploaded_file = st.file_uploader(
+                "ファイルをアップロード",
+                type=['csv', 'xlsx']
+            )
+            
+            if uploaded_file:
+                try:
+                    handle = dataset_store.get_store().open_bytes(uploaded_file.getvalue(), uploaded_file.name)
+                    df = dataset_store.attach_to_session(st.session_state, handle)
+                    
+                    set_data(df, handle.key)
+                    st.session_state.lazy_dataset = None
+                    st.success("✅ データを読み込みました")
+                    st.dataframe(df.head())
+                    
+                except Exception as e:
+                    st.error(f"ファイル読み込みエラー: {str(e)}")
+    else:
+        # ファイル全体を読み込まず、集計をバックエンドのクエリとして実行する
+        parquet_files = execution_backend.list_parquet_files()
+        if not parquet_files:
+            st.info("data/raw または data/processed に Parquet ファイルを置くと、メモリに収まらないファイルも分析できます")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                parquet_file = st.selectbox("Parquetファイル", parquet_files,
+                                            format_func=lambda p: f"{p.parent.name}/{p.name}")
+            with col2:
+                backends = execution_backend.available_backends()
+                backend = st.selectbox("実行エンジン", backends,
+                                       index=backends.index('duckdb') if 'duckdb' in backends else 0)
+            
+            schema = execution_backend.open_dataset(parquet_file, backend).schema
+            filters = st.session_state.setdefault('lazy_filters', [])
+            
+            # 行の条件は Parquet の行グループ単位で読み飛ばしに使われる
+            with st.expander("行の条件（読み込む行を絞り込む）", expanded=bool(filters)):
+                col1, col2, col3 = st.columns([2, 1, 2])
                 with col1:
-                    st.metric("行数", f"{len(df):,}")
+                    filter_col = st.selectbox("列", list(schema))
                 with col2:
-                    st.metric("列数", f"{len(df.columns):,}")
+                    filter_op = st.selectbox("演算子", execution_backend.FILTER_OPERATORS)
                 with col3:
-                    st.metric("メモリ使用量", f"{df.memory_usage().sum() / 1024**2:.2f} MB")
-                    
-            except Exception as e:
-                st.error(f"ファイル読み込みエラー: {str(e)}")
-    else:
-        st.info("既存のデータファイルがありません。新規ファイルをアップロードしてください。")
-    
-    # 新規アップロード
-    if not files or (selected_file and selected_file == "新規アップロード"):
-        uploaded_file = st.file_uploader(
-            "ファイルをアップロード",
-            type=['csv', 'xlsx']
-        )
-        
-        if uploaded_file:
-            try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                    filter_text = st.text_input("値")
                 
-                st.session_state.data = df
-                st.success("✅ データを読み込みました")
-                st.dataframe(df.head())
-                
-            except Exception as e:
-                st.error(f"ファイル読み込みエラー: {str(e)}")
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("条件を追加") and filter_text:
+                        try:
+                            value = execution_backend.open_dataset(parquet_file, backend).parse_value(filter_col, filter_text)
+                            filters.append((filter_col, filter_op, value))
+                        except ValueError as e:
+                            st.error(f"値を変換できません: {str(e)}")
+                with col2:
+                    if st.button("条件をクリア"):
+                        filters.clear()
+                for column, operator, value in filters:
+                    st.code(f"{column} {operator} {value!r}")
+            
+            if st.button("遅延実行で開く", type="primary"):
+                try:
+                    dataset = execution_backend.open_dataset(parquet_file, backend, filters)
+                    # 描画・検定など DataFrame が必要な処理には抽出した行を使う
+                    sample = run_lazy_query(dataset, dataset.cache_key, 'sample', ())
+                    st.session_state.lazy_dataset = dataset
+                    set_data(sample, dataset.cache_key)
+                    st.success(f"✅ {parquet_file.name} を {backend} で開きました")
+                except Exception as e:
+                    st.error(f"ファイル読み込みエラー: {str(e)}")
+        
+        dataset = st.session_state.lazy_dataset
+        if dataset is not None:
+            total_rows = run_lazy_query(dataset, dataset.cache_key, 'num_rows', ())
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("行数", f"{total_rows:,}")
+            with col2:
+                st.metric("列数", f"{len(dataset.schema):,}")
+            with col3:
+                st.metric("抽出行数", f"{len(st.session_state.data):,}")
+            st.dataframe(st.session_state.data.head())
 
 # ステップ2: データ探索
 elif workflow_step == "2. データ探索":
@@ -127,13 +263,23 @@ elif workflow_step == "2. データ探索":
         st.warning("先にデータを読み込んでください")
     else:
         df = st.session_state.data
+        lazy = st.session_state.lazy_dataset is not None
+        
+        if lazy:
+            st.info(
+                f"{st.session_state.lazy_dataset.path.name} を遅延実行で開いています。"
+                f"基本統計量・データ型・相関行列はファイル全体から、分布と欠損値は抽出した{len(df):,}行から計算します"
+            )
         
         # タブで整理
-        tab1, tab2, tab3, tab4 = st.tabs(["基本統計", "データ型", "欠損値", "相関分析"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(["基本統計", "データ型", "欠損値", "相関分析", "SQL"])
         
         with tab1:
             st.subheader("基本統計量")
-            st.dataframe(df.describe())
+            if lazy:
+                st.dataframe(lazy_query('describe', df.select_dtypes(include=[np.number]).columns.tolist()))
+            else:
+                st.dataframe(load_describe(df, st.session_state.data_key))
             
             # 数値列のヒストグラム
             numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -142,33 +288,51 @@ elif workflow_step == "2. データ探索":
                 col = st.selectbox("列を選択", numeric_cols)
                 
                 fig = px.histogram(df, x=col, nbins=30, title=f"{col}の分布")
-                st.plotly_chart(fig)
+                show_chart(fig)
         
         with tab2:
             st.subheader("データ型情報")
-            dtype_df = pd.DataFrame({
-                '列名': df.columns,
-                'データ型': df.dtypes.astype(str),
-                'ユニーク値数': [df[col].nunique() for col in df.columns],
-                'null値数': df.isnull().sum().values,
-                'null割合(%)': (df.isnull().sum() / len(df) * 100).round(2).values
-            })
-            st.dataframe(dtype_df)
+            profile = lazy_query('column_profile') if lazy else load_column_profile(df, st.session_state.data_key)
+            st.dataframe(profile[['列名', 'データ型', 'ユニーク値数', 'null値数', 'null割合(%)']])
         
         with tab3:
             st.subheader("欠損値の可視化")
             
-            # 欠損値のヒートマップ
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.heatmap(df.isnull(), cbar=True, yticklabels=False, cmap='viridis')
-            plt.title("欠損値のパターン")
-            st.pyplot(fig)
+            # 欠損値のヒートマップ（行を区間にまとめて欠損率を表示）
+            missing_matrix = eda_utils.binned_missing_matrix(df)
+            fig = px.imshow(
+                missing_matrix,
+                labels=dict(x="列", y="行（区間の先頭）", color="欠損率"),
+                color_continuous_scale='viridis',
+                zmin=0, zmax=1,
+                aspect='auto'
+            )
+            fig.update_layout(title=f"欠損値のパターン（{len(missing_matrix)}区間に集約）")
+            show_chart(fig)
+            
+            # 同時に欠損する列の組み合わせ
+            patterns, co_missing = eda_utils.missing_patterns(df)
+            if len(patterns) > 0:
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**頻出する欠損パターン**（True=欠損）")
+                    st.dataframe(patterns)
+                with col2:
+                    fig = px.imshow(
+                        co_missing,
+                        labels=dict(x="列", y="列", color="同時欠損行数"),
+                        color_continuous_scale='Blues'
+                    )
+                    fig.update_layout(title="列同士の同時欠損行数")
+                    show_chart(fig)
             
             # 欠損値の処理オプション
             st.subheader("欠損値の処理")
             col_with_null = df.columns[df.isnull().any()].tolist()
             
-            if col_with_null:
+            if lazy:
+                st.caption("遅延実行中はファイルを変更しないため、欠損値の処理は行えません")
+            elif col_with_null:
                 selected_col = st.selectbox("処理する列", col_with_null)
                 method = st.selectbox(
                     "処理方法",
@@ -179,17 +343,17 @@ elif workflow_step == "2. データ探索":
                     if method == "削除":
                         df = df.dropna(subset=[selected_col])
                     elif method == "平均値で補完":
-                        df[selected_col].fillna(df[selected_col].mean(), inplace=True)
+                        df[selected_col] = df[selected_col].fillna(df[selected_col].mean())
                     elif method == "中央値で補完":
-                        df[selected_col].fillna(df[selected_col].median(), inplace=True)
+                        df[selected_col] = df[selected_col].fillna(df[selected_col].median())
                     elif method == "最頻値で補完":
-                        df[selected_col].fillna(df[selected_col].mode()[0], inplace=True)
+                        df[selected_col] = df[selected_col].fillna(df[selected_col].mode()[0])
                     elif method == "前方補完":
-                        df[selected_col].fillna(method='ffill', inplace=True)
+                        df[selected_col] = df[selected_col].ffill()
                     else:  # 後方補完
-                        df[selected_col].fillna(method='bfill', inplace=True)
+                        df[selected_col] = df[selected_col].bfill()
                     
-                    st.session_state.data = df
+                    mark_data_edited(df)
                     st.success("✅ 欠損値を処理しました")
                     st.experimental_rerun()
         
@@ -198,36 +362,104 @@ elif workflow_step == "2. データ探索":
             
             numeric_df = df.select_dtypes(include=[np.number])
             if len(numeric_df.columns) > 1:
-                # 相関行列のヒートマップ
-                corr = numeric_df.corr()
+                # 列数が多い場合は相関行列全体を作らずブロックごとに計算する
+                wide = len(numeric_df.columns) > eda_utils.CORRELATION_HEATMAP_MAX_COLUMNS
                 
-                fig = px.imshow(
-                    corr,
-                    labels=dict(x="変数", y="変数", color="相関係数"),
-                    x=corr.columns,
-                    y=corr.columns,
-                    color_continuous_scale='RdBu_r',
-                    zmin=-1, zmax=1
-                )
-                fig.update_layout(title="相関行列ヒートマップ")
-                st.plotly_chart(fig)
+                if not wide:
+                    # 相関行列のヒートマップ
+                    corr = lazy_query('correlation', numeric_df.columns.tolist()) if lazy else numeric_df.corr()
+                    
+                    fig = px.imshow(
+                        corr,
+                        labels=dict(x="変数", y="変数", color="相関係数"),
+                        x=corr.columns,
+                        y=corr.columns,
+                        color_continuous_scale='RdBu_r',
+                        zmin=-1, zmax=1
+                    )
+                    fig.update_layout(title="相関行列ヒートマップ")
+                    show_chart(fig)
+                else:
+                    st.info(f"数値列が{len(numeric_df.columns):,}列あるため、ヒートマップは省略し高相関ペアのみ抽出します")
                 
                 # 高相関ペアの抽出
-                st.subheader("高相関ペア（|r| > 0.5）")
-                high_corr = []
-                for i in range(len(corr.columns)):
-                    for j in range(i+1, len(corr.columns)):
-                        if abs(corr.iloc[i, j]) > 0.5:
-                            high_corr.append({
-                                '変数1': corr.columns[i],
-                                '変数2': corr.columns[j],
-                                '相関係数': round(corr.iloc[i, j], 3)
-                            })
-                
-                if high_corr:
-                    st.dataframe(pd.DataFrame(high_corr))
+                col1, col2 = st.columns(2)
+                with col1:
+                    threshold = st.slider("相関係数の閾値（|r|）", 0.0, 0.99, 0.5, 0.01)
+                with col2:
+                    top_k = st.number_input("表示するペア数の上限", min_value=1, value=100, step=10)
+                
+                st.subheader(f"高相関ペア（|r| > {threshold}）")
+                if not wide:
+                    high_corr = eda_utils.correlation_pairs_from_matrix(corr, threshold, int(top_k))
+                else:
+                    with st.spinner("相関係数をブロックごとに計算しています..."):
+                        high_corr = eda_utils.high_correlation_pairs(numeric_df, threshold, int(top_k))
+                
+                if len(high_corr) > 0:
+                    st.dataframe(high_corr)
                 else:
                     st.info("高相関のペアは見つかりませんでした")
+        
+        with tab5:
+            st.subheader("SQLクエリ")
+            
+            if not sql_engine.DUCKDB_AVAILABLE:
+                st.info("duckdb をインストールすると、読み込んだデータや Parquet ファイルに SQL を実行できます（pip install duckdb）")
+            else:
+                if 'sql_engine' not in st.session_state:
+                    st.session_state.sql_engine = sql_engine.SQLEngine()
+                
+                # 読み込んだデータは data、遅延実行中はファイル全体を data として参照する
+                tables = sql_engine.catalog_tables()
+                frames = {}
+                if lazy:
+                    tables['data'] = st.session_state.lazy_dataset.path
+                else:
+                    frames['data'] = df
+                
+                with st.expander("参照できるテーブル"):
+                    st.dataframe(pd.DataFrame(
+                        [{'テーブル': 'data', '内容': '読み込んだデータ' if not lazy else str(tables['data'])}] +
+                        [{'テーブル': name, '内容': str(path)} for name, path in tables.items() if name != 'data']
+                    ))
+                
+                sql = st.text_area("SQL（SELECT 文のみ）", value="SELECT * FROM data LIMIT 1000", height=150)
+                col1, col2 = st.columns([1, 3])
+                with col1:
+                    page_size = st.selectbox("1ページの行数", sql_engine.PAGE_SIZES,
+                                             index=sql_engine.PAGE_SIZES.index(sql_engine.DEFAULT_PAGE_SIZE))
+                
+                if st.button("実行", type="primary"):
+                    try:
+                        result, cached = st.session_state.sql_engine.run(sql, frames, tables)
+                        st.session_state.sql_result = (result, cached)
+                        st.session_state.sql_page = 0
+                    except Exception as e:
+                        st.session_state.sql_result = None
+                        st.error(f"SQLエラー: {str(e)}")
+                
+                if st.session_state.get('sql_result'):
+                    result, cached = st.session_state.sql_result
+                    page = st.session_state.get('sql_page', 0)
+                    st.dataframe(result.page(page, page_size))
+                    
+                    def set_sql_page(number):
+                        st.session_state.sql_page = number
+                    
+                    col1, col2, col3 = st.columns([1, 1, 4])
+                    with col1:
+                        st.button("前のページ", disabled=page == 0, on_click=set_sql_page, args=(page - 1,))
+                    with col2:
+                        st.button("次のページ", disabled=not result.has_page(page + 1, page_size),
+                                  on_click=set_sql_page, args=(page + 1,))
+                    with col3:
+                        total = f"{result.total_rows:,}行" if result.total_rows is not None else f"{result.rows_fetched:,}行以上"
+                        st.caption(
+                            f"{page + 1}ページ目（全{total}） / 実行 {result.timings['実行']:.3f}秒・"
+                            f"取得 {result.timings['取得']:.3f}秒"
+                            + ("（キャッシュ済みの結果）" if cached else "")
+                        )
 
 # ステップ3: データ分析
 elif workflow_step == "3. データ分析":
@@ -267,14 +499,42 @@ elif workflow_step == "3. データ分析":
                     with col4:
                         st.metric("変動係数", f"{(df[selected_col].std() / df[selected_col].mean()):.2f}")
                     
-                    # 正規性の検定
-                    from scipy import stats
-                    statistic, p_value = stats.shapiro(df[selected_col].dropna())
-                    st.write(f"Shapiro-Wilk検定: 統計量={statistic:.4f}, p値={p_value:.4f}")
-                    if p_value > 0.05:
-                        st.success("正規分布に従う可能性があります（p > 0.05）")
+                    # 分布の検定（列ごとに最大5000件を抽出して一括実行し、結果をキャッシュ）
+                    @st.cache_data(show_spinner="分布の検定を実行しています...")
+                    def run_distribution_tests(data, columns, strata):
+                        return eda_utils.distribution_tests(data, columns=columns, strata_col=strata)
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        test_all = st.checkbox("全数値列をまとめて検定する", value=False)
+                    with col2:
+                        strata_options = ["なし"] + [
+                            col for col in df.columns
+                            if col not in numeric_cols or df[col].nunique() <= 50
+                        ]
+                        strata_col = st.selectbox("層化抽出に使う列", strata_options)
+                    strata = None if strata_col == "なし" else strata_col
+                    
+                    columns = [col for col in numeric_cols if col != strata] if test_all else [selected_col]
+                    test_results = run_distribution_tests(df, columns, strata)
+                    
+                    if test_all:
+                        st.dataframe(test_results)
                     else:
-                        st.warning("正規分布に従わない可能性があります（p < 0.05）")
+                        result = test_results.iloc[0]
+                        st.write(f"Shapiro-Wilk検定: 統計量={result['Shapiro統計量']:.4f}, p値={result['Shapiro p値']:.4f}")
+                        dagostino_stat, dagostino_p = result["D'Agostino統計量"], result["D'Agostino p値"]
+                        st.write(f"D'Agostino検定: 統計量={dagostino_stat:.4f}, p値={dagostino_p:.4f}")
+                        st.write(f"Kolmogorov-Smirnov検定: 統計量={result['KS統計量']:.4f}, p値={result['KS p値']:.4f}")
+                        st.write(f"Anderson-Darling検定: 統計量={result['Anderson統計量']:.4f}, 臨界値(5%)={result['Anderson臨界値(5%)']:.4f}")
+                        if result['判定'] == '正規分布に従う可能性':
+                            st.success("正規分布に従う可能性があります（p > 0.05）")
+                        elif result['判定'] == '判定不可':
+                            st.info("有効な値が少ないか一定のため、検定できません")
+                        else:
+                            st.warning("正規分布に従わない可能性があります（p < 0.05）")
+                    if test_results['件数'].max() > eda_utils.DISTRIBUTION_SAMPLE_SIZE:
+                        st.caption(f"各列から最大{eda_utils.DISTRIBUTION_SAMPLE_SIZE:,}件を抽出して検定しています")
         
         elif analysis_type == "時系列分析":
             st.subheader("時系列分析")
@@ -284,71 +544,274 @@ elif workflow_step == "3. データ分析":
             if len(date_cols) > 0:
                 date_col = st.selectbox("日付列", date_cols)
                 
-                # 日付型に変換を試みる
+                # 分析対象の数値列
+                numeric_cols = df.select_dtypes(include=[np.number]).columns
+                value_col = st.selectbox("値の列", numeric_cols)
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    rule_label = st.selectbox("リサンプリング", list(timeseries_utils.RESAMPLE_RULES))
+                with col2:
+                    how = st.selectbox("集計方法", timeseries_utils.RESAMPLE_AGGREGATIONS,
+                                       disabled=rule_label == "なし")
+                rule = timeseries_utils.RESAMPLE_RULES[rule_label]
+                
+                # 日付型に変換を試みる（共有の DataFrame は変更せず、列・頻度ごとに結果をキャッシュ）
+                @st.cache_data(show_spinner="時系列を準備しています...")
+                def load_series(data, date, value, resample_rule, aggregation):
+                    return timeseries_utils.prepare_series(data, date, value, resample_rule, aggregation)
+                
                 try:
-                    df[date_col] = pd.to_datetime(df[date_col])
-                    df = df.sort_values(date_col)
+                    if not value_col:
+                        series = None
+                    elif st.session_state.lazy_dataset is not None:
+                        series = lazy_query('series', date_col, value_col, rule, how)
+                    else:
+                        series = load_series(df, date_col, value_col, rule, how)
+                except Exception as e:
+                    st.error(f"日付変換エラー: {str(e)}")
+                    series = None
+                
+                if series is not None and len(series) > 0:
+                    # 描画点数の間引き（多段階の解像度を事前に作り、表示範囲に応じて詳細を取り出す）
+                    # 元の系列と同じ大きさになるため、直近のものだけを一定時間保持する
+                    @st.cache_resource(show_spinner="描画用の間引きデータを作成しています...", max_entries=4, ttl=3600)
+                    def load_pyramid(data, method):
+                        return timeseries_utils.DownsamplePyramid(data.index, data, method=method)
                     
-                    # 分析対象の数値列
-                    numeric_cols = df.select_dtypes(include=[np.number]).columns
-                    value_col = st.selectbox("値の列", numeric_cols)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        method = st.selectbox(
+                            "間引き手法",
+                            timeseries_utils.DOWNSAMPLE_METHODS,
+                            format_func=lambda m: {'lttb': 'LTTB（形状を保持）', 'minmax': '最小値/最大値エンベロープ'}[m]
+                        )
+                    with col2:
+                        max_points = st.slider("1系列あたりの描画点数", 500, 10000, timeseries_utils.DEFAULT_MAX_POINTS, 500)
                     
-                    if value_col:
-                        # 時系列プロット
-                        fig = px.line(df, x=date_col, y=value_col, title=f"{value_col}の時系列推移")
-                        st.plotly_chart(fig)
-                        
-                        # 移動平均
-                        window = st.slider("移動平均の期間", 2, 30, 7)
-                        df[f'MA_{window}'] = df[value_col].rolling(window=window).mean()
+                    x_range = None
+                    if series.index[0] < series.index[-1]:
+                        start, end = series.index[0].to_pydatetime(), series.index[-1].to_pydatetime()
+                        x_range = st.slider("表示範囲", min_value=start, max_value=end, value=(start, end))
+                    
+                    try:
+                        pyramid = load_pyramid(series, method)
+                        x, y, level = pyramid.query(x_range, max_points)
+                    except Exception as e:
+                        st.error(f"描画データの作成エラー: {str(e)}")
+                        st.stop()
+                    
+                    # 時系列プロット
+                    fig = go.Figure(go.Scattergl(x=x, y=y, mode='lines', name=value_col))
+                    fig.update_layout(title=f"{value_col}の時系列推移")
+                    show_chart(fig)
+                    st.caption(f"全{len(pyramid):,}点のうち{len(x):,}点を描画しています（解像度の段: {level}）")
+                    
+                    # 移動平均（DataFrame に列を追加せず、系列から計算する）
+                    window = st.slider("移動平均の期間", 2, 30, 7)
+                    moving_average = series.rolling(window=window).mean()
+                    ma_x, ma_y, _ = load_pyramid(moving_average, method).query(x_range, max_points)
+                    
+                    fig = go.Figure()
+                    fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name="実測値"))
+                    fig.add_trace(go.Scattergl(x=ma_x, y=ma_y, mode='lines', name=f"{window}期間移動平均"))
+                    fig.update_layout(title="移動平均との比較")
+                    show_chart(fig)
+                    
+                    # 時系列分解
+                    st.subheader("時系列分解")
+                    @st.cache_data(show_spinner="時系列を分解しています...")
+                    def run_decomposition(data, period, robust):
+                        return timeseries_utils.decompose(data, period, robust)
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        period = st.number_input(
+                            "季節周期（期間数）", min_value=2,
+                            value=timeseries_utils.infer_period(series.index) or 7
+                        )
+                    with col2:
+                        robust = st.checkbox("外れ値に頑健な分解（STL）", value=False,
+                                             disabled=not timeseries_utils.STATSMODELS_AVAILABLE)
+                    
+                    try:
+                        components = run_decomposition(series, int(period), robust)
+                        fig = go.Figure()
+                        for i, name in enumerate(components.columns):
+                            cx, cy, _ = timeseries_utils.DownsamplePyramid(
+                                components.index, components[name], max_points=max_points, method=method
+                            ).query(x_range, max_points)
+                            fig.add_trace(go.Scattergl(x=cx, y=cy, mode='lines', name=name,
+                                                       xaxis='x', yaxis=f"y{i + 1 if i else ''}"))
+                        fig.update_layout(
+                            title="トレンド・季節性・残差",
+                            height=800,
+                            yaxis=dict(domain=[0.78, 1.0], title='観測値'),
+                            yaxis2=dict(domain=[0.52, 0.74], title='トレンド'),
+                            yaxis3=dict(domain=[0.26, 0.48], title='季節性'),
+                            yaxis4=dict(domain=[0.0, 0.22], title='残差'),
+                            showlegend=False
+                        )
+                        show_chart(fig)
+                        if not timeseries_utils.STATSMODELS_AVAILABLE:
+                            st.caption("statsmodels が見つからないため、移動平均による古典的な分解を行っています")
+                    except ValueError as e:
+                        st.warning(str(e))
+                    
+                    # 予測
+                    st.subheader("予測")
+                    @st.cache_data(show_spinner="予測モデルを推定しています...")
+                    def run_forecast(data, forecast_method, horizon, order, diff):
+                        return timeseries_utils.forecast(data, forecast_method, horizon, order=order, diff=diff)
+                    
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        forecast_method = st.selectbox(
+                            "予測手法",
+                            timeseries_utils.FORECAST_METHODS,
+                            format_func=lambda m: {'ses': '単純指数平滑', 'holt': 'Holt線形トレンド', 'ar': '差分ARモデル'}[m]
+                        )
+                    with col2:
+                        horizon = st.number_input("予測期間数", min_value=1, max_value=1000, value=30)
+                    with col3:
+                        order = st.number_input("ARの次数", min_value=1, max_value=30, value=3,
+                                                disabled=forecast_method != 'ar')
+                    
+                    try:
+                        predicted, info = run_forecast(series, forecast_method, int(horizon), int(order), 1)
+                        history = series.iloc[-max(int(horizon) * 5, 100):]
+                        hx, hy = timeseries_utils.downsample(history.index, history, max_points, method)
                         
                         fig = go.Figure()
-                        fig.add_trace(go.Scatter(x=df[date_col], y=df[value_col], name="実測値"))
-                        fig.add_trace(go.Scatter(x=df[date_col], y=df[f'MA_{window}'], name=f"{window}期間移動平均"))
-                        fig.update_layout(title="移動平均との比較")
-                        st.plotly_chart(fig)
+                        fig.add_trace(go.Scattergl(x=hx, y=hy, mode='lines', name="実測値"))
+                        fig.add_trace(go.Scatter(
+                            x=np.r_[predicted.index, predicted.index[::-1]],
+                            y=np.r_[predicted['上限'], predicted['下限'][::-1]],
+                            fill='toself', fillcolor='rgba(99, 110, 250, 0.2)',
+                            line=dict(width=0), hoverinfo='skip', name="95%予測区間"
+                        ))
+                        fig.add_trace(go.Scatter(x=predicted.index, y=predicted['予測値'], mode='lines', name="予測値"))
+                        fig.update_layout(title=f"{value_col}の予測")
+                        show_chart(fig)
                         
-                except Exception as e:
-                    st.error(f"日付変換エラー: {str(e)}")
+                        st.write(f"1期先予測のRMSE: {info['rmse']:.4f}")
+                        st.dataframe(predicted)
+                        st.session_state.analysis_results['forecast'] = predicted
+                    except ValueError as e:
+                        st.warning(str(e))
+                elif series is not None:
+                    st.warning("有効な日付のデータがありません")
             else:
                 st.warning("日付列が見つかりません")
         
         elif analysis_type == "グループ分析":
             st.subheader("グループ分析")
             
-            # カテゴリ列の選択
-            cat_cols = df.select_dtypes(include=['object', 'category']).columns
-            if len(cat_cols) > 0:
-                group_col = st.selectbox("グループ化する列", cat_cols)
+            # カテゴリ列・日時列の選択
+            cat_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+            datetime_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
+            if len(cat_cols) + len(datetime_cols) > 0:
+                group_cols = st.multiselect("グループ化する列", cat_cols + datetime_cols,
+                                            default=(cat_cols + datetime_cols)[:1])
+                
+                # 日時列は期間単位にまとめる
+                grains = {}
+                for col in group_cols:
+                    if col in datetime_cols:
+                        grain_label = st.selectbox(f"{col}のまとめ方", list(group_utils.TIME_GRAINS), index=3)
+                        grains[col] = group_utils.TIME_GRAINS[grain_label]
                 
                 # 集計対象の数値列
                 numeric_cols = df.select_dtypes(include=[np.number]).columns
-                if len(numeric_cols) > 0:
-                    agg_col = st.selectbox("集計する列", numeric_cols)
-                    agg_func = st.selectbox("集計方法", ["mean", "sum", "count", "min", "max"])
-                    
-                    # グループ集計
-                    grouped = df.groupby(group_col)[agg_col].agg(agg_func).reset_index()
-                    grouped = grouped.sort_values(agg_col, ascending=False)
-                    
-                    # 結果表示
-                    st.dataframe(grouped)
-                    
-                    # 可視化
-                    # カスタムカラーを適用
-                    color_map = None
-                    if 'custom_colors' in globals():
-                        color_map = custom_colors.get_color_mapping(grouped[group_col])
-                    
-                    fig = px.bar(grouped, x=group_col, y=agg_col, 
-                                title=f"{group_col}別の{agg_col}（{agg_func}）",
-                                color=group_col,
-                                color_discrete_map=color_map if color_map else None)
-                    fig.update_layout(showlegend=False)
-                    st.plotly_chart(fig)
+                if len(numeric_cols) > 0 and group_cols:
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        agg_cols = st.multiselect("集計する列", numeric_cols, default=list(numeric_cols[:1]))
+                    with col2:
+                        agg_funcs = st.multiselect("集計方法", group_utils.GROUP_AGGREGATIONS, default=["mean"])
                     
-                    # 結果を保存
-                    st.session_state.analysis_results['group_analysis'] = grouped
+                    # キーのコード化は列ごとにキャッシュし、再実行のたびに文字列をハッシュし直さない
+                    # （複数キーの集計で使う分だけを一定時間保持する）
+                    @st.cache_resource(show_spinner="グループ化キーを準備しています...", max_entries=8, ttl=3600)
+                    def load_group_key(data, column, grain):
+                        return group_utils.encode_key(data[column], grain)
+                    
+                    @st.cache_data(show_spinner="グループ集計を実行しています...")
+                    def run_group_aggregate(data, columns, column_grains, values, aggregations):
+                        keys = [load_group_key(data, col, column_grains.get(col)) for col in columns]
+                        return group_utils.group_aggregate(data, keys, values, aggregations)
+                    
+                    if agg_cols and agg_funcs:
+                        # グループ集計
+                        if st.session_state.lazy_dataset is not None:
+                            grouped = lazy_query('group_aggregate', group_cols, list(agg_cols), agg_funcs, grains)
+                        else:
+                            grouped = run_group_aggregate(df, group_cols, grains, agg_cols, agg_funcs)
+                        metric_cols = [col for col in grouped.columns if col not in group_cols]
+                        
+                        # 結果表示
+                        st.dataframe(grouped.sort_values(metric_cols[0], ascending=False))
+                        st.caption(f"{len(grouped):,}グループ")
+                        
+                        # 可視化
+                        if len(group_cols) == 1:
+                            group_col, metric = group_cols[0], metric_cols[0]
+                            top = grouped.nlargest(50, metric)
+                            
+                            # カスタムカラーを適用
+                            color_map = None
+                            if 'custom_colors' in globals():
+                                color_map = custom_colors.get_color_mapping(top[group_col])
+                            
+                            fig = px.bar(top, x=group_col, y=metric,
+                                        title=f"{group_col}別の{metric}",
+                                        color=group_col,
+                                        color_discrete_map=color_map if color_map else None)
+                            fig.update_layout(showlegend=False)
+                            show_chart(fig)
+                        else:
+                            # ピボット / クロス集計
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                pivot_col = st.selectbox("列に展開するキー", group_cols, index=len(group_cols) - 1)
+                            with col2:
+                                table_type = st.selectbox(
+                                    "表の種類",
+                                    ["ピボット"] + (["クロス集計"] if "size" in agg_funcs else [])
+                                )
+                            with col3:
+                                if table_type == "ピボット":
+                                    pivot_value = st.selectbox("値", [col for col in metric_cols if col != "件数"] or metric_cols)
+                                else:
+                                    normalize = st.selectbox(
+                                        "割合",
+                                        [None, 'index', 'columns', 'all'],
+                                        format_func=lambda n: {None: '件数', 'index': '行ごとの割合', 'columns': '列ごとの割合', 'all': '全体の割合'}[n]
+                                    )
+                            
+                            row_cols = [col for col in group_cols if col != pivot_col]
+                            if table_type == "ピボット":
+                                table = group_utils.pivot_groups(grouped, row_cols, pivot_col, pivot_value)
+                                title = f"{pivot_value}のピボットテーブル"
+                            else:
+                                table = group_utils.crosstab_groups(grouped, row_cols, pivot_col, normalize)
+                                title = "クロス集計表"
+                            st.dataframe(table)
+                            
+                            if table.size <= 10_000:
+                                fig = px.imshow(
+                                    table.to_numpy(),
+                                    x=[str(c) for c in table.columns],
+                                    y=[" / ".join(map(str, i)) if isinstance(i, tuple) else str(i) for i in table.index],
+                                    labels=dict(x=pivot_col, y=" / ".join(row_cols), color=title),
+                                    aspect='auto',
+                                    color_continuous_scale='Blues'
+                                )
+                                fig.update_layout(title=title)
+                                show_chart(fig)
+                        
+                        # 結果を保存
+                        st.session_state.analysis_results['group_analysis'] = grouped
         
         elif analysis_type == "ネットワーク分析":
             st.subheader("ネットワーク分析")
@@ -365,29 +828,57 @@ elif workflow_step == "3. データ分析":
             with col3:
                 weight_col = st.selectbox("Weight列（オプション）", ["なし"] + cols)
             
+            col1, col2 = st.columns(2)
+            with col1:
+                directed = st.checkbox("有向グラフとして扱う", value=False)
+            with col2:
+                multigraph = st.checkbox("多重エッジを保持する", value=False)
+            
             if source_col and target_col and source_col != target_col:
-                # NetworkXグラフの作成
-                G = nx.Graph()
+                # グラフの作成（列単位で構築し、直近のものだけを一定時間キャッシュ）
+                @st.cache_resource(show_spinner="グラフを構築しています...", max_entries=2, ttl=3600)
+                def load_graph(data, source, target, weight, is_directed, is_multigraph):
+                    return network_utils.build_graph(
+                        data, source, target,
+                        weight_col=None if weight == "なし" else weight,
+                        directed=is_directed,
+                        multigraph=is_multigraph
+                    )
                 
-                for idx, row in df.iterrows():
-                    if weight_col != "なし":
-                        G.add_edge(row[source_col], row[target_col], weight=row[weight_col])
-                    else:
-                        G.add_edge(row[source_col], row[target_col])
+                G = load_graph(df, source_col, target_col, weight_col, directed, multigraph)
+                summary = network_utils.graph_summary(G)
                 
                 # 基本統計
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    st.metric("ノード数", G.number_of_nodes())
+                    st.metric("ノード数", summary['nodes'])
                 with col2:
-                    st.metric("エッジ数", G.number_of_edges())
+                    st.metric("エッジ数", summary['edges'])
                 with col3:
-                    st.metric("密度", f"{nx.density(G):.3f}")
+                    st.metric("密度", f"{summary['density']:.3f}")
                 with col4:
-                    if nx.is_connected(G):
-                        st.metric("平均パス長", f"{nx.average_shortest_path_length(G):.2f}")
+                    if summary['path_connected']:
+                        path_stats = network_utils.path_statistics(G)
+                        label = "平均パス長" if path_stats['exact'] else "平均パス長（推定）"
+                        st.metric(label, f"{path_stats['average_path_length']:.2f}")
                     else:
-                        st.metric("連結成分数", nx.number_connected_components(G))
+                        st.metric("連結成分数", summary['components'])
+                
+                if summary['path_connected'] and not path_stats['exact']:
+                    diameter_text = f"直径: {path_stats['diameter_lower']}以上"
+                    if path_stats['diameter_upper'] is not None:
+                        diameter_text += f"{path_stats['diameter_upper']}以下"
+                    st.caption(
+                        f"{path_stats['num_sources']}個の始点からのBFSによる推定値です。"
+                        f"平均パス長の95%信頼区間: [{path_stats['ci_low']:.2f}, {path_stats['ci_high']:.2f}]、"
+                        f"{diameter_text}"
+                    )
+                
+                if G.graph.get('dropped_rows'):
+                    st.warning(f"重みが数値でない {G.graph['dropped_rows']:,} 行を除外しました")
+                
+                if isinstance(G, network_utils.CSRGraph):
+                    st.info("エッジ数が多いため、疎行列（CSR）形式でグラフを保持しています")
                 
                 # 中心性分析
                 st.subheader("中心性分析")
@@ -396,14 +887,62 @@ elif workflow_step == "3. データ分析":
                     ["次数中心性", "媒介中心性", "近接中心性", "固有ベクトル中心性"]
                 )
                 
-                if centrality_type == "次数中心性":
-                    centrality = nx.degree_centrality(G)
-                elif centrality_type == "媒介中心性":
-                    centrality = nx.betweenness_centrality(G)
-                elif centrality_type == "近接中心性":
-                    centrality = nx.closeness_centrality(G)
+                algorithm = {
+                    "次数中心性": "degree",
+                    "媒介中心性": "betweenness",
+                    "近接中心性": "closeness",
+                    "固有ベクトル中心性": "eigenvector"
+                }[centrality_type]
+                
+                if algorithm in ("betweenness", "closeness"):
+                    use_approx = G.number_of_nodes() > network_utils.EXACT_CENTRALITY_MAX_NODES
+                    calc_mode = st.radio(
+                        "計算方法",
+                        ["近似（ピボットサンプリング）", "厳密（バックグラウンド計算）"],
+                        index=0 if use_approx else 1,
+                        horizontal=True
+                    )
+                    
+                    if calc_mode.startswith("近似"):
+                        epsilon = st.slider("許容誤差 ε（小さいほど高精度・低速）", 0.01, 0.3, 0.05, 0.01)
+                        k = network_utils.pivot_sample_size(G.number_of_nodes(), epsilon)
+                        st.caption(f"ピボット数: {k:,} / {G.number_of_nodes():,} ノード（信頼度90%）")
+                        with st.spinner("中心性を推定しています..."):
+                            centrality = network_utils.compute_centrality(
+                                G, algorithm, approximate=True, epsilon=epsilon
+                            )
+                    else:
+                        centrality = network_utils.get_cached_centrality(G, algorithm)
+                        if centrality is None:
+                            job_key = (network_utils.graph_fingerprint(G), algorithm)
+                            cancelled_jobs = st.session_state.setdefault('cancelled_jobs', set())
+                            if job_key in cancelled_jobs:
+                                st.warning("計算をキャンセルしました。近似計算をご利用ください。")
+                                if st.button("厳密計算を再開"):
+                                    cancelled_jobs.discard(job_key)
+                                    st.rerun()
+                                st.stop()
+                            
+                            job = network_utils.start_exact_centrality_job(G, algorithm)
+                            if job.error() is not None:
+                                st.error(f"中心性の計算でエラーが発生しました: {job.error()}")
+                                st.stop()
+                            
+                            if job.done() and not job.cancelled():
+                                # 完了した結果がキャッシュから外れていても、ジョブから受け取る
+                                centrality = job.result()
+                            else:
+                                st.progress(job.progress, text=f"{centrality_type}を計算中... {job.progress:.0%}")
+                                if st.button("計算をキャンセル"):
+                                    job.cancel()
+                                    cancelled_jobs.add(job_key)
+                                    st.rerun()
+                                
+                                # 完了するまで定期的に再実行して進捗を更新する
+                                time.sleep(1)
+                                st.rerun()
                 else:
-                    centrality = nx.eigenvector_centrality(G, max_iter=1000)
+                    centrality = network_utils.compute_centrality(G, algorithm)
                 
                 # 上位ノードの表示
                 centrality_df = pd.DataFrame([
@@ -412,39 +951,137 @@ elif workflow_step == "3. データ分析":
                 ])
                 st.dataframe(centrality_df)
                 
+                # コミュニティ検出
+                st.subheader("コミュニティ検出")
+                community_label = st.selectbox(
+                    "検出手法",
+                    ["なし", "Louvain", "Leiden", "ラベル伝播"]
+                )
+                
+                node_colors = None
+                if community_label != "なし":
+                    community_algorithm = {
+                        "Louvain": "louvain",
+                        "Leiden": "leiden",
+                        "ラベル伝播": "label_propagation"
+                    }[community_label]
+                    
+                    resolution = 1.0
+                    if community_algorithm != "label_propagation":
+                        resolution = st.slider("解像度（大きいほど細かく分割）", 0.1, 3.0, 1.0, 0.1)
+                    
+                    with st.spinner("コミュニティを検出しています..."):
+                        communities = network_utils.detect_communities(
+                            G, community_algorithm, resolution=resolution
+                        )
+                    
+                    if communities['algorithm'] != community_algorithm:
+                        st.info("Leidenにはpython-igraphが必要なため、Louvainで代替しました")
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("コミュニティ数", f"{communities['num_communities']:,}")
+                    with col2:
+                        st.metric("モジュラリティ", f"{communities['modularity']:.3f}")
+                    
+                    # 上位コミュニティの一覧（代表ノードは中心性が最大のノード）
+                    members = pd.DataFrame({
+                        'ノード': list(communities['partition'].keys()),
+                        'コミュニティ': list(communities['partition'].values())
+                    })
+                    members['中心性'] = members['ノード'].map(centrality).fillna(0)
+                    community_df = (
+                        members.sort_values('中心性', ascending=False)
+                        .groupby('コミュニティ')
+                        .agg(ノード数=('ノード', 'size'), 代表ノード=('ノード', 'first'))
+                        .sort_values('ノード数', ascending=False)
+                        .head(20)
+                        .reset_index()
+                    )
+                    st.dataframe(community_df)
+                    
+                    palette = custom_colors.ACCESSIBLE_COLORS if 'custom_colors' in globals() else None
+                    node_colors = network_viz.community_colors(communities['partition'], palette)
+                    
+                    # 結果を保存
+                    st.session_state.analysis_results['community_detection'] = {
+                        '手法': community_label,
+                        'コミュニティ数': communities['num_communities'],
+                        'モジュラリティ': round(communities['modularity'], 4)
+                    }
+                    st.session_state.analysis_results['community_sizes'] = community_df
+                
                 # ネットワーク可視化
                 st.subheader("ネットワーク可視化")
                 
                 # レイアウトの選択
                 layout_type = st.selectbox(
                     "レイアウト",
-                    ["spring", "circular", "kamada_kawai", "shell"]
+                    graph_layout.LAYOUT_METHODS
                 )
                 
-                # 可視化
-                plt.figure(figsize=(10, 8))
+                resolved_layout = graph_layout.resolve_layout_method(G, layout_type)
+                if resolved_layout != layout_type:
+                    st.info(f"ノード数が多いため {resolved_layout} レイアウトで計算します")
                 
-                if layout_type == "spring":
-                    pos = nx.spring_layout(G)
-                elif layout_type == "circular":
-                    pos = nx.circular_layout(G)
-                elif layout_type == "kamada_kawai":
-                    pos = nx.kamada_kawai_layout(G)
-                else:
-                    pos = nx.shell_layout(G)
+                # 座標はグラフとレイアウトごとにキャッシュされる
+                with st.spinner("レイアウトを計算しています..."):
+                    pos = graph_layout.compute_layout(G, layout_type)
+                
+                # 詳細度と表示範囲の設定
+                col1, col2 = st.columns(2)
+                with col1:
+                    lod_label = st.selectbox(
+                        "詳細度",
+                        ["自動", "概要（上位ノード＋エッジ密度）", "詳細（全ノード・全エッジ）"]
+                    )
+                with col2:
+                    top_k = st.slider("概要表示で強調する上位ノード数", 10, 1000, network_viz.DEFAULT_TOP_K)
                 
-                # ノードサイズを中心性に基づいて設定
-                node_sizes = [centrality.get(node, 0) * 3000 for node in G.nodes()]
+                with st.expander("表示範囲（ズーム）"):
+                    x_range = st.slider("X範囲", -1.0, 1.0, (-1.0, 1.0), 0.05)
+                    y_range = st.slider("Y範囲", -1.0, 1.0, (-1.0, 1.0), 0.05)
                 
-                nx.draw(G, pos, node_size=node_sizes, with_labels=True,
-                       node_color='lightblue', edge_color='gray', alpha=0.7)
+                lod = {"自動": "auto", "概要（上位ノード＋エッジ密度）": "overview"}.get(lod_label, "detail")
+                zoomed = x_range != (-1.0, 1.0) or y_range != (-1.0, 1.0)
                 
-                plt.title(f"ネットワーク図（{layout_type}レイアウト）")
-                st.pyplot(plt)
+                # ノードサイズを中心性に基づいて設定し、WebGLで描画
+                fig, draw_info = network_viz.network_figure(
+                    G, pos, centrality,
+                    node_colors=node_colors,
+                    top_k=top_k,
+                    lod=lod,
+                    x_range=x_range if zoomed else None,
+                    y_range=y_range if zoomed else None,
+                    title=f"ネットワーク図（{layout_type}レイアウト）"
+                )
+                show_chart(fig, use_container_width=True)
+                
+                if draw_info['level'] == 'overview':
+                    st.caption(
+                        f"概要表示: 上位 {draw_info['nodes_drawn']:,} ノードと "
+                        f"{draw_info['edges_aggregated']:,} 本のエッジの密度を表示しています。"
+                        "表示範囲を狭めると詳細表示に切り替わります。"
+                    )
+                else:
+                    st.caption(
+                        f"詳細表示: {draw_info['nodes_drawn']:,} ノード / "
+                        f"{draw_info['edges_drawn']:,} エッジを描画しています"
+                    )
                 
-                # 結果を保存
+                # 結果を保存（グラフ本体は load_graph のキャッシュが持つため、
+                # レポート用に構築条件・指紋・規模だけを残す）
                 st.session_state.analysis_results['network_analysis'] = {
-                    'graph': G,
+                    'graph': {
+                        'source': source_col,
+                        'target': target_col,
+                        'weight': weight_col,
+                        'directed': directed,
+                        'multigraph': multigraph,
+                        'fingerprint': network_utils.graph_fingerprint(G),
+                        'ノード数': summary['nodes'],
+                        'エッジ数': summary['edges'],
+                    },
                     'centrality': centrality_df
                 }
 
@@ -477,25 +1114,47 @@ elif workflow_step == "4. 可視化":
                     ["なし"] + df.columns.tolist()
                 )
                 
-                if color_col == "なし":
-                    fig = px.scatter(df, x=x_col, y=y_col, title=f"{x_col} vs {y_col}")
-                else:
-                    # カスタムカラーを適用
-                    color_map = None
-                    if 'custom_colors' in globals():
-                        color_map = custom_colors.get_color_mapping(df[color_col])
-                    
-                    fig = px.scatter(df, x=x_col, y=y_col, color=color_col,
-                                   title=f"{x_col} vs {y_col} (色: {color_col})",
-                                   color_discrete_map=color_map if color_map else None)
-                    
-                    # マーカーのサイズと境界線を設定
-                    fig.update_traces(marker=dict(
-                        size=10,
-                        line=dict(width=1, color='DarkSlateGrey')
-                    ))
+                # 描画方法（点数が多い場合は WebGL・密度集約・層化抽出に自動で切り替える）
+                with st.expander("描画設定"):
+                    mode = st.selectbox(
+                        "描画方法",
+                        plot_utils.SCATTER_MODES,
+                        format_func=lambda m: {'auto': '自動', 'svg': 'SVG', 'webgl': 'WebGL',
+                                               'sample': '層化抽出', 'density': '密度（2次元ヒストグラム）'}[m]
+                    )
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        webgl_min_points = st.number_input("WebGLに切り替える点数", min_value=0,
+                                                           value=plot_utils.WEBGL_MIN_POINTS, step=1000)
+                    with col2:
+                        density_min_points = st.number_input("集約・抽出に切り替える点数", min_value=0,
+                                                             value=plot_utils.DENSITY_MIN_POINTS, step=10000)
+                    with col3:
+                        max_points = st.number_input("抽出時の描画点数", min_value=100,
+                                                     value=plot_utils.SAMPLE_MAX_POINTS, step=10000)
                 
-                st.plotly_chart(fig)
+                color = None if color_col == "なし" else color_col
+                
+                # カスタムカラーを適用
+                color_map = None
+                if color is not None and 'custom_colors' in globals():
+                    color_map = custom_colors.get_color_mapping(df[color])
+                
+                title = f"{x_col} vs {y_col}" if color is None else f"{x_col} vs {y_col} (色: {color})"
+                fig, info = plot_utils.scatter_figure(
+                    df, x_col, y_col, color=color, mode=mode,
+                    color_discrete_map=color_map if color_map else None,
+                    title=title,
+                    webgl_min_points=webgl_min_points,
+                    density_min_points=density_min_points,
+                    max_points=max_points
+                )
+                
+                show_chart(fig)
+                if info['mode'] == 'density':
+                    st.caption(f"全{info['points_total']:,}点を2次元ヒストグラムに集約して表示しています")
+                else:
+                    st.caption(f"全{info['points_total']:,}点のうち{info['points_drawn']:,}点を描画しています（{info['mode']}）")
         
         elif viz_type == "折れ線グラフ":
             cols = df.columns.tolist()
@@ -504,7 +1163,7 @@ elif workflow_step == "4. 可視化":
             
             if y_cols:
                 fig = px.line(df, x=x_col, y=y_cols, title="折れ線グラフ")
-                st.plotly_chart(fig)
+                show_chart(fig)
         
         elif viz_type == "棒グラフ":
             cat_cols = df.select_dtypes(include=['object', 'category']).columns
@@ -528,7 +1187,7 @@ elif workflow_step == "4. 可視化":
                             color=x_col,
                             color_discrete_map=color_map if color_map else None)
                 fig.update_layout(showlegend=False)
-                st.plotly_chart(fig)
+                show_chart(fig)
         
         elif viz_type == "ヒートマップ":
             numeric_df = df.select_dtypes(include=[np.number])
@@ -542,7 +1201,7 @@ elif workflow_step == "4. 可視化":
                               color_continuous_scale='RdBu_r',
                               zmin=-1, zmax=1)
                 fig.update_layout(title="相関ヒートマップ")
-                st.plotly_chart(fig)
+                show_chart(fig)
         
         elif viz_type == "箱ひげ図":
             numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -569,7 +1228,7 @@ elif workflow_step == "4. 可視化":
                 else:
                     fig = px.box(df, y=y_col, title=f"{y_col}の分布")
                 
-                st.plotly_chart(fig)
+                show_chart(fig)
         
         elif viz_type == "3D散布図":
             numeric_cols = df.select_dtypes(include=[np.number]).columns
@@ -582,9 +1241,36 @@ elif workflow_step == "4. 可視化":
                 with col3:
                     z_col = st.selectbox("Z軸", numeric_cols)
                 
-                fig = px.scatter_3d(df, x=x_col, y=y_col, z=z_col,
-                                  title=f"3D散布図: {x_col} x {y_col} x {z_col}")
-                st.plotly_chart(fig)
+                col1, col2 = st.columns(2)
+                with col1:
+                    color_col = st.selectbox("色分け（オプション）", ["なし"] + df.columns.tolist())
+                with col2:
+                    mode = st.selectbox(
+                        "描画方法",
+                        plot_utils.SCATTER_3D_MODES,
+                        format_func=lambda m: {'auto': '自動', 'full': '全点', 'sample': '層化抽出',
+                                               'density': '密度（立方体ごとの件数）'}[m]
+                    )
+                max_points = st.number_input("全点を描画する上限・抽出時の描画点数", min_value=100,
+                                             value=plot_utils.SCATTER_3D_MAX_POINTS, step=10000)
+                color = None if color_col == "なし" else color_col
+                
+                # カスタムカラーを適用
+                color_map = None
+                if color is not None and 'custom_colors' in globals():
+                    color_map = custom_colors.get_color_mapping(df[color])
+                
+                fig, info = plot_utils.scatter_3d_figure(
+                    df, x_col, y_col, z_col, color=color, mode=mode,
+                    color_discrete_map=color_map if color_map else None,
+                    title=f"3D散布図: {x_col} x {y_col} x {z_col}",
+                    max_points=max_points
+                )
+                show_chart(fig)
+                if info['mode'] == 'density':
+                    st.caption(f"全{info['points_total']:,}点を{info['points_drawn']:,}個の立方体に集約して表示しています")
+                else:
+                    st.caption(f"全{info['points_total']:,}点のうち{info['points_drawn']:,}点を描画しています")
 
 # ステップ5: レポート作成
 elif workflow_step == "5. レポート作成":
@@ -605,51 +1291,78 @@ elif workflow_step == "5. レポート作成":
     include_analysis = st.checkbox("分析結果", value=True)
     include_viz = st.checkbox("可視化", value=True)
     
+    if st.session_state.analysis_results:
+        with st.expander("分析結果の保存状況"):
+            st.dataframe(st.session_state.analysis_results.stats())
+            st.caption(
+                f"メモリ上: {st.session_state.analysis_results.memory_bytes / 1024**2:.1f} MB / "
+                f"予算 {st.session_state.analysis_results.memory_budget / 1024**2:.0f} MB"
+            )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        report_format = st.selectbox(
+            "出力形式",
+            report_builder.REPORT_FORMATS,
+            format_func=lambda f: {'html': 'HTML（図を埋め込み）', 'markdown': 'Markdown'}[f]
+        )
+    with col2:
+        figure_names = st.session_state.figures.names()
+        selected_figures = st.multiselect("含める図", figure_names, default=figure_names,
+                                          disabled=not include_viz)
+    if report_format == 'markdown' and not report_builder.KALEIDO_AVAILABLE:
+        st.caption("kaleido がないため、Markdown 形式では Plotly の図を画像として埋め込めません")
+    
     # レポート生成
     if st.button("レポート生成", type="primary"):
-        report = f"# {report_title}\n\n"
-        report += f"作成日: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}\n\n"
-        
         if st.session_state.data is not None:
             df = st.session_state.data
             
+            # セクションごとの生成関数（統計量はデータ探索と同じキャッシュを使う）
+            sections = []
             if include_data_info:
-                report += "## データ基本情報\n\n"
-                report += f"- データサイズ: {len(df):,}行 × {len(df.columns)}列\n"
-                report += f"- メモリ使用量: {df.memory_usage().sum() / 1024**2:.2f} MB\n\n"
-                report += "### 列情報\n\n"
-                report += "| 列名 | データ型 | 非null数 | ユニーク値数 |\n"
-                report += "|------|----------|----------|------------|\n"
-                for col in df.columns:
-                    report += f"| {col} | {df[col].dtype} | {df[col].notna().sum()} | {df[col].nunique()} |\n"
-                report += "\n"
+                profile = load_column_profile(df, st.session_state.data_key)
+                sections.append(lambda: report_builder.data_info_blocks(df, profile))
             
             if include_stats:
-                report += "## 基本統計量\n\n"
                 numeric_df = df.select_dtypes(include=[np.number])
                 if len(numeric_df.columns) > 0:
-                    stats = numeric_df.describe()
-                    report += stats.to_markdown() + "\n\n"
+                    describe = load_describe(df, st.session_state.data_key)
+                    sections.append(lambda: report_builder.statistics_blocks(describe))
             
             if include_analysis and st.session_state.analysis_results:
-                report += "## 分析結果\n\n"
-                for key, value in st.session_state.analysis_results.items():
-                    report += f"### {key}\n\n"
-                    if isinstance(value, pd.DataFrame):
-                        report += value.to_markdown() + "\n\n"
-                    elif isinstance(value, dict):
-                        report += f"{json.dumps(value, indent=2, ensure_ascii=False)}\n\n"
+                sections.append(lambda: [('heading', 2, '分析結果')])
+                # 退避された結果はセクションの生成時に読み込む
+                results = st.session_state.analysis_results
+                for key in list(results):
+                    sections.append(lambda key=key: report_builder.analysis_blocks(key, results[key]))
+            
+            if include_viz and selected_figures:
+                sections.append(lambda: [('heading', 2, '可視化')])
+                for name in selected_figures:
+                    sections.append(lambda name=name: report_builder.figure_blocks(name))
+            
+            with st.spinner("レポートを生成しています..."):
+                result = report_builder.write_report(
+                    sections, report_title, fmt=report_format, registry=st.session_state.figures
+                )
+            st.success(f"✅ {result['sections']}セクションを{result['seconds']:.2f}秒で出力しました: {result['path']}")
+            
+            report = result['path'].read_text(encoding='utf-8')
             
             # レポート表示
             st.markdown("### レポートプレビュー")
-            st.markdown(report)
+            if report_format == 'html':
+                st.components.v1.html(report, height=800, scrolling=True)
+            else:
+                st.markdown(report)
             
             # ダウンロード
             st.download_button(
-                label="レポートをダウンロード（Markdown）",
+                label=f"レポートをダウンロード（{'HTML' if report_format == 'html' else 'Markdown'}）",
                 data=report,
-                file_name=f"{report_title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
-                mime="text/markdown"
+                file_name=f"{report_title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{result['path'].suffix[1:]}",
+                mime="text/html" if report_format == 'html' else "text/markdown"
             )
             
             # 処理済みデータの保存オプション
@@ -0,0 +1,222 @@
+"""
+ネットワーク可視化
+Plotly の WebGL トレース（Scattergl）で大規模グラフを詳細度(LOD)付きで描画する
+"""
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from network_utils import to_csr
+
+# 詳細表示（全エッジ描画）を行うエッジ数の上限
+DETAIL_MAX_EDGES = 20_000
+# 概要表示で強調する中心性上位ノードの既定数
+DEFAULT_TOP_K = 200
+# ラベルを表示するノード数の上限
+MAX_LABELS = 30
+
+LOD_LEVELS = ['auto', 'overview', 'detail']
+
+
+def community_colors(partition, palette=None, other_color='#cccccc'):
+    """
+    コミュニティ番号からノードの色を決める
+
+    コミュニティ番号はサイズの大きい順に振られている前提で、上位のコミュニティから
+    パレットの色を割り当て、色が足りない小さなコミュニティは other_color にする。
+
+    Parameters:
+    -----------
+    partition : dict
+        ノードとコミュニティ番号の対応
+    palette : list or None
+        使用する色のリスト（None の場合は Plotly の既定色）
+    other_color : str
+        パレット外のコミュニティの色
+
+    Returns:
+    --------
+    dict : ノードと色の対応
+    """
+    palette = list(palette) if palette else px.colors.qualitative.Plotly
+    return {
+        node: palette[community] if community < len(palette) else other_color
+        for node, community in partition.items()
+    }
+
+
+def _node_coordinates(nodes, pos):
+    """ノード順に並べた n×2 の座標配列を返す"""
+    return np.array([pos[node] for node in nodes.tolist()], dtype=np.float64).reshape(-1, 2)
+
+
+def _batched_edge_trace(coords, row, col):
+    """
+    全エッジを1本のトレースにまとめる
+
+    各エッジの座標を NaN 区切りで連結することで、エッジごとに描画オブジェクトを
+    作らずに済む。
+    """
+    num_edges = len(row)
+    xs = np.full(num_edges * 3, np.nan)
+    ys = np.full(num_edges * 3, np.nan)
+    xs[0::3], xs[1::3] = coords[row, 0], coords[col, 0]
+    ys[0::3], ys[1::3] = coords[row, 1], coords[col, 1]
+    return go.Scattergl(
+        x=xs, y=ys,
+        mode='lines',
+        line=dict(width=0.5, color='rgba(120, 120, 120, 0.5)'),
+        hoverinfo='skip',
+        showlegend=False,
+        name='エッジ'
+    )
+
+
+def _edge_density_trace(coords, row, col, bins):
+    """
+    エッジを線分上の点で標本化し、2次元ヒストグラムとして集約する
+
+    エッジ数に関係なく bins×bins のセルだけを描画するので、概要表示でも
+    エッジの密集具合を把握できる。
+    """
+    samples = np.linspace(0.1, 0.9, 5)
+    start, end = coords[row], coords[col]
+    points = (start[None, :, :] * (1 - samples)[:, None, None]
+              + end[None, :, :] * samples[:, None, None]).reshape(-1, 2)
+    counts, x_edges, y_edges = np.histogram2d(points[:, 0], points[:, 1], bins=bins)
+    return go.Heatmap(
+        z=np.log1p(counts.T),
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        colorscale='Greys',
+        showscale=False,
+        hoverinfo='skip',
+        name='エッジ密度'
+    )
+
+
+def network_figure(G, pos, centrality=None, node_colors=None, top_k=DEFAULT_TOP_K,
+                   lod='auto', x_range=None, y_range=None, density_bins=150, title=None):
+    """
+    ネットワーク図を WebGL で描画する
+
+    lod='overview' では中心性上位 top_k ノードとエッジ密度のヒートマップのみを、
+    lod='detail' では表示範囲内の全ノード・全エッジを描画する。
+    lod='auto' の場合、表示範囲内のエッジ数が DETAIL_MAX_EDGES 以下なら詳細表示になる。
+
+    Parameters:
+    -----------
+    G : グラフ（NetworkX または CSRGraph）
+    pos : dict
+        ノードと座標の対応
+    centrality : dict or None
+        ノードの中心性（マーカーサイズと上位ノードの選択に使う）
+    node_colors : dict or None
+        ノードと色の対応
+    top_k : int
+        概要表示で描画する上位ノード数
+    lod : str
+        'auto', 'overview', 'detail' のいずれか
+    x_range, y_range : tuple or None
+        表示範囲（ズーム）。範囲外のノードとそれだけを結ぶエッジは描画しない
+    density_bins : int
+        エッジ密度ヒートマップの分割数
+    title : str or None
+        図のタイトル
+
+    Returns:
+    --------
+    tuple : (plotly.graph_objects.Figure, dict)
+        dict は描画した詳細度、ノード数、個別に描画したエッジ数、ヒートマップに集約したエッジ数
+    """
+    if lod not in LOD_LEVELS:
+        raise ValueError(f"未対応の詳細度です: {lod}")
+
+    matrix, nodes = to_csr(G)
+    coords = _node_coordinates(nodes, pos)
+    edges = matrix.tocoo()
+    row, col = edges.row, edges.col
+    if not G.is_directed():
+        # 無向グラフの隣接行列は対称なので片側だけ使う
+        keep = row <= col
+        row, col = row[keep], col[keep]
+
+    # 表示範囲内のノードと、少なくとも一端が範囲内にあるエッジに絞る
+    visible = np.ones(len(nodes), dtype=bool)
+    if x_range is not None:
+        visible &= (coords[:, 0] >= x_range[0]) & (coords[:, 0] <= x_range[1])
+    if y_range is not None:
+        visible &= (coords[:, 1] >= y_range[0]) & (coords[:, 1] <= y_range[1])
+    edge_visible = visible[row] | visible[col]
+    row, col = row[edge_visible], col[edge_visible]
+    visible_index = np.flatnonzero(visible)
+
+    if centrality is not None:
+        scores = np.array([centrality.get(node, 0.0) for node in nodes.tolist()], dtype=np.float64)
+    else:
+        scores = np.asarray(matrix.getnnz(axis=1), dtype=np.float64)
+    max_score = scores[visible_index].max() if len(visible_index) else 0.0
+    if max_score <= 0:
+        max_score = 1.0
+
+    if lod == 'auto':
+        lod = 'detail' if len(row) <= DETAIL_MAX_EDGES else 'overview'
+
+    fig = go.Figure()
+    if lod == 'detail':
+        fig.add_trace(_batched_edge_trace(coords, row, col))
+        shown = visible_index
+    else:
+        if len(row) > 0:
+            fig.add_trace(_edge_density_trace(coords, row, col, density_bins))
+        order = np.argsort(scores[visible_index])[::-1]
+        shown = visible_index[order[:top_k]]
+
+    labels = nodes[shown]
+    if node_colors is not None:
+        colors = [node_colors.get(node, '#888888') for node in labels.tolist()]
+    else:
+        colors = scores[shown]
+    fig.add_trace(go.Scattergl(
+        x=coords[shown, 0], y=coords[shown, 1],
+        mode='markers',
+        marker=dict(
+            size=5 + 20 * scores[shown] / max_score,
+            color=colors,
+            colorscale='Viridis' if node_colors is None else None,
+            line=dict(width=0.5, color='white')
+        ),
+        text=[f"{label}<br>中心性: {score:.4f}" for label, score in zip(labels.tolist(), scores[shown])],
+        hoverinfo='text',
+        showlegend=False,
+        name='ノード'
+    ))
+
+    # ラベルは中心性上位のノードのみ表示する
+    top_labels = shown[np.argsort(scores[shown])[::-1][:MAX_LABELS]]
+    fig.add_trace(go.Scattergl(
+        x=coords[top_labels, 0], y=coords[top_labels, 1],
+        mode='text',
+        text=[str(label) for label in nodes[top_labels].tolist()],
+        textposition='top center',
+        hoverinfo='skip',
+        showlegend=False
+    ))
+
+    fig.update_layout(
+        title=title,
+        xaxis=dict(visible=False, range=x_range),
+        yaxis=dict(visible=False, range=y_range, scaleanchor='x'),
+        plot_bgcolor='white',
+        margin=dict(l=10, r=10, t=40 if title else 10, b=10),
+        height=700
+    )
+
+    info = {
+        'level': lod,
+        'nodes_drawn': int(len(shown)),
+        'edges_drawn': int(len(row)) if lod == 'detail' else 0,
+        'edges_aggregated': int(len(row)) if lod == 'overview' else 0,
+    }
+    return fig, info
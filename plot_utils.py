@@ -0,0 +1,263 @@
+"""
+プロットユーティリティ
+点数に応じて WebGL・密度集約・層化抽出を切り替え、大量の点を含む散布図を描画する関数群
+"""
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from eda_utils import stratified_sample_indices
+
+# マーカーに境界線を付ける点数の上限（custom_colors はオプションのため、ない場合は同じ値を使う）
+try:
+    from custom_colors import OUTLINE_MAX_POINTS
+except ImportError:
+    OUTLINE_MAX_POINTS = 5_000
+
+# これを超える点数では SVG ではなく WebGL で描画する
+WEBGL_MIN_POINTS = 5_000
+# これを超える点数では個々の点を描かず、密度（2次元ヒストグラム）に集約する
+DENSITY_MIN_POINTS = 300_000
+# 抽出モードで描画する点数の上限
+SAMPLE_MAX_POINTS = 100_000
+# 3D散布図で個々の点を描画する点数の上限
+SCATTER_3D_MAX_POINTS = 50_000
+# 色分けの列の値の種類がこれ以下なら、抽出時にその構成比を保つ
+STRATIFY_MAX_CATEGORIES = 100
+
+SCATTER_MODES = ['auto', 'svg', 'webgl', 'sample', 'density']
+SCATTER_3D_MODES = ['auto', 'full', 'sample', 'density']
+
+
+def choose_scatter_mode(num_points, has_color=False, webgl_min_points=WEBGL_MIN_POINTS,
+                        density_min_points=DENSITY_MIN_POINTS):
+    """
+    点数から散布図の描画方法を決める
+
+    色分けがある場合、密度に集約するとカテゴリの違いが見えなくなるため、
+    密度ではなく層化抽出を使う。
+
+    Parameters:
+    -----------
+    num_points : int
+        点数
+    has_color : bool
+        色分けするかどうか
+    webgl_min_points : int
+        WebGL に切り替える点数
+    density_min_points : int
+        密度集約（色分けありの場合は抽出）に切り替える点数
+
+    Returns:
+    --------
+    str : 'svg', 'webgl', 'sample', 'density' のいずれか
+    """
+    if num_points > density_min_points:
+        return 'sample' if has_color else 'density'
+    if num_points > webgl_min_points:
+        return 'webgl'
+    return 'svg'
+
+
+def _valid_rows(df, columns):
+    """指定した列がすべて欠損でない行だけを残す"""
+    return df[columns].dropna() if df[columns].isna().any().any() else df[columns]
+
+
+def _sample(data, max_points, color, seed):
+    """
+    色分けの列がカテゴリ（値の種類が少ない）なら層の構成比を保って抽出し、
+    連続値など種類の多い列では単純無作為抽出にする
+    """
+    strata = None
+    if color is not None and data[color].nunique(dropna=False) <= STRATIFY_MAX_CATEGORIES:
+        strata = data[color].to_numpy()
+    return data.iloc[stratified_sample_indices(len(data), max_points, strata, seed)]
+
+
+def _outline(fig, num_points):
+    """点数が少ない場合のみマーカーに境界線を付ける"""
+    if num_points <= OUTLINE_MAX_POINTS:
+        fig.update_traces(marker=dict(size=10, line=dict(width=1, color='DarkSlateGrey')))
+    return fig
+
+
+def density_heatmap(x, y, bins=200, title=None, x_label=None, y_label=None):
+    """
+    点を2次元ヒストグラムに集約したヒートマップを作る
+
+    Parameters:
+    -----------
+    x, y : array-like
+        座標（欠損を含まないこと）
+    bins : int
+        各軸の分割数
+    title : str or None
+        図のタイトル
+    x_label, y_label : str or None
+        軸ラベル
+
+    Returns:
+    --------
+    plotly.graph_objects.Figure
+    """
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    fig = go.Figure(go.Heatmap(
+        z=np.where(counts.T > 0, np.log10(counts.T + 1), np.nan),
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        customdata=counts.T,
+        colorscale='Viridis',
+        colorbar=dict(title='log10(件数+1)'),
+        hovertemplate='x=%{x}<br>y=%{y}<br>件数=%{customdata:.0f}<extra></extra>'
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    return fig
+
+
+def scatter_figure(df, x, y, color=None, mode='auto', color_discrete_map=None, title=None,
+                   webgl_min_points=WEBGL_MIN_POINTS, density_min_points=DENSITY_MIN_POINTS,
+                   max_points=SAMPLE_MAX_POINTS, bins=200, seed=42):
+    """
+    点数に応じた方法で散布図を作る
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    x, y : str
+        X軸・Y軸の列
+    color : str or None
+        色分けの列
+    mode : str
+        'auto', 'svg', 'webgl', 'sample', 'density' のいずれか
+    color_discrete_map : dict or None
+        カテゴリと色の対応
+    title : str or None
+        図のタイトル
+    webgl_min_points, density_min_points : int
+        mode='auto' の切り替え点数
+    max_points : int
+        抽出モードで描画する点数
+    bins : int
+        密度モードの各軸の分割数
+    seed : int
+        抽出の乱数シード
+
+    Returns:
+    --------
+    tuple : (plotly.graph_objects.Figure, dict)
+        dict は描画方法、欠損を除いた全点数、個別に描画した点数、ヒストグラムに集約した点数
+    """
+    if mode not in SCATTER_MODES:
+        raise ValueError(f"未対応の描画方法です: {mode}")
+
+    columns = list(dict.fromkeys([x, y] + ([color] if color is not None else [])))
+    data = _valid_rows(df, columns)
+    # 欠損のため描画しない行は全点数に含めない
+    num_valid = len(data)
+    if mode == 'auto':
+        mode = choose_scatter_mode(len(data), color is not None, webgl_min_points, density_min_points)
+
+    if mode == 'density':
+        fig = density_heatmap(data[x].to_numpy(), data[y].to_numpy(), bins=bins,
+                              title=title, x_label=x, y_label=y)
+        drawn, aggregated = 0, len(data)
+    else:
+        if mode == 'sample':
+            data = _sample(data, max_points, color, seed)
+        fig = px.scatter(data, x=x, y=y, color=color, title=title,
+                         color_discrete_map=color_discrete_map,
+                         render_mode='svg' if mode == 'svg' else 'webgl')
+        drawn, aggregated = len(data), 0
+        if color is not None:
+            _outline(fig, drawn)
+
+    info = {
+        'mode': mode,
+        'points_total': int(num_valid),
+        'points_drawn': int(drawn),
+        'points_aggregated': int(aggregated),
+    }
+    return fig, info
+
+
+def scatter_3d_figure(df, x, y, z, color=None, mode='auto', color_discrete_map=None, title=None,
+                      max_points=SCATTER_3D_MAX_POINTS, bins=30, seed=42):
+    """
+    点数に応じた方法で3D散布図を作る
+
+    'density' では空間を bins^3 個の立方体に分け、点を含む立方体の中心を
+    件数で色付け・大きさ付けして描画する。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    x, y, z : str
+        各軸の列
+    color : str or None
+        色分けの列
+    mode : str
+        'auto', 'full', 'sample', 'density' のいずれか
+    color_discrete_map : dict or None
+        カテゴリと色の対応
+    title : str or None
+        図のタイトル
+    max_points : int
+        mode='auto' で全点を描く上限、および抽出モードで描画する点数
+    bins : int
+        密度モードの各軸の分割数
+    seed : int
+        抽出の乱数シード
+
+    Returns:
+    --------
+    tuple : (plotly.graph_objects.Figure, dict)
+        dict は描画方法、欠損を除いた全点数、描画したマーカー数、立方体に集約した点数
+    """
+    if mode not in SCATTER_3D_MODES:
+        raise ValueError(f"未対応の描画方法です: {mode}")
+
+    columns = list(dict.fromkeys([x, y, z] + ([color] if color is not None else [])))
+    data = _valid_rows(df, columns)
+    # 欠損のため描画しない行は全点数に含めない
+    num_valid = len(data)
+    if mode == 'auto':
+        if len(data) <= max_points:
+            mode = 'full'
+        else:
+            mode = 'sample' if color is not None else 'density'
+
+    if mode == 'density':
+        counts, edges = np.histogramdd(data[[x, y, z]].to_numpy(dtype=np.float64), bins=bins)
+        cells = np.nonzero(counts)
+        centers = [(edge[:-1] + edge[1:])[index] / 2 for edge, index in zip(edges, cells)]
+        values = counts[cells]
+        # 該当する点がない場合は空の図にする
+        scale = np.log1p(values) / np.log1p(values.max()) if len(values) else values
+        fig = go.Figure(go.Scatter3d(
+            x=centers[0], y=centers[1], z=centers[2],
+            mode='markers',
+            marker=dict(size=2 + 8 * scale, color=np.log10(values + 1), colorscale='Viridis',
+                        colorbar=dict(title='log10(件数+1)'), opacity=0.8),
+            customdata=values,
+            hovertemplate='件数=%{customdata:.0f}<extra></extra>'
+        ))
+        fig.update_layout(title=title, scene=dict(xaxis_title=x, yaxis_title=y, zaxis_title=z))
+        drawn, aggregated = len(values), len(data)
+    else:
+        if mode == 'sample':
+            data = _sample(data, max_points, color, seed)
+        fig = px.scatter_3d(data, x=x, y=y, z=z, color=color, title=title,
+                            color_discrete_map=color_discrete_map)
+        drawn, aggregated = len(data), 0
+
+    info = {
+        'mode': mode,
+        'points_total': int(num_valid),
+        'points_drawn': int(drawn),
+        'points_aggregated': int(aggregated),
+    }
+    return fig, info
@@ -0,0 +1,281 @@
+"""
+プロンプト用データ要約
+データセットごとに要約を一度だけ作ってキャッシュし、質問に関係する部分だけを
+トークン数の上限に収まるよう切り詰めてプロンプトに渡す
+"""
+
+import re
+
+import numpy as np
+
+from cache_utils import LRUCache
+from eda_utils import correlation_pairs_from_matrix, hashable_frame
+from sql_engine import frame_fingerprint
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+# 相関行列を計算する数値列数の上限
+CORRELATION_MAX_COLUMNS = 50
+# カテゴリ列ごとに載せる頻出値の数
+TOP_VALUES = 5
+# 先頭の行として載せる行数
+SAMPLE_ROWS = 5
+
+SECTION_TITLES = {
+    'schema': '列の一覧（型 / 欠損数 / ユニーク値数）',
+    'numeric': '数値列の統計（平均 / 標準偏差 / 最小 / 中央値 / 最大）',
+    'categorical': 'カテゴリ列の頻出値（値: 件数）',
+    'missing': '欠損値のある列（欠損数 / 割合）',
+    'datetime': '日時列の範囲',
+    'correlation': '相関の高い列の組（相関係数）',
+    'sample': '先頭の行（CSV）',
+}
+
+# 質問にこれらの語が含まれる場合に該当するセクションを送る
+SECTION_KEYWORDS = {
+    'numeric': ['統計', '平均', '分布', '外れ値', '標準偏差', '分散', '最大', '最小', '中央値',
+                'ヒストグラム', '数値', 'スケール', '正規化', 'mean', 'describe', 'outlier'],
+    'categorical': ['カテゴリ', '頻度', '種類', '件数', '内訳', 'ラベル', 'エンコード', 'value_counts'],
+    'missing': ['欠損', 'null', 'nan', '補完', 'クレンジング', '前処理', 'missing'],
+    'datetime': ['時系列', '日付', '日時', '期間', 'トレンド', '季節', '月別', '年別', 'date', 'time'],
+    'correlation': ['相関', '関係', '関連', '回帰', 'corr'],
+    'sample': ['先頭', 'サンプル', '中身', '例', 'head', 'ネットワーク', '変換'],
+}
+
+# 質問からセクションを判断できない場合に送るもの
+DEFAULT_SECTIONS = ['numeric', 'missing']
+
+_SUMMARY_CACHE = LRUCache(maxsize=16)
+
+
+def estimate_tokens(text):
+    """
+    文字列のおおよそのトークン数
+
+    英数字は4文字で約1トークン、日本語などそれ以外の文字は1文字で約1トークンとして数える。
+
+    Parameters:
+    -----------
+    text : str
+
+    Returns:
+    --------
+    int
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _fmt(value):
+    """数値を有効数字4桁の短い文字列にする"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return '-'
+    if isinstance(value, (int, np.integer)):
+        return f"{int(value):,}"
+    return f"{float(value):.4g}"
+
+
+def _short(value, limit=30):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class DatasetSummary:
+    """
+    データセットの要約（セクションごとの行のリスト）
+
+    各行は (列名, 文字列) の組で、列名は質問に含まれる列を優先して残すために使う。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    name : str or None
+        ファイル名
+    """
+
+    def __init__(self, df, name=None):
+        self.name = name
+        self.shape = df.shape
+        self.columns = [str(col) for col in df.columns]
+        self.sections = {}
+
+        try:
+            unique = df.nunique()
+        except TypeError:
+            # JSON 由来のリストや辞書を含む列は、値を文字列にして数える
+            df = hashable_frame(df)
+            unique = df.nunique()
+
+        numeric = df.select_dtypes(include=[np.number])
+        datetime = df.select_dtypes(include=['datetime64', 'datetimetz'])
+        categorical = df.select_dtypes(include=['object', 'category', 'bool', 'string'])
+        missing = df.isna().sum()
+
+        self.sections['schema'] = [
+            (str(col), f"{col}: {df[col].dtype} / {_fmt(missing[col])} / {_fmt(unique[col])}")
+            for col in df.columns
+        ]
+
+        if len(numeric.columns) > 0:
+            stats = numeric.describe().T
+            self.sections['numeric'] = [
+                (str(col), f"{col}: " + " / ".join(_fmt(row[stat]) for stat in ['mean', 'std', 'min', '50%', 'max']))
+                for col, row in stats.iterrows()
+            ]
+
+        self.sections['categorical'] = []
+        for col in categorical.columns:
+            counts = df[col].value_counts().head(TOP_VALUES)
+            values = ", ".join(f"{_short(value)}: {_fmt(count)}" for value, count in counts.items())
+            self.sections['categorical'].append((str(col), f"{col}（{_fmt(unique[col])}種類）: {values}"))
+
+        with_missing = missing[missing > 0].sort_values(ascending=False)
+        self.sections['missing'] = [
+            (str(col), f"{col}: {_fmt(count)} / {count / max(len(df), 1) * 100:.1f}%")
+            for col, count in with_missing.items()
+        ] or [(None, "欠損値はありません")]
+
+        self.sections['datetime'] = [
+            (str(col), f"{col}: {df[col].min()} 〜 {df[col].max()}")
+            for col in datetime.columns
+        ]
+
+        if len(numeric.columns) > 1:
+            # 列が多い場合は先頭の CORRELATION_MAX_COLUMNS 列だけで計算する
+            corr = numeric.iloc[:, :CORRELATION_MAX_COLUMNS].corr()
+            pairs = correlation_pairs_from_matrix(corr, threshold=0.3, top_k=30)
+            self.sections['correlation'] = [
+                (str(row['変数1']), f"{row['変数1']} - {row['変数2']}: {row['相関係数']:.3f}")
+                for _, row in pairs.iterrows()
+            ] or [(None, "|r| > 0.3 の組はありません")]
+
+        head = df.head(SAMPLE_ROWS)
+        self.sections['sample'] = [(None, ",".join(self.columns))] + [
+            (None, ",".join(_short(value, 20) for value in row)) for row in head.itertuples(index=False)
+        ]
+
+    def header(self):
+        name = f"ファイル: {self.name} / " if self.name else ""
+        return f"{name}{self.shape[0]:,}行 × {self.shape[1]:,}列"
+
+
+def get_summary(df, fingerprint=None, name=None):
+    """
+    データセットの要約を返す（指紋ごとにキャッシュし、同じデータでは再計算しない）
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    fingerprint : str or None
+        データの指紋（None の場合は内容から計算する）
+    name : str or None
+        ファイル名
+
+    Returns:
+    --------
+    DatasetSummary
+    """
+    key = (fingerprint or frame_fingerprint(df), name)
+    summary = _SUMMARY_CACHE.get(key)
+    if summary is None:
+        summary = DatasetSummary(df, name)
+        _SUMMARY_CACHE.set(key, summary)
+    return summary
+
+
+def mentioned_columns(question, columns):
+    """
+    質問に含まれる列名（長い名前から順に照合する）
+
+    英数字の列名は単語の一部に一致しても数えない（'v' が 'value' に一致しないように）。
+    """
+    text = question.lower()
+    found = []
+    for col in sorted(columns, key=len, reverse=True):
+        name = col.lower()
+        pattern = re.escape(name)
+        if name.isascii():
+            pattern = rf'(?<![a-z0-9_]){pattern}(?![a-z0-9_])'
+        if re.search(pattern, text):
+            found.append(col)
+            text = re.sub(pattern, ' ', text)
+    return found
+
+
+def relevant_sections(question, summary):
+    """
+    質問に関係するセクション
+
+    Parameters:
+    -----------
+    question : str
+        ユーザーの質問
+    summary : DatasetSummary
+
+    Returns:
+    --------
+    list : 'schema' と、キーワードが一致したセクション（なければ DEFAULT_SECTIONS）
+    """
+    text = question.lower()
+    sections = [name for name, keywords in SECTION_KEYWORDS.items()
+                if any(keyword.lower() in text for keyword in keywords)]
+    if not sections:
+        sections = list(DEFAULT_SECTIONS)
+    return ['schema'] + [name for name in sections if summary.sections.get(name)]
+
+
+def render_summary(summary, question, budget=DEFAULT_TOKEN_BUDGET):
+    """
+    質問に関係するセクションをトークン数の上限内で文字列にする
+
+    上限はセクションごとに均等に割り当て、使い切らなかった分は後のセクションに回す。
+    各セクションでは質問に含まれる列の行を先に載せる。
+
+    Parameters:
+    -----------
+    summary : DatasetSummary
+    question : str
+        ユーザーの質問
+    budget : int
+        トークン数の上限
+
+    Returns:
+    --------
+    tuple : (str, list, int) 要約、使ったセクション、推定トークン数
+    """
+    mentioned = set(mentioned_columns(question, summary.columns))
+    sections = relevant_sections(question, summary)
+
+    lines = [summary.header()]
+    used_sections = []
+    remaining = budget - estimate_tokens(lines[0])
+    for i, name in enumerate(sections):
+        share = remaining // (len(sections) - i)
+        rows = summary.sections[name]
+        if mentioned:
+            rows = ([row for row in rows if row[0] in mentioned] +
+                    [row for row in rows if row[0] not in mentioned])
+
+        title = f"\n# {SECTION_TITLES[name]}"
+        used = estimate_tokens(title)
+        body = []
+        for _, line in rows:
+            cost = estimate_tokens(line) + 1
+            if used + cost > share:
+                break
+            body.append(line)
+            used += cost
+        if not body:
+            continue
+        if len(body) < len(rows):
+            omitted = f"…（他{len(rows) - len(body)}件は省略）"
+            body.append(omitted)
+            used += estimate_tokens(omitted)
+        lines += [title] + body
+        used_sections.append(name)
+        remaining -= used
+
+    text = "\n".join(lines)
+    return text, used_sections, estimate_tokens(text)
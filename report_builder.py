@@ -0,0 +1,405 @@
+"""
+レポート生成
+キャッシュ済みの統計量と描画済みの図を使い、セクションを並列に生成して HTML/Markdown ファイルへ順に書き出す
+"""
+
+import base64
+import html
+import importlib.util
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
+
+# Plotly の図を PNG に変換する kaleido（オプション）
+KALEIDO_AVAILABLE = importlib.util.find_spec('kaleido') is not None
+
+REPORT_FORMATS = ['html', 'markdown']
+REPORT_DIR = Path("output/reports")
+
+# レポートの表に含める最大行数
+MAX_TABLE_ROWS = 200
+# 保持する図の最大数（古いものから破棄）
+FIGURE_REGISTRY_SIZE = 30
+# HTML に操作可能な図として埋め込む最大点数（超える図は PNG にするか省略する）
+REPORT_FIGURE_MAX_POINTS = 200_000
+
+_PLOTLY_JS = f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+_HTML_STYLE = """<style>
+body { font-family: sans-serif; max-width: 1100px; margin: 2em auto; line-height: 1.6; }
+table { border-collapse: collapse; margin: 1em 0; font-size: 0.9em; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: right; }
+th { background: #f3f3f3; }
+pre { background: #f6f8fa; padding: 1em; overflow-x: auto; }
+img { max-width: 100%; }
+</style>"""
+
+
+class FigureRegistry:
+    """
+    描画済みの図を保持する
+
+    Plotly の図は参照だけを保持し、JSON・PNG への変換はレポートを作るときに行う
+    （Streamlit の再実行のたびに大きな図を変換しない）。Matplotlib の図は PNG として保持する。
+    同じ名前で登録すると上書きされるため、Streamlit の再実行で図が増え続けることはない。
+
+    Parameters:
+    -----------
+    maxsize : int
+        保持する図の最大数
+    """
+
+    def __init__(self, maxsize=FIGURE_REGISTRY_SIZE):
+        self.maxsize = maxsize
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, fig):
+        """
+        図を登録する
+
+        Parameters:
+        -----------
+        name : str
+            図の名前（レポートの見出しになる）
+        fig : plotly.graph_objects.Figure or matplotlib.figure.Figure
+            描画済みの図
+        """
+        if hasattr(fig, 'savefig'):
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+            entry = {'kind': 'png', 'payload': buffer.getvalue()}
+        else:
+            entry = {'kind': 'plotly', 'figure': fig}
+
+        with self._lock:
+            previous = self._figures.get(name)
+            if previous is not None and previous.get('figure', previous.get('payload')) is fig:
+                self._figures.move_to_end(name)
+                return
+            self._figures[name] = entry
+            self._figures.move_to_end(name)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+
+    def register_image(self, name, image):
+        """
+        PNG のバイト列をそのまま図として登録する
+
+        Parameters:
+        -----------
+        name : str
+            図の名前
+        image : bytes
+            PNG のバイト列（サンドボックスの実行結果など）
+        """
+        entry = {'kind': 'png', 'payload': image}
+        with self._lock:
+            self._figures[name] = entry
+            self._figures.move_to_end(name)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+
+    def names(self):
+        """登録順の図の名前"""
+        with self._lock:
+            return list(self._figures)
+
+    def figure(self, name):
+        """Plotly の図（PNG の図の場合は None）"""
+        entry = self._figures[name]
+        return entry['figure'] if entry['kind'] == 'plotly' else None
+
+    def figure_json(self, name):
+        """Plotly の図の JSON（PNG の図の場合は None）"""
+        entry = self._figures[name]
+        return entry['figure'].to_json() if entry['kind'] == 'plotly' else None
+
+    def points(self, name):
+        """Plotly の図に含まれる点数（PNG の図の場合は0）"""
+        entry = self._figures[name]
+        if entry['kind'] != 'plotly':
+            return 0
+        total = 0
+        for trace in entry['figure'].data:
+            for attr in ('x', 'y', 'z', 'values'):
+                value = getattr(trace, attr, None)
+                if value is not None:
+                    total += len(value)
+                    break
+        return total
+
+    def image(self, name):
+        """
+        図の PNG を返す
+
+        Plotly の図は kaleido がある場合のみ変換し、結果を保持する。
+
+        Returns:
+        --------
+        bytes or None : PNG のバイト列（変換できない場合は None）
+        """
+        entry = self._figures[name]
+        if entry['kind'] == 'png':
+            return entry['payload']
+        if not KALEIDO_AVAILABLE:
+            return None
+        if 'image' not in entry:
+            entry['image'] = entry['figure'].to_image(format='png', width=1000, height=600)
+        return entry['image']
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+    def __len__(self):
+        return len(self._figures)
+
+
+def _json_default(value):
+    """json.dumps で扱えない値を文字列や数値に変換する"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, pd.Period)):
+        return str(value)
+    return repr(value)
+
+
+def _format_float(value):
+    """整数値はそのまま、それ以外は有効数字4桁で表示する"""
+    if value.is_integer() and abs(value) < 1e15:
+        return f"{value:,.0f}"
+    return f"{value:.4g}"
+
+
+def _markdown_table(df, max_rows):
+    """DataFrame を Markdown の表にする（tabulate を使わない）"""
+    shown = df.head(max_rows)
+    if not isinstance(shown.index, pd.RangeIndex):
+        shown = shown.rename_axis(shown.index.names if any(shown.index.names) else ['']).reset_index()
+
+    def cell(value):
+        if isinstance(value, float):
+            return _format_float(value)
+        return str(value).replace('|', '\\|').replace('\n', ' ')
+
+    lines = ['| ' + ' | '.join(cell(col) for col in shown.columns) + ' |',
+             '|' + '---|' * len(shown.columns)]
+    lines += ['| ' + ' | '.join(cell(value) for value in row) + ' |'
+              for row in shown.itertuples(index=False, name=None)]
+    return '\n'.join(lines)
+
+
+def _render_markdown(blocks, registry):
+    parts = []
+    for block in blocks:
+        kind = block[0]
+        if kind == 'heading':
+            parts.append(f"{'#' * block[1]} {block[2]}")
+        elif kind == 'text':
+            parts.append(block[1])
+        elif kind == 'bullets':
+            parts.append('\n'.join(f"- {item}" for item in block[1]))
+        elif kind == 'table':
+            table = block[1]
+            parts.append(_markdown_table(table, MAX_TABLE_ROWS))
+            if len(table) > MAX_TABLE_ROWS:
+                parts.append(f"（先頭{MAX_TABLE_ROWS:,}行のみ表示、全{len(table):,}行）")
+        elif kind == 'json':
+            parts.append(f"```json\n{json.dumps(block[1], indent=2, ensure_ascii=False, default=_json_default)}\n```")
+        elif kind == 'code':
+            parts.append(f"```\n{block[1]}\n```")
+        elif kind == 'figure':
+            image = registry.image(block[1])
+            if image is not None:
+                encoded = base64.b64encode(image).decode('ascii')
+                parts.append(f"![{block[1]}](data:image/png;base64,{encoded})")
+            elif registry.points(block[1]) > REPORT_FIGURE_MAX_POINTS:
+                parts.append(f"（{block[1]}: 点数が多いため、この図は省略しました）")
+            else:
+                parts.append(f"（{block[1]}: インタラクティブな図は HTML 形式のレポートに含まれます。"
+                             "kaleido をインストールすると画像として含めます）")
+    return '\n\n'.join(parts) + '\n\n'
+
+
+def _render_html(blocks, registry):
+    parts = []
+    for block in blocks:
+        kind = block[0]
+        if kind == 'heading':
+            parts.append(f"<h{block[1]}>{html.escape(str(block[2]))}</h{block[1]}>")
+        elif kind == 'text':
+            parts.append(f"<p>{html.escape(block[1]).replace(chr(10), '<br>')}</p>")
+        elif kind == 'bullets':
+            items = ''.join(f"<li>{html.escape(str(item))}</li>" for item in block[1])
+            parts.append(f"<ul>{items}</ul>")
+        elif kind == 'table':
+            table = block[1]
+            parts.append(table.head(MAX_TABLE_ROWS).to_html(float_format=_format_float, border=0))
+            if len(table) > MAX_TABLE_ROWS:
+                parts.append(f"<p>（先頭{MAX_TABLE_ROWS:,}行のみ表示、全{len(table):,}行）</p>")
+        elif kind == 'json':
+            text = json.dumps(block[1], indent=2, ensure_ascii=False, default=_json_default)
+            parts.append(f"<pre>{html.escape(text)}</pre>")
+        elif kind == 'code':
+            parts.append(f"<pre>{html.escape(block[1])}</pre>")
+        elif kind == 'figure':
+            image = registry.image(block[1])
+            if image is not None:
+                encoded = base64.b64encode(image).decode('ascii')
+                parts.append(f'<img src="data:image/png;base64,{encoded}" alt="{html.escape(block[1])}">')
+            elif registry.points(block[1]) > REPORT_FIGURE_MAX_POINTS:
+                parts.append(f"<p>（{html.escape(block[1])}: 点数が多いため、この図は省略しました。"
+                             "kaleido をインストールすると PNG として含めます）</p>")
+            else:
+                parts.append(pio.to_html(registry.figure(block[1]), include_plotlyjs=False, full_html=False))
+    return '\n'.join(parts) + '\n'
+
+
+def data_info_blocks(df, profile):
+    """
+    データ基本情報のセクション
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    profile : pd.DataFrame
+        eda_utils.column_profile の結果（キャッシュ済みのもの）
+
+    Returns:
+    --------
+    list : レポートのブロック
+    """
+    return [
+        ('heading', 2, 'データ基本情報'),
+        ('bullets', [
+            f"データサイズ: {len(df):,}行 × {len(df.columns)}列",
+            f"メモリ使用量: {df.memory_usage().sum() / 1024**2:.2f} MB",
+        ]),
+        ('heading', 3, '列情報'),
+        ('table', profile[['列名', 'データ型', '非null数', 'ユニーク値数']]),
+    ]
+
+
+def statistics_blocks(describe):
+    """
+    基本統計量のセクション
+
+    Parameters:
+    -----------
+    describe : pd.DataFrame
+        DataFrame.describe の結果（キャッシュ済みのもの）
+
+    Returns:
+    --------
+    list : レポートのブロック
+    """
+    return [('heading', 2, '基本統計量'), ('table', describe)]
+
+
+def analysis_blocks(name, value):
+    """
+    分析結果1件分のセクション
+
+    DataFrame は表に、グラフなど JSON にできない値は概要の文字列にする。
+
+    Parameters:
+    -----------
+    name : str
+        分析結果の名前
+    value : object
+        分析結果（DataFrame、dict など）
+
+    Returns:
+    --------
+    list : レポートのブロック
+    """
+    blocks = [('heading', 3, name)]
+    if isinstance(value, pd.DataFrame):
+        return blocks + [('table', value)]
+    if not isinstance(value, dict):
+        return blocks + [('text', str(value))]
+
+    plain = {}
+    for key, item in value.items():
+        if isinstance(item, pd.DataFrame):
+            blocks += [('heading', 4, key), ('table', item)]
+        elif hasattr(item, 'number_of_nodes') and hasattr(item, 'number_of_edges'):
+            plain[key] = {'ノード数': item.number_of_nodes(), 'エッジ数': item.number_of_edges()}
+        else:
+            plain[key] = item
+    if plain:
+        blocks.append(('json', plain))
+    return blocks
+
+
+def figure_blocks(name):
+    """図1件分のセクション"""
+    return [('heading', 3, name), ('figure', name)]
+
+
+def write_report(sections, title, fmt='html', registry=None, path=None, max_workers=4):
+    """
+    セクションを並列に生成し、完成した順序どおりにファイルへ書き出す
+
+    各セクションはブロックのリストを返す関数で、表や図の変換を含めてスレッドで
+    並列に実行する。先頭から順に、生成が終わったセクションをすぐに書き込むため、
+    レポート全体の文字列をメモリ上で連結しない。
+
+    Parameters:
+    -----------
+    sections : list of callable
+        レポートのブロックのリストを返す関数
+    title : str
+        レポートのタイトル
+    fmt : str
+        'html' または 'markdown'
+    registry : FigureRegistry or None
+        図のブロックが参照する図
+    path : str or Path or None
+        出力先（None の場合は REPORT_DIR に日時付きのファイル名で作る）
+    max_workers : int
+        並列実行のスレッド数
+
+    Returns:
+    --------
+    dict : path（出力先）, seconds（所要時間）, sections（セクション数）
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"未対応の形式です: {fmt}")
+    start = time.perf_counter()
+    registry = registry if registry is not None else FigureRegistry()
+    created = pd.Timestamp.now()
+    if path is None:
+        REPORT_DIR.mkdir(parents=True, exist_ok=True)
+        suffix = 'html' if fmt == 'html' else 'md'
+        path = REPORT_DIR / f"report_{created.strftime('%Y%m%d_%H%M%S')}.{suffix}"
+    path = Path(path)
+
+    render = _render_html if fmt == 'html' else _render_markdown
+    with open(path, 'w', encoding='utf-8') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if fmt == 'html':
+            f.write(f"<!DOCTYPE html>\n<html lang=\"ja\">\n<head>\n<meta charset=\"utf-8\">\n"
+                    f"<title>{html.escape(title)}</title>\n{_PLOTLY_JS}\n{_HTML_STYLE}\n</head>\n<body>\n")
+            f.write(f"<h1>{html.escape(title)}</h1>\n<p>作成日: {created.strftime('%Y年%m月%d日 %H:%M')}</p>\n")
+        else:
+            f.write(f"# {title}\n\n作成日: {created.strftime('%Y年%m月%d日 %H:%M')}\n\n")
+
+        # executor.map は投入順に結果を返すので、前のセクションが終わり次第書き込める
+        for rendered in executor.map(lambda section: render(section(), registry), sections):
+            f.write(rendered)
+            f.flush()
+
+        if fmt == 'html':
+            f.write("</body>\n</html>\n")
+
+    return {'path': path, 'seconds': time.perf_counter() - start, 'sections': len(sections)}
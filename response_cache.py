@@ -0,0 +1,288 @@
+"""
+応答キャッシュ
+Claude の応答と生成コードの実行結果を SQLite に保存し、同じ質問・同じデータに
+対しては API の呼び出しとコードの実行を省略する
+"""
+
+import hashlib
+import io
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import claude_client
+import code_profiler
+import sandbox_executor
+
+CACHE_PATH = Path("data/temp/cache/responses.sqlite")
+
+# 保存してから有効な期間（秒）
+DEFAULT_TTL = 7 * 24 * 3600
+# 保存する件数と合計サイズの上限（超えた分は最後に使った日時が古いものから削除する）
+MAX_ENTRIES = 1000
+MAX_BYTES = 256 * 1024**2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+class _BuiltinUnpickler(pickle.Unpickler):
+    """組み込み型（dict, list, tuple, bytes, str, 数値, None）以外を復元しない"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"{module}.{name} は復元できません")
+
+
+def _hash(*parts):
+    text = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def response_key(model, system, messages, fingerprint=None):
+    """
+    応答のキャッシュのキー
+
+    Parameters:
+    -----------
+    model : str
+        モデル名
+    system : str
+        システムプロンプト
+    messages : list
+        送信するメッセージ
+    fingerprint : str or None
+        データセットの指紋
+
+    Returns:
+    --------
+    str
+    """
+    return _hash('response', model, system, messages, fingerprint)
+
+
+def execution_key(code, fingerprint=None, names=('result',), profile=False):
+    """生成コードの実行結果のキャッシュのキー（プロファイルを取ったかどうかと、その形式も区別する）"""
+    return _hash('execution', code.strip(), fingerprint, list(names),
+                 code_profiler.PROFILE_VERSION if profile else None)
+
+
+class ResponseCache:
+    """
+    Claude の応答と実行結果の SQLite キャッシュ
+
+    有効期限（ttl）を過ぎたものは読み出さずに削除し、件数・合計サイズが上限を
+    超えると最後に使った日時が古いものから削除する。接続は操作ごとに開くため、
+    複数のセッション・スレッドから同時に使える。
+
+    Parameters:
+    -----------
+    path : str or Path
+        SQLite ファイルのパス
+    ttl : float
+        有効期間（秒）
+    max_entries : int
+        保存する件数の上限
+    max_bytes : int
+        保存する合計サイズの上限（バイト）
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def _set(self, key, kind, data):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, data, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, data, len(data), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """期限切れと、件数・合計サイズの上限を超えた古いものを削除する"""
+        conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM entries WHERE key NOT IN "
+            "(SELECT key FROM entries ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total FROM entries) "
+            "WHERE total > ?)",
+            (self.max_bytes,)
+        )
+
+    def get_response(self, key):
+        """保存した応答のテキスト（なければ None）"""
+        data = self._get(key)
+        return None if data is None else data.decode()
+
+    def set_response(self, key, text):
+        self._set(key, 'response', text.encode())
+
+    def get_execution(self, key):
+        """
+        保存した実行結果
+
+        Returns:
+        --------
+        sandbox_executor.ExecutionResult or None
+        """
+        data = self._get(key)
+        if data is None:
+            return None
+        try:
+            reply = _BuiltinUnpickler(io.BytesIO(data)).load()
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        return sandbox_executor.ExecutionResult(reply)
+
+    def set_execution(self, key, execution):
+        """成功した実行結果を保存する（エラーの結果は保存しない）"""
+        if execution.ok:
+            self._set(key, 'execution', pickle.dumps(execution.reply, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        保存している件数とサイズ
+
+        Returns:
+        --------
+        dict : 応答数、実行結果数、サイズ(MB)、ヒット数、ミス数
+        """
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT kind, COUNT(*) FROM entries GROUP BY kind").fetchall())
+            size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return {
+            '応答数': counts.get('response', 0),
+            '実行結果数': counts.get('execution', 0),
+            'サイズ(MB)': size / 1024**2,
+            'ヒット数': self.hits,
+            'ミス数': self.misses,
+        }
+
+
+class _CachedMessages:
+    def __init__(self, client, cache, fingerprint):
+        self._client = client
+        self._cache = cache
+        self._fingerprint = fingerprint
+        # 直前の応答をキャッシュから返したか
+        self.last_cached = False
+
+    def _key(self, kwargs):
+        return response_key(kwargs.get('model'), kwargs.get('system'), kwargs.get('messages'),
+                            self._fingerprint)
+
+    def create(self, **kwargs):
+        key = self._key(kwargs)
+        text = self._cache.get_response(key)
+        self.last_cached = text is not None
+        if text is not None:
+            return claude_client.text_response(text, cached=True)
+        response = self._client.messages.create(**kwargs)
+        text = "".join(block.text for block in response.content if getattr(block, 'type', 'text') == 'text')
+        self._cache.set_response(key, text)
+        return claude_client.text_response(text)
+
+    def stream_text(self, **kwargs):
+        """
+        応答のテキストを届いた順に返す（キャッシュにあれば全体を一度に返す）
+
+        最後まで受け取った応答だけを保存する。
+        """
+        key = self._key(kwargs)
+        text = self._cache.get_response(key)
+        self.last_cached = text is not None
+        if text is not None:
+            yield text
+            return
+        chunks = []
+        for chunk in claude_client.stream_text(self._client, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._cache.set_response(key, "".join(chunks))
+
+
+class CachedClient:
+    """
+    応答をキャッシュする Claude クライアント
+
+    client.messages.create(...) と同じ引数で呼び出せ、戻り値の cached 属性で
+    キャッシュから返したかどうかを判定できる。messages.stream_text(...) は応答を
+    届いた順に返し、直前の応答をキャッシュから返したかは messages.last_cached で判定する。
+
+    Parameters:
+    -----------
+    client : anthropic.Anthropic or StubClient
+        実際に問い合わせるクライアント
+    cache : ResponseCache
+    fingerprint : str or None
+        データセットの指紋（キャッシュのキーに含める）
+    """
+
+    def __init__(self, client, cache, fingerprint=None):
+        self.messages = _CachedMessages(client, cache, fingerprint)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """
+    プロセス全体で共有するキャッシュを返す
+
+    Returns:
+    --------
+    ResponseCache
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache()
+        return _CACHE
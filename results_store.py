@@ -0,0 +1,244 @@
+"""
+分析結果ストア
+セッションの分析結果をメモリ予算内で保持し、古いものから DataFrame を
+Parquet としてディスクに退避する
+"""
+
+import pickle
+import shutil
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Parquet への書き出し（オプション）
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+RESULTS_DIR = Path("data/temp/results")
+
+# メモリ上に保持する分析結果の合計サイズ（バイト）
+DEFAULT_MEMORY_BUDGET = 256 * 1024**2
+# これより小さい値は退避せず、常にメモリ上に置く
+SPILL_MIN_BYTES = 1024**2
+
+
+def estimate_size(value):
+    """
+    分析結果のおおよそのメモリ使用量を返す
+
+    Parameters:
+    -----------
+    value : object
+        DataFrame、またはそれを含む dict
+
+    Returns:
+    --------
+    int : バイト数
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return 0
+
+
+class _Spilled:
+    """ディスクに退避した値の参照"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+
+    def load(self):
+        if self.fmt == 'parquet':
+            return pd.read_parquet(self.path)
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+
+class ResultsStore(MutableMapping):
+    """
+    メモリ予算付きの分析結果の辞書
+
+    値を設定・参照するたびに最近使った順を更新し、メモリ上の合計サイズが
+    memory_budget を超えると、最も長く使われていない結果から DataFrame を
+    ディスクに書き出してメモリから外す。退避した結果は次に参照された
+    ときに読み込み直す。keys() や len() は退避した結果を読み込まない。
+
+    Parameters:
+    -----------
+    directory : str or Path
+        退避先の親ディレクトリ（ストアごとにサブディレクトリを作る）
+    memory_budget : int
+        メモリ上に保持する分析結果の合計サイズ（バイト）
+    spill_min_bytes : int
+        これより小さい DataFrame は退避しない
+    """
+
+    def __init__(self, directory=RESULTS_DIR, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 spill_min_bytes=SPILL_MIN_BYTES):
+        self.directory = Path(directory) / uuid.uuid4().hex
+        self.memory_budget = memory_budget
+        self.spill_min_bytes = spill_min_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._counter = 0
+        # セッションが終わってストアが破棄されたら退避ファイルを削除する
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._entries[key]
+            if entry['files']:
+                entry['value'] = self._restore(entry['value'])
+                entry['memory'] = entry['size']
+                self._remove_files(entry)
+            self._entries.move_to_end(key)
+            value = entry['value']
+            self._enforce_budget(keep=key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._remove_files(self._entries.pop(key))
+            size = estimate_size(value)
+            self._entries[key] = {'value': value, 'size': size, 'memory': size, 'files': []}
+            self._enforce_budget(keep=key)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove_files(self._entries.pop(key))
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._remove_files(entry)
+            self._entries.clear()
+
+    @property
+    def memory_bytes(self):
+        """メモリ上に保持している分析結果の合計サイズ"""
+        with self._lock:
+            return sum(entry['memory'] for entry in self._entries.values())
+
+    def spill(self, key):
+        """
+        指定した結果の DataFrame をディスクに退避する
+
+        Parameters:
+        -----------
+        key : str
+            分析結果の名前
+
+        Returns:
+        --------
+        bool : 1つ以上の値を退避した場合 True
+        """
+        with self._lock:
+            entry = self._entries[key]
+            if entry['files']:
+                return True
+            files = []
+            value = self._spill_value(entry['value'], files)
+            if not files:
+                return False
+            entry.update(value=value, memory=estimate_size(value), files=files)
+            return True
+
+    def _enforce_budget(self, keep=None):
+        """予算を超えている間、最も古い結果から退避する"""
+        total = self.memory_bytes
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if key == keep or entry['files']:
+                continue
+            before = entry['memory']
+            if self.spill(key):
+                total -= before - entry['memory']
+
+    def _spill_value(self, value, files):
+        """DataFrame を退避先の参照に置き換えた値を返す"""
+        if isinstance(value, dict):
+            return {name: self._spill_value(item, files) for name, item in value.items()}
+        if not isinstance(value, pd.DataFrame):
+            return value
+        if estimate_size(value) < self.spill_min_bytes:
+            return value
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._counter += 1
+        stem = self.directory / f"{self._counter:06d}"
+        spilled = None
+        if PYARROW_AVAILABLE:
+            path = stem.with_suffix('.parquet')
+            try:
+                value.to_parquet(path)
+                spilled = _Spilled(path, 'parquet')
+            except (pa.ArrowException, TypeError, ValueError):
+                # 列名が文字列でない、型が混在するなど Parquet にできない場合は pickle にする
+                path.unlink(missing_ok=True)
+        if spilled is None:
+            path = stem.with_suffix('.pkl')
+            with open(path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            spilled = _Spilled(path, 'pickle')
+        files.append(spilled.path)
+        return spilled
+
+    def _restore(self, value):
+        if isinstance(value, dict):
+            return {name: self._restore(item) for name, item in value.items()}
+        if isinstance(value, _Spilled):
+            return value.load()
+        return value
+
+    @staticmethod
+    def _remove_files(entry):
+        for path in entry['files']:
+            Path(path).unlink(missing_ok=True)
+        entry['files'] = []
+
+    def stats(self):
+        """
+        保持している分析結果の一覧
+
+        Returns:
+        --------
+        pd.DataFrame : 名前、保存場所、推定サイズ(MB)
+        """
+        with self._lock:
+            rows = [
+                {
+                    '名前': key,
+                    '保存場所': 'ディスク' if entry['files'] else 'メモリ',
+                    'サイズ(MB)': entry['size'] / 1024**2,
+                }
+                for key, entry in self._entries.items()
+            ]
+        return pd.DataFrame(rows, columns=['名前', '保存場所', 'サイズ(MB)'])
@@ -0,0 +1,512 @@
+"""
+サンドボックス実行
+Claude が生成したコードを常駐するワーカープロセスで実行する。ワーカーごとに
+CPU 時間とメモリの上限を設け、DataFrame は Arrow ファイルのメモリマップで共有する
+"""
+
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+import traceback
+import types
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import code_profiler
+from sql_engine import frame_fingerprint
+
+# CPU 時間・メモリの上限（Windows では使えない）
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+SANDBOX_DIR = Path("data/temp/sandbox")
+
+DEFAULT_WORKERS = 2
+# 1回の実行の経過時間の上限（秒）。超えたワーカーは停止して起動し直す
+DEFAULT_TIMEOUT = 120
+# 1回の実行の CPU 時間の上限（秒）
+DEFAULT_CPU_SECONDS = 60
+# ワーカー1つあたりのメモリの上限（バイト）
+DEFAULT_MEMORY_LIMIT = 2 * 1024**3
+# 標準出力として返す最大文字数
+MAX_STDOUT_CHARS = 20_000
+# 共有用に書き出した Arrow ファイルを残しておく数
+KEEP_SHARED_FILES = 4
+# ワーカーがメモリマップで開いたままにしておくデータセット数
+WORKER_FRAMES = 2
+# 結果の DataFrame を送るときの圧縮方式
+ARROW_COMPRESSION = 'zstd' if pa.Codec.is_available('zstd') else None
+
+
+class CPUTimeExceeded(Exception):
+    """CPU 時間の上限を超えたときに送出される例外"""
+
+
+class SandboxError(Exception):
+    """ワーカーが応答しなくなった、または異常終了したときの例外"""
+
+
+# ---------------------------------------------------------------------------
+# ワーカープロセス側
+# ---------------------------------------------------------------------------
+
+def _raise_cpu_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU時間の上限を超えました")
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _set_cpu_limit(seconds):
+    """これまでの CPU 時間に seconds を足した値を soft limit にする（None で解除）"""
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = resource.RLIM_INFINITY if seconds is None else math.ceil(_cpu_time() + seconds)
+    if hard != resource.RLIM_INFINITY and soft != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _set_memory_limit(limit):
+    """
+    ワーカーのメモリの上限を設定する
+
+    Linux ではファイルのメモリマップを含まない RLIMIT_DATA を使い、共有データは
+    上限に数えない。それ以外の OS では RLIMIT_AS を使う。
+    """
+    kind = resource.RLIMIT_DATA if sys.platform.startswith('linux') else resource.RLIMIT_AS
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(kind, (limit, hard))
+
+
+def _encode_value(value):
+    """
+    実行結果を (形式, バイト列) にする
+
+    DataFrame は Arrow IPC ストリーム、図は PNG、配列は npy、それ以外は JSON にする。
+    JSON にできない値は repr の文字列で返す。
+    """
+    import matplotlib.figure
+
+    if isinstance(value, pd.Series):
+        return ('series', _encode_value(value.to_frame())[1])
+    if isinstance(value, pd.DataFrame):
+        try:
+            table = pa.Table.from_pandas(value)
+        except (pa.ArrowException, TypeError, ValueError):
+            return ('repr', value.to_string(max_rows=200).encode())
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return ('arrow', sink.getvalue().to_pybytes())
+    if isinstance(value, matplotlib.figure.Figure):
+        buffer = io.BytesIO()
+        value.savefig(buffer, format='png', bbox_inches='tight')
+        return ('png', buffer.getvalue())
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        buffer = io.BytesIO()
+        np.save(buffer, value, allow_pickle=False)
+        return ('npy', buffer.getvalue())
+    try:
+        return ('json', json.dumps(value, ensure_ascii=False, default=_json_default).encode())
+    except (TypeError, ValueError):
+        return ('repr', repr(value).encode())
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(type(value).__name__)
+
+
+class _FrameCache:
+    """ワーカーがメモリマップで開いた DataFrame（最近使ったものから WORKER_FRAMES 件）"""
+
+    def __init__(self):
+        self._frames = {}
+
+    def get(self, path):
+        if path not in self._frames:
+            while len(self._frames) >= WORKER_FRAMES:
+                self._frames.pop(next(iter(self._frames)))
+            table = feather.read_table(path, memory_map=True)
+            self._frames[path] = table.to_pandas(split_blocks=True)
+        frame = self._frames.pop(path)
+        self._frames[path] = frame
+        # Copy-on-Write により、書き換えた列だけが複製される
+        return frame.copy(deep=False)
+
+
+def _run_task(task, frames):
+    """ワーカーで1つのコードを実行し、結果の辞書を返す"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import networkx as nx
+
+    exec_globals = {'pd': pd, 'np': np, 'plt': plt, 'sns': sns, 'nx': nx}
+    if task.get('frame_path'):
+        exec_globals['df'] = frames.get(task['frame_path'])
+    elif task.get('frame') is not None:
+        exec_globals['df'] = pickle.loads(task['frame'])
+
+    stdout = io.StringIO()
+    reply = {'values': {}, 'figures': [], 'error': None, 'traceback': None}
+    start_wall = time.perf_counter()
+    start_cpu = _cpu_time() if RESOURCE_AVAILABLE else time.process_time()
+    # プロファイルを取る場合は、実行だけを計測する
+    profiler = code_profiler.Profiler(task['code']) if task.get('profile') else contextlib.nullcontext()
+    try:
+        if RESOURCE_AVAILABLE and task.get('cpu_seconds'):
+            _set_cpu_limit(task['cpu_seconds'])
+        with contextlib.redirect_stdout(stdout), profiler:
+            exec(compile(task['code'], code_profiler.CODE_FILENAME, 'exec'), exec_globals)
+        if RESOURCE_AVAILABLE:
+            _set_cpu_limit(None)
+
+        for name in task['names']:
+            if name in exec_globals:
+                reply['values'][name] = _encode_value(exec_globals[name])
+        for number in plt.get_fignums():
+            figure = plt.figure(number)
+            if not any(value is figure for value in exec_globals.values()):
+                reply['figures'].append(_encode_value(figure)[1])
+    except Exception as e:
+        if RESOURCE_AVAILABLE:
+            _set_cpu_limit(None)
+        reply['error'] = (f"メモリの上限を超えました: {e}" if isinstance(e, MemoryError)
+                          else f"{type(e).__name__}: {e}")
+        reply['traceback'] = traceback.format_exc(limit=-5)
+    finally:
+        plt.close('all')
+
+    if task.get('profile'):
+        reply['profile'] = profiler.result
+    reply['stdout'] = stdout.getvalue()[-MAX_STDOUT_CHARS:]
+    reply['elapsed'] = time.perf_counter() - start_wall
+    reply['cpu_time'] = (_cpu_time() if RESOURCE_AVAILABLE else time.process_time()) - start_cpu
+    return reply
+
+
+def _worker_main(conn, memory_limit):
+    """ワーカープロセスの本体（タスクを受け取り、結果を返す）"""
+    import signal
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn  # noqa: F401  起動時に読み込んでおく
+    import networkx  # noqa: F401
+
+    pd.set_option('mode.copy_on_write', True)
+    plt.rcParams['font.sans-serif'] = ['DejaVu Sans']
+    plt.rcParams['axes.unicode_minus'] = False
+    if RESOURCE_AVAILABLE:
+        signal.signal(signal.SIGXCPU, _raise_cpu_exceeded)
+        if memory_limit:
+            _set_memory_limit(memory_limit)
+
+    frames = _FrameCache()
+    conn.send('ready')
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        conn.send(_run_task(task, frames))
+
+
+# ---------------------------------------------------------------------------
+# 呼び出し側
+# ---------------------------------------------------------------------------
+
+def _decode_value(kind, data):
+    if kind in ('arrow', 'series'):
+        with pa.ipc.open_stream(data) as reader:
+            frame = reader.read_pandas()
+        return frame.iloc[:, 0] if kind == 'series' else frame
+    if kind == 'npy':
+        return np.load(io.BytesIO(data), allow_pickle=False)
+    if kind == 'json':
+        return json.loads(data)
+    if kind == 'png':
+        return data
+    return data.decode()
+
+
+class ExecutionResult:
+    """
+    サンドボックスでの実行結果
+
+    Attributes:
+    -----------
+    values : dict
+        取り出した変数（DataFrame、PNG 画像のバイト列、配列、JSON の値、または repr の文字列）
+    figures : list
+        実行後に開いていた図の PNG 画像（values に含まれる図は除く）
+    stdout : str
+        標準出力
+    error : str or None
+        エラーメッセージ（成功した場合は None）
+    elapsed, cpu_time : float
+        経過時間と CPU 時間（秒）
+    profile : dict or None
+        プロファイル（code_profiler.Profiler.result、取らなかった場合は None）
+    reply : dict
+        ワーカーから受け取った結果（組み込み型のみで、そのまま保存できる）
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        self._encoded = reply.get('values', {})
+        self.values = {name: _decode_value(kind, data) for name, (kind, data) in self._encoded.items()}
+        self.figures = reply.get('figures', [])
+        self.stdout = reply.get('stdout', '')
+        self.error = reply.get('error')
+        self.traceback = reply.get('traceback')
+        self.elapsed = reply.get('elapsed', 0.0)
+        self.cpu_time = reply.get('cpu_time', 0.0)
+        self.profile = reply.get('profile')
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def kind(self, name):
+        """変数の受け渡し形式（'arrow', 'series', 'png', 'npy', 'json', 'repr'）"""
+        return self._encoded[name][0] if name in self._encoded else None
+
+    @property
+    def payload_bytes(self):
+        """ワーカーから受け取った結果のバイト数"""
+        return sum(len(data) for _, data in self._encoded.values()) + sum(map(len, self.figures))
+
+
+_START_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    ワーカーの起動中だけ __main__ を空のモジュールにする
+
+    spawn と forkserver は子プロセスで __main__ のファイルを読み込み直すが、
+    Streamlit ではそれがアプリのスクリプト自体なので、ワーカーでアプリが実行されてしまう。
+    """
+    with _START_LOCK:
+        main = sys.modules.get('__main__')
+        blank = types.ModuleType('__main__')
+        sys.modules['__main__'] = blank
+        try:
+            yield
+        finally:
+            # 起動中に Streamlit が __main__ を差し替えた場合はそちらを残す
+            if sys.modules.get('__main__') is blank:
+                sys.modules['__main__'] = main
+
+
+class _Worker:
+    def __init__(self, context, memory_limit):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, memory_limit), daemon=True)
+        with _without_main_module():
+            self.process.start()
+        child.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise SandboxError("ワーカーの起動がタイムアウトしました")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        with contextlib.suppress(OSError):
+            self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+
+
+class SandboxExecutor:
+    """
+    常駐ワーカープロセスのプールで生成コードを実行する
+
+    ワーカーは起動時に pandas・matplotlib などを読み込んで待機し、実行ごとに
+    CPU 時間の上限を設定する。経過時間が timeout を超えたワーカーは停止し、
+    新しいワーカーに入れ替える。DataFrame は Arrow ファイルとして書き出し、
+    ワーカーはそれをメモリマップで開くため、実行のたびにコピーを作らない。
+
+    Parameters:
+    -----------
+    workers : int
+        ワーカー数
+    memory_limit : int or None
+        ワーカー1つあたりのメモリの上限（バイト）
+    directory : str or Path
+        共有用の Arrow ファイルの書き出し先
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, memory_limit=DEFAULT_MEMORY_LIMIT, directory=SANDBOX_DIR):
+        methods = multiprocessing.get_all_start_methods()
+        # Streamlit のスレッドを含むプロセスを fork しないよう、forkserver か spawn で起動する
+        if 'forkserver' in methods:
+            self._context = multiprocessing.get_context('forkserver')
+            self._context.set_forkserver_preload(['pandas', 'numpy', 'pyarrow', 'matplotlib'])
+        else:
+            self._context = multiprocessing.get_context('spawn')
+        self.memory_limit = memory_limit
+        self.directory = Path(directory)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._shared = {}
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        return _Worker(self._context, self.memory_limit)
+
+    def share_frame(self, df, arrow_path=None):
+        """
+        DataFrame をワーカーと共有する Arrow ファイルのパスを返す
+
+        Parameters:
+        -----------
+        df : pd.DataFrame
+            共有するデータ
+        arrow_path : str, Path or None
+            同じ内容の Arrow ファイル（データセットストアの保存ファイルなど）
+
+        Returns:
+        --------
+        str or None : Arrow に変換できない場合は None
+        """
+        if arrow_path is not None and Path(arrow_path).exists():
+            return str(arrow_path)
+        key = frame_fingerprint(df)
+        with self._lock:
+            path = self._shared.get(key)
+            if path is not None and path.exists():
+                return str(path)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{key}.arrow"
+            temporary = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                feather.write_feather(df, temporary, compression='uncompressed')
+            except (pa.ArrowException, TypeError, ValueError):
+                temporary.unlink(missing_ok=True)
+                return None
+            os.replace(temporary, path)
+            self._shared[key] = path
+            # 古い共有ファイルを削除する
+            while len(self._shared) > KEEP_SHARED_FILES:
+                old = self._shared.pop(next(iter(self._shared)))
+                old.unlink(missing_ok=True)
+            return str(path)
+
+    def run(self, code, df=None, names=('result',), arrow_path=None,
+            timeout=DEFAULT_TIMEOUT, cpu_seconds=DEFAULT_CPU_SECONDS, profile=False):
+        """
+        コードをワーカーで実行する
+
+        Parameters:
+        -----------
+        code : str
+            実行する Python コード
+        df : pd.DataFrame or None
+            コードから df として参照できるデータ
+        names : tuple
+            実行後に取り出す変数名
+        arrow_path : str, Path or None
+            df と同じ内容の Arrow ファイル（あれば書き出しを省略する）
+        timeout : float
+            経過時間の上限（秒）
+        cpu_seconds : float or None
+            CPU 時間の上限（秒）
+        profile : bool
+            経過時間・メモリのピーク・時間のかかった行と関数を計測する
+
+        Returns:
+        --------
+        ExecutionResult
+        """
+        if self._closed:
+            raise SandboxError("実行環境は終了しています")
+        task = {'code': code, 'names': list(names), 'cpu_seconds': cpu_seconds, 'profile': profile}
+        if df is not None:
+            task['frame_path'] = self.share_frame(df, arrow_path)
+            if task['frame_path'] is None:
+                # Arrow に変換できないデータはプロセス間で受け渡す
+                task['frame'] = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+        worker = self._idle.get()
+        try:
+            worker.wait_ready(timeout)
+            worker.conn.send(task)
+            if not worker.conn.poll(timeout):
+                raise SandboxError(f"実行時間が{timeout}秒を超えたため停止しました")
+            reply = worker.conn.recv()
+        except (SandboxError, EOFError, OSError) as e:
+            worker.kill()
+            worker = self._start_worker()
+            message = str(e) if isinstance(e, SandboxError) else "実行中にワーカーが終了しました（CPU時間またはメモリの上限）"
+            return ExecutionResult({'error': message})
+        finally:
+            self._idle.put(worker)
+        return ExecutionResult(reply)
+
+    def shutdown(self):
+        """すべてのワーカーを停止する"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with contextlib.suppress(OSError, ValueError):
+                worker.conn.send(None)
+            worker.process.join(timeout=1)
+            worker.kill()
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor():
+    """
+    プロセス全体で共有する実行環境を返す
+
+    Returns:
+    --------
+    SandboxExecutor
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = SandboxExecutor()
+        return _EXECUTOR
@@ -0,0 +1,300 @@
+"""
+SQL エンジン
+読み込んだ DataFrame と data/ 以下の Parquet ファイルに DuckDB で SQL を実行し、
+結果をページ単位で取り出す
+"""
+
+import hashlib
+import re
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from cache_utils import LRUCache
+from eda_utils import hashable_frame
+
+# DuckDB（オプション）
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+# テーブルとして参照できる Parquet ファイルの置き場所（一時ファイルは除く）
+CATALOG_DIR = Path("data")
+CATALOG_EXCLUDE = {'temp'}
+
+PAGE_SIZES = [50, 100, 500, 1000]
+DEFAULT_PAGE_SIZE = 100
+# DuckDB から一度に受け取る行数
+BATCH_ROWS = 10_000
+# キャッシュするクエリ結果の数
+MAX_CACHED_QUERIES = 16
+# これを超える行数の DataFrame は、指紋の計算に等間隔で抽出した行を使う
+FINGERPRINT_MAX_ROWS = 1_000_000
+
+
+def _identifier(text):
+    """英数字・アンダースコア以外を _ に置き換えてテーブル名にする"""
+    return re.sub(r'\W', '_', text)
+
+
+def catalog_tables(directory=CATALOG_DIR):
+    """
+    SQL から参照できる Parquet ファイルの一覧
+
+    テーブル名はファイル名から作り、同じ名前がある場合は親ディレクトリ名を前に付ける。
+
+    Parameters:
+    -----------
+    directory : str or Path
+        探すディレクトリ（サブディレクトリも含む）
+
+    Returns:
+    --------
+    dict : テーブル名とファイルのパス
+    """
+    tables = {}
+    directory = Path(directory)
+    if not directory.exists():
+        return tables
+    for path in sorted(directory.rglob("*.parquet")):
+        if CATALOG_EXCLUDE & set(path.relative_to(directory).parts[:-1]):
+            continue
+        name = _identifier(path.stem)
+        if name in tables or name == 'data':
+            name = f"{_identifier(path.parent.name)}_{name}"
+        if name[0].isdigit():
+            name = f"t_{name}"
+        tables[name] = path
+    return tables
+
+
+def frame_fingerprint(df):
+    """
+    DataFrame の内容から指紋を計算する
+
+    行数が FINGERPRINT_MAX_ROWS を超える場合は等間隔に抽出した行だけをハッシュする
+    （Streamlit のキャッシュと同じ考え方で、行数・列・型は常に含める）。
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+
+    Returns:
+    --------
+    str : SHA-1 の16進文字列
+    """
+    hasher = hashlib.sha1()
+    hasher.update(repr((df.shape, list(map(str, df.columns)), list(map(str, df.dtypes)))).encode())
+    rows = df
+    if len(df) > FINGERPRINT_MAX_ROWS:
+        rows = df.iloc[::len(df) // FINGERPRINT_MAX_ROWS + 1]
+    try:
+        hashes = pd.util.hash_pandas_object(rows, index=False)
+    except TypeError:
+        # リストや辞書を含む列は文字列にしてハッシュする
+        hashes = pd.util.hash_pandas_object(hashable_frame(rows), index=False)
+    hasher.update(hashes.to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def file_fingerprint(path):
+    """ファイルのパス・サイズ・更新日時から指紋を作る"""
+    stat = Path(path).stat()
+    return f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def normalize_query(sql):
+    """空白と末尾のセミコロンを正規化したクエリ文字列"""
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').strip()
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+class QueryResult:
+    """
+    実行中のクエリの結果
+
+    結果は DuckDB から BATCH_ROWS 行ずつ受け取り、要求されたページまでしか
+    取り出さない。すべて取り出し終わると接続を閉じ、総行数が確定する。
+
+    Parameters:
+    -----------
+    cursor : duckdb.DuckDBPyConnection
+        このクエリ専用の接続
+    sql : str
+        実行する SELECT 文
+    """
+
+    def __init__(self, cursor, sql):
+        self.sql = sql
+        self._cursor = cursor
+        self._batches = []
+        self._lock = threading.Lock()
+        self.rows_fetched = 0
+        self.exhausted = False
+
+        start = time.perf_counter()
+        cursor.execute(sql)
+        self._reader = (cursor.to_arrow_reader(BATCH_ROWS) if hasattr(cursor, 'to_arrow_reader')
+                        else cursor.fetch_record_batch(BATCH_ROWS))
+        self.schema = self._reader.schema
+        self.timings = {'実行': time.perf_counter() - start, '取得': 0.0}
+
+    @property
+    def columns(self):
+        return self.schema.names
+
+    @property
+    def total_rows(self):
+        """総行数（すべて取り出すまでは None）"""
+        return self.rows_fetched if self.exhausted else None
+
+    def _fetch_until(self, rows):
+        start = time.perf_counter()
+        while not self.exhausted and self.rows_fetched < rows:
+            try:
+                batch = self._reader.read_next_batch()
+            except StopIteration:
+                self.close()
+                break
+            self._batches.append(batch)
+            self.rows_fetched += batch.num_rows
+        self.timings['取得'] += time.perf_counter() - start
+
+    def page(self, number, page_size=DEFAULT_PAGE_SIZE):
+        """
+        ページ単位で結果を取り出す
+
+        Parameters:
+        -----------
+        number : int
+            0から始まるページ番号
+        page_size : int
+            1ページの行数
+
+        Returns:
+        --------
+        pd.DataFrame : 範囲外のページは空の DataFrame
+        """
+        offset = number * page_size
+        with self._lock:
+            # 次のページがあるかを判定できるよう1行多く取り出す
+            self._fetch_until(offset + page_size + 1)
+            table = pa.Table.from_batches(self._batches, schema=self.schema)
+        page = table.slice(offset, page_size).to_pandas()
+        page.index = pd.RangeIndex(offset, offset + len(page))
+        return page
+
+    def has_page(self, number, page_size=DEFAULT_PAGE_SIZE):
+        """指定したページに1行以上あるか（page で取り出した範囲で判定する）"""
+        return number * page_size < self.rows_fetched
+
+    def close(self):
+        """残りの結果を破棄して接続を閉じる"""
+        if not self.exhausted:
+            self.exhausted = True
+            self._reader = None
+            self._cursor.close()
+
+
+class SQLEngine:
+    """
+    DataFrame と Parquet ファイルに対する SELECT 文の実行と結果のキャッシュ
+
+    結果は正規化したクエリ文字列と、入力（DataFrame の内容・ファイルの更新日時）の
+    指紋をキーに保持する。同じクエリを再実行したときは、取り出し済みのページを
+    そのまま使う。
+
+    Parameters:
+    -----------
+    cache_size : int
+        キャッシュするクエリ結果の数
+    """
+
+    def __init__(self, cache_size=MAX_CACHED_QUERIES):
+        if not DUCKDB_AVAILABLE:
+            raise ImportError("duckdb がインストールされていません。'pip install duckdb' を実行してください。")
+        self._connection = duckdb.connect()
+        self._restrict_file_access()
+        # キャッシュから外れた結果は、クエリ専用の接続を閉じる
+        self._cache = LRUCache(maxsize=cache_size, on_evict=QueryResult.close)
+
+    def _restrict_file_access(self):
+        """
+        SQL から読めるファイルを CATALOG_DIR 以下に限る
+
+        read_csv('/etc/...') や read_text('.env') などでサーバー上の任意のファイル
+        （API キーを含む .env など）を読まれないよう、外部アクセスを無効にした上で
+        設定を固定する。DataFrame の登録は外部アクセスに当たらない。
+        """
+        directory = CATALOG_DIR.resolve().as_posix().rstrip('/') + '/'
+        self._connection.execute(f"SET allowed_directories = [{_literal(directory)}]")
+        self._connection.execute("SET enable_external_access = false")
+        self._connection.execute("SET lock_configuration = true")
+
+    def query_key(self, sql, frames, tables):
+        """クエリ文字列と入力の指紋から作るキャッシュのキー"""
+        hasher = hashlib.sha1(normalize_query(sql).encode())
+        for name in sorted(frames):
+            hasher.update(f"{name}={frame_fingerprint(frames[name])}".encode())
+        for name in sorted(tables):
+            hasher.update(f"{name}={file_fingerprint(tables[name])}".encode())
+        return hasher.hexdigest()
+
+    def run(self, sql, frames=None, tables=None):
+        """
+        SELECT 文を実行する
+
+        Parameters:
+        -----------
+        sql : str
+            SELECT 文（1文のみ）
+        frames : dict or None
+            テーブル名と DataFrame
+        tables : dict or None
+            テーブル名と Parquet ファイルのパス
+
+        Returns:
+        --------
+        tuple : (QueryResult, bool) 2つ目はキャッシュを使った場合 True
+        """
+        frames = frames or {}
+        tables = tables or {}
+        statements = duckdb.extract_statements(sql)
+        if len(statements) != 1:
+            raise ValueError("SQL は1文だけ入力してください")
+        if statements[0].type != duckdb.StatementType.SELECT:
+            raise ValueError("実行できるのは SELECT 文のみです")
+
+        key = self.query_key(sql, frames, tables)
+        result = self._cache.get(key)
+        if result is not None:
+            return result, True
+
+        cursor = self._connection.cursor()
+        try:
+            for name, frame in frames.items():
+                cursor.register(name, frame)
+            for name, path in tables.items():
+                cursor.execute(f"CREATE TEMP VIEW {_quote(name)} AS SELECT * FROM read_parquet({_literal(path)})")
+            result = QueryResult(cursor, sql)
+        except Exception:
+            cursor.close()
+            raise
+        self._cache.set(key, result)
+        return result, False
+
+    def clear(self):
+        """キャッシュした結果を破棄する"""
+        self._cache.clear()
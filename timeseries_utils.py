@@ -0,0 +1,591 @@
+"""
+時系列ユーティリティ
+大規模な時系列の間引き（LTTB・最小値/最大値エンベロープ）、リサンプリング、分解、予測を行う関数群
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+# STL 分解（オプション）
+try:
+    from statsmodels.tsa.seasonal import STL
+    STATSMODELS_AVAILABLE = True
+except ImportError:
+    STATSMODELS_AVAILABLE = False
+
+# 1本のトレースに描画する点数の既定値（グラフの横幅のピクセル数程度）
+DEFAULT_MAX_POINTS = 2_000
+
+DOWNSAMPLE_METHODS = ['lttb', 'minmax']
+
+# リサンプリングの単位（表示名と pandas の頻度文字列）
+RESAMPLE_RULES = {
+    'なし': None,
+    '分': 'min',
+    '時間': 'h',
+    '日': 'D',
+    '週': 'W',
+    '月': 'MS',
+    '四半期': 'QS',
+}
+RESAMPLE_AGGREGATIONS = ['mean', 'sum', 'min', 'max', 'last']
+
+FORECAST_METHODS = ['ses', 'holt', 'ar']
+
+# 平滑化パラメータの探索範囲
+SMOOTHING_GRID = np.linspace(0.05, 0.95, 19)
+# 平滑化パラメータの探索に使う末尾の点数（探索後に全体へ1回だけ当てはめる）
+SMOOTHING_FIT_MAX_POINTS = 20_000
+
+
+def _naive_datetimes(x):
+    """タイムゾーン付きの日時を、そのタイムゾーンでの時刻のまま tz なしにする（np.asarray で Timestamp の object 配列にしないため）"""
+    if isinstance(getattr(x, 'dtype', None), pd.DatetimeTZDtype):
+        return x.dt.tz_localize(None) if isinstance(x, pd.Series) else x.tz_localize(None)
+    return x
+
+
+def _as_float(x):
+    """日時を含む x 座標を計算用の float 配列に変換する"""
+    x = np.asarray(_naive_datetimes(x))
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets 法で残す点の位置を選ぶ
+
+    先頭と末尾の点を残し、残りを max_points - 2 個の区間に分けて、各区間から
+    前後の点と作る三角形の面積が最大の点を1つずつ選ぶ。
+
+    Parameters:
+    -----------
+    x : array-like
+        x 座標（昇順、数値または日時）
+    y : array-like
+        y 座標（欠損を含まないこと）
+    max_points : int
+        残す点数
+
+    Returns:
+    --------
+    np.ndarray : 残す点の位置（昇順）
+    """
+    num_points = len(y)
+    if max_points >= num_points or max_points < 3:
+        return np.arange(num_points)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, num_points - 1, max_points - 1).astype(np.int64)
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, num_points - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # 次の区間の平均点（最後の区間では末尾の点）を三角形の頂点に使う
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else num_points
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(y, max_points):
+    """
+    区間ごとの最小値と最大値の位置を残す（エンベロープ）
+
+    max_points / 2 個の区間に分け、各区間の最小値と最大値の点を残すため、
+    スパイクなどの極値が間引きで消えない。
+
+    Parameters:
+    -----------
+    y : array-like
+        y 座標（欠損は無視される）
+    max_points : int
+        残す点数の上限
+
+    Returns:
+    --------
+    np.ndarray : 残す点の位置（昇順）
+    """
+    num_points = len(y)
+    num_buckets = max(max_points // 2, 1)
+    if max_points >= num_points:
+        return np.arange(num_points)
+
+    y = np.asarray(y, dtype=np.float64)
+    bucket_size = -(-num_points // num_buckets)
+    num_buckets = -(-num_points // bucket_size)
+    padding = num_buckets * bucket_size - num_points
+
+    # 区間の長さを揃えて2次元にし、区間ごとの argmin/argmax を一度に求める
+    low = np.r_[np.where(np.isnan(y), np.inf, y), np.full(padding, np.inf)].reshape(num_buckets, bucket_size)
+    high = np.r_[np.where(np.isnan(y), -np.inf, y), np.full(padding, -np.inf)].reshape(num_buckets, bucket_size)
+    offsets = np.arange(num_buckets) * bucket_size
+    selected = np.r_[offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)]
+    return np.unique(np.clip(selected, 0, num_points - 1))
+
+
+def downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    指定した手法で残す点の位置を選ぶ
+
+    Parameters:
+    -----------
+    x : array-like
+        x 座標（昇順）
+    y : array-like
+        y 座標
+    max_points : int
+        残す点数の上限
+    method : str
+        'lttb' または 'minmax'
+
+    Returns:
+    --------
+    np.ndarray : 残す点の位置（昇順）
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"未対応の間引き手法です: {method}")
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+
+    # LTTB は欠損を扱えないため、有効な点だけから選ぶ
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    return valid[lttb_indices(np.asarray(x)[valid], y[valid], max_points)]
+
+
+def downsample(x, y, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+    """
+    時系列を描画用に間引く
+
+    Parameters:
+    -----------
+    x : array-like or pd.Series
+        x 座標（昇順）
+    y : array-like or pd.Series
+        y 座標
+    max_points : int
+        残す点数の上限
+    method : str
+        'lttb' または 'minmax'
+
+    Returns:
+    --------
+    tuple : (x, y) 間引き後の配列
+    """
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    selected = downsample_indices(x, y, max_points, method)
+    return x[selected], y[selected]
+
+
+class DownsamplePyramid:
+    """
+    多段階の解像度で間引いた時系列
+
+    元の系列から最小値/最大値エンベロープで点数をおよそ半分ずつ減らした段を
+    事前に作っておき、表示範囲に応じて十分な点数を持つ最も粗い段から切り出す。
+    ズームしたときは細かい段が使われるため、必要な範囲だけ詳細を取り出せる。
+    """
+
+    def __init__(self, x, y, max_points=DEFAULT_MAX_POINTS, method='lttb'):
+        """
+        Parameters:
+        -----------
+        x : array-like or pd.Series
+            x 座標（昇順、数値または日時）
+        y : array-like or pd.Series
+            y 座標
+        max_points : int
+            最も粗い段の点数の目安
+        method : str
+            切り出した範囲をさらに間引く手法（'lttb' または 'minmax'）
+        """
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"未対応の間引き手法です: {method}")
+        self.x = np.asarray(_naive_datetimes(x))
+        self.y = np.asarray(y, dtype=np.float64)
+        self.max_points = max_points
+        self.method = method
+        self._x_float = _as_float(self.x)
+
+        # levels[0] は元の系列全体、以降は点数がおよそ半分になった段の位置
+        self.levels = [np.arange(len(self.y))]
+        while len(self.levels[-1]) > 2 * max_points:
+            current = self.levels[-1]
+            reduced = current[minmax_indices(self.y[current], len(current) // 2)]
+            if len(reduced) >= len(current):
+                break
+            self.levels.append(reduced)
+
+    def __len__(self):
+        return len(self.y)
+
+    def query(self, x_range=None, max_points=None):
+        """
+        表示範囲内の点を max_points 点以内で取り出す
+
+        Parameters:
+        -----------
+        x_range : tuple or None
+            表示範囲 (開始, 終了)。None の場合は全体
+        max_points : int or None
+            取り出す点数の上限（None の場合は構築時の値）
+
+        Returns:
+        --------
+        tuple : (x, y, level)
+            level は使用した段（0 が元の系列）
+        """
+        max_points = max_points or self.max_points
+        if x_range is None:
+            lower, upper = -np.inf, np.inf
+        elif np.issubdtype(self.x.dtype, np.datetime64):
+            lower, upper = _as_float(pd.to_datetime(list(x_range)))
+        else:
+            lower, upper = _as_float(x_range)
+
+        # 範囲内の点数が上限の数倍に収まる最も細かい段を選ぶ
+        for level, positions in enumerate(self.levels):
+            x_level = self._x_float[positions]
+            start = np.searchsorted(x_level, lower, side='left')
+            end = np.searchsorted(x_level, upper, side='right')
+            if end - start <= 4 * max_points or level == len(self.levels) - 1:
+                break
+
+        selected = positions[start:end]
+        selected = selected[downsample_indices(self.x[selected], self.y[selected], max_points, self.method)]
+        return self.x[selected], self.y[selected], level
+
+
+def prepare_series(df, date_col, value_col, rule=None, how='mean'):
+    """
+    DataFrame の2列から日時インデックスの系列を作る（元の DataFrame は変更しない）
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        対象のデータ
+    date_col : str
+        日付列
+    value_col : str
+        値の列
+    rule : str or None
+        リサンプリングの頻度（RESAMPLE_RULES の値）
+    how : str
+        リサンプリング時の集計方法
+
+    Returns:
+    --------
+    pd.Series : 日時の昇順に並んだ系列
+    """
+    dates = pd.to_datetime(df[date_col])
+    series = pd.Series(df[value_col].to_numpy(dtype=np.float64), index=pd.DatetimeIndex(dates), name=value_col)
+    series = series[series.index.notna()].sort_index(kind='stable')
+    if rule is not None:
+        series = series.resample(rule).agg(how)
+    return series
+
+
+def infer_period(index):
+    """
+    日時インデックスの間隔から季節周期を推定する
+
+    Parameters:
+    -----------
+    index : pd.DatetimeIndex
+        昇順の日時インデックス
+
+    Returns:
+    --------
+    int or None : 季節周期（推定できない場合は None）
+    """
+    if len(index) < 3:
+        return None
+    step = pd.Series(index[:10_000]).diff().median()
+    if pd.isna(step) or step <= pd.Timedelta(0):
+        return None
+    # 間隔ごとに、次に大きい単位1つ分の期間数を周期とする
+    for limit, period in [
+        (pd.Timedelta(minutes=1), 60),
+        (pd.Timedelta(hours=1), 24),
+        (pd.Timedelta(days=1), 7),
+        (pd.Timedelta(days=7), 52),
+        (pd.Timedelta(days=31), 12),
+        (pd.Timedelta(days=92), 4),
+    ]:
+        if step <= limit:
+            return period
+    return None
+
+
+def decompose(series, period, robust=False):
+    """
+    系列をトレンド・季節性・残差に分解する
+
+    statsmodels がある場合は STL 分解を使い、ない場合は中心化移動平均によるトレンドと
+    位相ごとの平均による季節性で古典的な分解を行う。欠損は線形補間してから分解する。
+
+    Parameters:
+    -----------
+    series : pd.Series
+        日時インデックスの系列
+    period : int
+        季節周期
+    robust : bool
+        外れ値に頑健な STL を使うか（statsmodels がある場合のみ）
+
+    Returns:
+    --------
+    pd.DataFrame : 観測値、トレンド、季節性、残差
+    """
+    if period is None or period < 2 or len(series) < 2 * period:
+        raise ValueError("分解には季節周期の2倍以上の長さの系列が必要です")
+
+    values = series.interpolate(limit_direction='both').to_numpy(dtype=np.float64)
+    if STATSMODELS_AVAILABLE:
+        result = STL(values, period=period, robust=robust).fit()
+        trend, seasonal, resid = result.trend, result.seasonal, result.resid
+    else:
+        # 周期が偶数の場合は 2×period の中心化移動平均にする
+        if period % 2 == 0:
+            weights = np.r_[0.5, np.ones(period - 1), 0.5] / period
+        else:
+            weights = np.ones(period) / period
+        half = len(weights) // 2
+        trend = np.full(len(values), np.nan)
+        trend[half:len(values) - half] = np.convolve(values, weights, mode='valid')
+
+        detrended = values - trend
+        phase = np.arange(len(values)) % period
+        valid = ~np.isnan(detrended)
+        phase_means = (np.bincount(phase[valid], weights=detrended[valid], minlength=period)
+                       / np.bincount(phase[valid], minlength=period))
+        seasonal = (phase_means - phase_means.mean())[phase]
+        resid = values - trend - seasonal
+
+    return pd.DataFrame({
+        '観測値': values,
+        'トレンド': trend,
+        '季節性': seasonal,
+        '残差': resid,
+    }, index=series.index)
+
+
+def _linear_recursion(A, B, initial, inputs):
+    """
+    状態の漸化式 s_t = A s_{t-1} + B y_t (t >= 1) を lfilter でまとめて計算する
+
+    解を初期状態による部分（斉次解）と入力による部分に分け、どちらも
+    scipy.signal.lfilter で計算するため、時点ごとの Python ループが不要になる。
+
+    Returns:
+    --------
+    np.ndarray : 各時点の状態（時点数×状態数）
+    """
+    num_points, order = len(inputs), len(initial)
+    states = np.empty((num_points, order))
+    numerators, denominator = signal.ss2tf(A, B.reshape(-1, 1), np.eye(order), np.zeros((order, 1)))
+    forcing = np.r_[0.0, inputs[1:], 0.0]
+
+    # A^t s_0 は特性多項式に従う斉次漸化式を満たす
+    powers = [initial]
+    for _ in range(order - 1):
+        powers.append(A @ powers[-1])
+    powers = np.array(powers)
+
+    for i in range(order):
+        states[:, i] = signal.lfilter(numerators[i], denominator, forcing)[1:]
+        if num_points <= order:
+            states[:, i] += powers[:num_points, i]
+            continue
+        zi = signal.lfiltic([1.0], denominator, powers[::-1, i])
+        homogeneous = signal.lfilter([1.0], denominator, np.zeros(num_points - order), zi=zi)[0]
+        states[:, i] += np.r_[powers[:, i], homogeneous]
+    return states
+
+
+def exponential_smoothing(y, alpha, beta=None):
+    """
+    単純指数平滑（beta=None）または Holt の線形トレンド法で水準とトレンドを計算する
+
+    Parameters:
+    -----------
+    y : array-like
+        欠損を含まない系列
+    alpha : float
+        水準の平滑化係数
+    beta : float or None
+        トレンドの平滑化係数
+
+    Returns:
+    --------
+    tuple : (level, trend) 各時点の水準とトレンド（単純指数平滑では trend は0）
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if beta is None:
+        states = _linear_recursion(np.array([[1 - alpha]]), np.array([alpha]), np.array([y[0]]), y)
+        return states[:, 0], np.zeros(len(y))
+
+    A = np.array([[1 - alpha, 1 - alpha],
+                  [-alpha * beta, 1 - alpha * beta]])
+    B = np.array([alpha, alpha * beta])
+    initial = np.array([y[0], y[1] - y[0] if len(y) > 1 else 0.0])
+    states = _linear_recursion(A, B, initial, y)
+    return states[:, 0], states[:, 1]
+
+
+def fit_exponential_smoothing(y, trend=False, grid=SMOOTHING_GRID, max_points=SMOOTHING_FIT_MAX_POINTS):
+    """
+    1期先予測の二乗誤差が最小になる平滑化係数を格子探索で選ぶ
+
+    探索は末尾の max_points 点だけで行い、選んだ係数で系列全体の水準と
+    トレンドを1回だけ計算する。
+
+    Parameters:
+    -----------
+    y : array-like
+        欠損を含まない系列
+    trend : bool
+        Holt の線形トレンド法にするか
+    grid : array-like
+        探索する係数の候補
+    max_points : int or None
+        探索に使う末尾の点数（None の場合は全体）
+
+    Returns:
+    --------
+    dict : alpha, beta, level, trend, fitted（1期先予測）, residuals
+    """
+    y = np.asarray(y, dtype=np.float64)
+    tail = y if max_points is None or len(y) <= max_points else y[-max_points:]
+    best = None
+    for alpha in grid:
+        for beta in (grid if trend else [None]):
+            level, slope = exponential_smoothing(tail, alpha, beta)
+            sse = np.sum((tail[1:] - (level + slope)[:-1]) ** 2)
+            if best is None or sse < best['sse']:
+                best = {'alpha': alpha, 'beta': beta, 'sse': sse}
+
+    level, slope = exponential_smoothing(y, best['alpha'], best['beta'])
+    fitted = np.r_[y[0], (level + slope)[:-1]]
+    best.update(level=level, trend=slope, fitted=fitted, residuals=y - fitted,
+                sse=np.sum((y[1:] - fitted[1:]) ** 2))
+    return best
+
+
+def fit_ar(y, order=3, diff=1):
+    """
+    差分系列に AR(order) モデルを最小二乗法で当てはめる（ARIMA(order, diff, 0) の簡易版）
+
+    Parameters:
+    -----------
+    y : array-like
+        欠損を含まない系列
+    order : int
+        自己回帰の次数
+    diff : int
+        差分の階数（0 または 1）
+
+    Returns:
+    --------
+    dict : coef（ラグ1から順の係数）, intercept, residuals, order, diff
+    """
+    y = np.asarray(y, dtype=np.float64)
+    z = np.diff(y, n=diff) if diff else y
+    if len(z) <= 2 * order + 1:
+        raise ValueError("系列が短すぎて AR モデルを推定できません")
+
+    # 各行が [z_{t-1}, ..., z_{t-order}] のラグ行列
+    lags = np.lib.stride_tricks.sliding_window_view(z[:-1], order)[:, ::-1]
+    design = np.column_stack([np.ones(len(lags)), lags])
+    target = z[order:]
+    params, *_ = np.linalg.lstsq(design, target, rcond=None)
+    return {
+        'coef': params[1:],
+        'intercept': params[0],
+        'residuals': target - design @ params,
+        'order': order,
+        'diff': diff,
+    }
+
+
+def forecast(series, method='holt', horizon=30, order=3, diff=1, z=1.96):
+    """
+    系列の将来値を予測する
+
+    Parameters:
+    -----------
+    series : pd.Series
+        日時インデックスの系列（欠損は線形補間する）
+    method : str
+        'ses'（単純指数平滑）, 'holt'（線形トレンド）, 'ar'（差分 AR）
+    horizon : int
+        予測する期間数
+    order : int
+        AR の次数（method='ar' のみ）
+    diff : int
+        AR の差分の階数（method='ar' のみ）
+    z : float
+        予測区間の幅（標準正規分布の分位点）
+
+    Returns:
+    --------
+    tuple : (pd.DataFrame, dict)
+        DataFrame は予測値と予測区間（下限・上限）、dict は推定したパラメータと RMSE
+    """
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"未対応の予測手法です: {method}")
+
+    values = series.interpolate(limit_direction='both').to_numpy(dtype=np.float64)
+    if len(values) < 3:
+        raise ValueError("予測には3点以上の系列が必要です")
+    steps = np.arange(1, horizon + 1)
+
+    if method in ('ses', 'holt'):
+        fit = fit_exponential_smoothing(values, trend=method == 'holt')
+        predicted = fit['level'][-1] + steps * fit['trend'][-1]
+        residuals = fit['residuals'][1:]
+        info = {'alpha': fit['alpha'], 'beta': fit['beta']}
+    else:
+        fit = fit_ar(values, order=order, diff=diff)
+        history = list((np.diff(values, n=diff) if diff else values)[-order:])
+        changes = []
+        for _ in steps:
+            value = fit['intercept'] + np.dot(fit['coef'], history[::-1])
+            changes.append(value)
+            history = history[1:] + [value]
+        predicted = values[-1] + np.cumsum(changes) if diff else np.array(changes)
+        residuals = fit['residuals']
+        info = {'coef': fit['coef'].round(4).tolist(), 'intercept': fit['intercept']}
+
+    # 予測区間は1期先誤差の標準偏差が期間の平方根に比例して広がると近似する
+    sigma = np.sqrt(np.mean(residuals ** 2))
+    width = z * sigma * np.sqrt(steps)
+    info['rmse'] = sigma
+
+    freq = series.index.freq or pd.infer_freq(series.index[-min(len(series), 1000):])
+    if freq is not None:
+        future = pd.date_range(series.index[-1], periods=horizon + 1, freq=freq)[1:]
+    else:
+        step = pd.Series(series.index).diff().median()
+        future = pd.DatetimeIndex([series.index[-1] + step * i for i in steps])
+
+    result = pd.DataFrame({
+        '予測値': predicted,
+        '下限': predicted - width,
+        '上限': predicted + width,
+    }, index=future)
+    return result, info